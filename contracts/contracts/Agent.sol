@@ -2,19 +2,25 @@
 pragma solidity ^0.8.9;
 
 import "./interfaces/IOracle.sol";
+import "./interfaces/IAssetPrices.sol";
 import "@openzeppelin/contracts/security/ReentrancyGuard.sol";
 
 contract Agent is ReentrancyGuard {
+    // Signed position and the cost basis of its side (long or short), packed into a single storage slot
+    struct Holding {
+        int128 position;
+        uint128 costBasis;
+    }
+
     address public oracleAddress;
     address public owner;
+    IAssetPrices public ensemble; // Prices are read from the ensemble instead of being copied into every agent
     uint256 public agentId;
+    uint256 public assetCount;
     int256 public totalPnl;
+    uint256 public openPositions; // Bitmap of asset indices that have a non-zero position
 
-    mapping(string => int256) public positions; // Maps asset to its position (e.g., "BTC" => 10)
-    mapping(string => uint256) public longCostBasis; // Maps asset to cost basis for long positions
-    mapping(string => uint256) public shortCostBasis; // Maps asset to cost basis for short positions
-    mapping(string => uint256) public prices; // Locally stored asset prices
-    string[] public assetKeys;
+    mapping(uint256 => Holding) public holdings; // Maps asset index (in the ensemble's asset list) to its holding
     string public strategyDetails;
     IOracle.Message public message;
 
@@ -23,12 +29,14 @@ contract Agent is ReentrancyGuard {
     event PnLUpdated(uint indexed agentId, int256 pnl);
     event OracleResponseCallback(uint indexed agentId, string response, string errorMessage);
 
-    constructor(address _oracleAddress, uint256 _agentId, string memory _strategyDetails, string[] memory _assetKeys) {
+    constructor(address _oracleAddress, uint256 _agentId, string memory _strategyDetails, uint256 _assetCount) {
+        require(_assetCount <= 256, "At most 256 assets are supported");
         oracleAddress = _oracleAddress;
         agentId = _agentId;
         strategyDetails = _strategyDetails;
         owner = msg.sender;
-        assetKeys = _assetKeys;
+        ensemble = IAssetPrices(msg.sender);
+        assetCount = _assetCount;
     }
 
     // ====================================================================================================
@@ -36,103 +44,109 @@ contract Agent is ReentrancyGuard {
     // ====================================================================================================
 
     /**
-     * @notice Store the asset prices in the agent contract (sent from the main contract).
-     * @param assets Array of asset tickers
-     * @param newPrices Array of corresponding prices
+     * @notice Mark the open positions to the given prices (sent from the main contract).
+     * @param prices Prices for every asset, indexed like the ensemble's asset list
      */
-    function storePrices(string[] memory assets, uint256[] memory newPrices) public onlyOwner {
-        require(assets.length == newPrices.length, "Mismatched arrays");
-
-        for (uint i = 0; i < assets.length; i++) {
-            string memory asset = assets[i];
-            uint256 newPrice = newPrices[i];
-            prices[asset] = newPrice; // Store prices locally
-
-            // Recalculate PnL for the asset based on the new price
-            int256 currentPosition = positions[asset];
-            if (currentPosition != 0) {
-                if (currentPosition > 0) { // Long position
-                    totalPnl += currentPosition * int256(newPrice - longCostBasis[asset]);
-                } else { // Short position
-                    totalPnl += currentPosition * int256(shortCostBasis[asset] - newPrice);
-                }
+    function markToMarket(uint256[] memory prices) public onlyOwner {
+        require(prices.length == assetCount, "Mismatched arrays");
+        int256 pnl = totalPnl;
+
+        // Only assets with an open position contribute, walk the bitmap instead of every asset
+        uint256 open = openPositions;
+        for (uint256 i = 0; open != 0; i++) {
+            if ((open & 1) == 1) {
+                pnl += holdingPnl(holdings[i], prices[i]);
             }
+            open >>= 1;
         }
 
-        // Emit updated PnL event after recalculating
-        emit PnLUpdated(agentId, totalPnl);
+        totalPnl = pnl;
+        emit PnLUpdated(agentId, pnl);
     }
 
-    // Set positions and handle PnL updates, prices are fetched locally
-    function setPositions(string[] memory assets, int256[] memory newPositions) internal {
-        require(assets.length == newPositions.length, "Mismatched arrays");
+    // PnL of a holding at a price: position * (price - basis) when long, position * (basis - price) when short
+    function holdingPnl(Holding memory holding, uint256 price) internal pure returns (int256) {
+        uint256 costBasis = holding.costBasis;
+        return holding.position > 0
+            ? int256(holding.position) * int256(price - costBasis)
+            : int256(holding.position) * int256(costBasis - price);
+    }
 
-        for (uint i = 0; i < assets.length; i++) {
-            string memory asset = assets[i];
+    // Set positions and handle PnL updates, prices are read from the ensemble
+    function setPositions(string[] memory assets, uint256[] memory indices, int256[] memory newPositions) internal {
+        require(indices.length == newPositions.length, "Mismatched arrays");
+
+        uint256[] memory prices = ensemble.getAssetPrices();
+        int256 pnl = totalPnl;
+        uint256 open = openPositions;
+
+        for (uint i = 0; i < indices.length; i++) {
+            uint256 index = indices[i];
             int256 newPosition = newPositions[i];
-            int256 currentPosition = positions[asset];
-            uint256 currentPrice = prices[asset]; // Fetch the price stored in the agent's prices mapping
+            require(newPosition >= type(int128).min && newPosition <= type(int128).max, "Position out of range");
+
+            Holding memory holding = holdings[index];
+            int256 currentPosition = holding.position;
+            uint256 currentPrice = prices[index];
+            uint256 costBasis = holding.costBasis;
 
-            // If the new position is zero (closing position), calculate PnL and reset positions
+            // If the new position is zero (closing position), realize PnL and reset the position
             if (newPosition == 0) {
-                if (currentPosition != 0) {
-                    // Realize PnL and reset position
-                    totalPnl += currentPosition > 0
-                        ? currentPosition * int256(currentPrice - longCostBasis[asset])
-                        : currentPosition * int256(shortCostBasis[asset] - currentPrice);
-
-                    positions[asset] = 0;
-                    longCostBasis[asset] = 0;
-                    shortCostBasis[asset] = 0;
+                if (currentPosition == 0) {
+                    continue;
                 }
+                pnl += holdingPnl(holding, currentPrice);
+                costBasis = 0;
             } else if ((currentPosition > 0 && newPosition < 0) || (currentPosition < 0 && newPosition > 0)) {
-                // If switching direction, realize the PnL of the existing position and set new direction
-                totalPnl += currentPosition > 0
-                    ? currentPosition * int256(currentPrice - longCostBasis[asset])
-                    : currentPosition * int256(shortCostBasis[asset] - currentPrice);
-
-                positions[asset] = newPosition;
-                if (newPosition > 0) {
-                    longCostBasis[asset] = currentPrice;
-                    shortCostBasis[asset] = 0;
-                } else {
-                    shortCostBasis[asset] = currentPrice;
-                    longCostBasis[asset] = 0;
-                }
+                // If switching direction, realize the PnL of the existing position and start the new side at the current price
+                pnl += holdingPnl(holding, currentPrice);
+                costBasis = currentPrice;
             } else {
                 // If the direction remains the same, update cost basis
-                if (newPosition > 0) {
-                    uint256 oldCost = longCostBasis[asset] * uint256(currentPosition);
-                    uint256 newCost = currentPrice * uint256(newPosition);
-                    longCostBasis[asset] = (oldCost + newCost) / uint256(newPosition);
-                } else {
-                    uint256 oldCost = shortCostBasis[asset] * uint256(-currentPosition);
-                    uint256 newCost = currentPrice * uint256(-newPosition);
-                    shortCostBasis[asset] = (oldCost + newCost) / uint256(-newPosition);
-                }
-                positions[asset] = newPosition;
+                uint256 oldCost = costBasis * uint256(abs(currentPosition));
+                uint256 newCost = currentPrice * uint256(abs(newPosition));
+                costBasis = (oldCost + newCost) / uint256(abs(newPosition));
+            }
+            require(costBasis <= type(uint128).max, "Cost basis out of range");
+
+            holdings[index] = Holding(int128(newPosition), uint128(costBasis));
+            if (newPosition == 0) {
+                open &= ~(uint256(1) << index);
+            } else {
+                open |= uint256(1) << index;
             }
         }
 
+        totalPnl = pnl;
+        openPositions = open;
+
         // Emit the PositionsUpdated event after positions are set
         emit PositionsUpdated(agentId, assets, newPositions);
-        emit PnLUpdated(agentId, totalPnl);
+        emit PnLUpdated(agentId, pnl);
     }
 
     function getPositions() public view returns (string[] memory assets, int256[] memory currentPositions) {
-        uint256 length = assetKeys.length;
-        assets = new string[](length);
-        currentPositions = new int256[](length);
-
-        for (uint256 i = 0; i < length; i++) {
-            string memory asset = assetKeys[i];
-            assets[i] = asset;
-            currentPositions[i] = positions[asset];
+        assets = ensemble.getAssetKeys();
+        currentPositions = getPositionsRaw();
+    }
+
+    /**
+     * @notice Positions for every asset, indexed like the ensemble's asset list.
+     */
+    function getPositionsRaw() public view returns (int256[] memory currentPositions) {
+        currentPositions = new int256[](assetCount);
+        uint256 open = openPositions;
+        for (uint256 i = 0; open != 0; i++) {
+            if ((open & 1) == 1) {
+                currentPositions[i] = holdings[i].position;
+            }
+            open >>= 1;
         }
     }
 
     function getPosition(string memory asset) public view returns (int256) {
-        return positions[asset];
+        (bool found, uint256 index) = ensemble.findAsset(asset);
+        return found ? int256(holdings[index].position) : int256(0);
     }
 
     function getPnl() public view returns (int256) {
@@ -205,7 +219,9 @@ contract Agent is ReentrancyGuard {
 
         string[] memory keyValuePairs = splitString(string(trimmedResponse), ",");
         string[] memory assets = new string[](keyValuePairs.length);
+        uint256[] memory indices = new uint256[](keyValuePairs.length);
         int256[] memory positionsArray = new int256[](keyValuePairs.length);
+        uint256 count = 0;
 
         for (uint i = 0; i < keyValuePairs.length; i++) {
             string[] memory pair = splitString(keyValuePairs[i], ":");
@@ -214,13 +230,34 @@ contract Agent is ReentrancyGuard {
             string memory asset = stripQuotes(trimWhitespace(pair[0]));
             string memory positionStr = stripQuotes(trimWhitespace(pair[1]));
 
+            // Assets that are not in the ensemble's asset list are ignored
+            (bool found, uint256 index) = ensemble.findAsset(asset);
+            if (!found) {
+                continue;
+            }
+
             int256 position = parseInt(positionStr);
-            assets[i] = asset;
-            positionsArray[i] = position;
+            assets[count] = asset;
+            indices[count] = index;
+            positionsArray[count] = position;
+            count++;
+        }
+
+        // Drop the slots left empty by unrecognised assets
+        if (count < keyValuePairs.length) {
+            string[] memory knownAssets = new string[](count);
+            uint256[] memory knownIndices = new uint256[](count);
+            int256[] memory knownPositions = new int256[](count);
+            for (uint i = 0; i < count; i++) {
+                knownAssets[i] = assets[i];
+                knownIndices[i] = indices[i];
+                knownPositions[i] = positionsArray[i];
+            }
+            (assets, indices, positionsArray) = (knownAssets, knownIndices, knownPositions);
         }
 
         // Update the agent's positions and emit events
-        setPositions(assets, positionsArray);
+        setPositions(assets, indices, positionsArray);
     }
 
     function createTextMessage(string memory role, string memory content) private pure returns (IOracle.Message memory) {
@@ -356,6 +393,10 @@ contract Agent is ReentrancyGuard {
         return isNegative ? -result : result;
     }
 
+    function abs(int256 x) internal pure returns (int256) {
+        return x >= 0 ? x : -x;
+    }
+
     function trimWhitespace(string memory str) internal pure returns (string memory) {
         bytes memory strBytes = bytes(str);
         uint start = 0;
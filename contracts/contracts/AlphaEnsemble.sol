@@ -1,25 +1,32 @@
 // SPDX-License-Identifier: UNLICENSED
-pragma solidity ^0.8.9;
+pragma solidity ^0.8.13;
 
 import "./Agent.sol"; // The Agent contract
+import "./interfaces/IAssetPrices.sol";
 import "@chainlink/contracts/src/v0.8/interfaces/KeeperCompatibleInterface.sol";
 import "@chainlink/contracts/src/v0.8/interfaces/AggregatorV3Interface.sol";
 import "@openzeppelin/contracts/security/ReentrancyGuard.sol";
 
-contract AlphaEnsemble is KeeperCompatibleInterface, ReentrancyGuard {
+contract AlphaEnsemble is IAssetPrices, KeeperCompatibleInterface, ReentrancyGuard {
     address public oracleAddress;
     address public owner;
-    uint8 public nextAgentId = 0;
+    uint256 public nextAgentId = 0;
 
     // Array to store agent contract addresses
     address[] public agentContracts;
 
-    // Mapping from asset ticker (e.g., "BTC", "ETH") to the Chainlink price feed contract address and prices
+    // Mapping from asset ticker (e.g., "BTC", "ETH") to the Chainlink price feed contract address
     mapping(string => address) public priceFeeds;
-    mapping(string => uint256) public assetPrices;
 
-    // Array of asset tickers
-    string[] public assetKeys = ['BTC', 'ETH', 'BNB', 'ADA', 'LINK', 'SOL', 'XRP', 'DOGE', 'DOT', 'MATIC'];
+    // Array of asset tickers, an asset's position in this array is its index everywhere else
+    string[] public assetKeys;
+    mapping(bytes32 => uint256) private assetIndexPlusOne; // keccak256(ticker) => index + 1, 0 for unknown assets
+
+    // Asset prices (8 decimals) packed as four uint64 values per storage slot, keyed by asset index
+    mapping(uint256 => uint256) private packedPrices;
+    uint256 private constant PRICES_PER_SLOT = 4;
+    uint256 private constant PRICE_BITS = 64;
+    uint256 private constant MAX_ASSETS = 256; // Agents track open positions in a 256-bit bitmap
 
     // Event to emit when an agent is deployed
     event AgentContractDeployed(address agentContractAddress);
@@ -33,6 +40,11 @@ contract AlphaEnsemble is KeeperCompatibleInterface, ReentrancyGuard {
     constructor(address _oracleAddress) {
         oracleAddress = _oracleAddress; // Oracle address for LLM calls
         owner = msg.sender; // Owner of the contract
+
+        string[10] memory defaultAssetKeys = ['BTC', 'ETH', 'BNB', 'ADA', 'LINK', 'SOL', 'XRP', 'DOGE', 'DOT', 'MATIC'];
+        for (uint256 i = 0; i < defaultAssetKeys.length; i++) {
+            addAsset(defaultAssetKeys[i]);
+        }
     }
 
     /**
@@ -40,47 +52,105 @@ contract AlphaEnsemble is KeeperCompatibleInterface, ReentrancyGuard {
      * @param strategyDetails A string containing custom strategy requirements for the agent.
      */
     function deployAgent(string memory strategyDetails) public onlyOwner nonReentrant {
-        Agent newAgent = new Agent(oracleAddress, nextAgentId, strategyDetails, assetKeys); // Deploy a new agent
+        Agent newAgent = new Agent(oracleAddress, nextAgentId, strategyDetails, assetKeys.length); // Deploy a new agent
         agentContracts.push(address(newAgent)); // Store the agent's contract address
         emit AgentContractDeployed(address(newAgent)); // Emit event for the frontend
         nextAgentId++; // Increment the agent ID for the next deployment
     }
 
+    /**
+     * @notice Replace the list of tradable assets. Only possible before any agent is deployed,
+     * since agents refer to assets by their index in this list.
+     * @param _assetKeys Array of asset tickers (e.g., ["BTC", "ETH"])
+     */
+    function setAssetKeys(string[] memory _assetKeys) public onlyOwner {
+        require(agentContracts.length == 0, "Assets cannot change once agents are deployed");
+
+        for (uint256 i = 0; i < assetKeys.length; i++) {
+            delete assetIndexPlusOne[keccak256(bytes(assetKeys[i]))];
+            delete packedPrices[i / PRICES_PER_SLOT];
+        }
+        delete assetKeys;
+
+        for (uint256 i = 0; i < _assetKeys.length; i++) {
+            addAsset(_assetKeys[i]);
+        }
+    }
+
     /**
      * @notice Update the prices of assets manually.
      * @param assets Array of asset tickers (e.g., ["BTC", "ETH"])
      * @param prices Array of new prices for each asset
      */
     function updateAssetPricesManual(string[] memory assets, uint256[] memory prices) public onlyOwner nonReentrant {
+        storeAssetPrices(assets, prices);
+
+        // Mark all agents to market at the new prices
+        updateAllAgentPrices();
+    }
+
+    /**
+     * @notice Update the prices of assets without marking the agents to market.
+     * @dev Use together with updateAgentPrices to mark agents in shards when there are many agents.
+     * @param assets Array of asset tickers (e.g., ["BTC", "ETH"])
+     * @param prices Array of new prices for each asset
+     */
+    function setAssetPrices(string[] memory assets, uint256[] memory prices) public onlyOwner nonReentrant {
+        storeAssetPrices(assets, prices);
+    }
+
+    /**
+     * @notice Mark the agents with IDs in [from, to) to market at the current prices.
+     * @dev Agents read prices from this contract, so this only emits their updated PnL.
+     * @param from First agent ID (inclusive)
+     * @param to Last agent ID (exclusive), capped at the number of agents
+     */
+    function updateAgentPrices(uint256 from, uint256 to) public onlyOwner nonReentrant {
+        updateAgentPricesInRange(from, to);
+    }
+
+    function storeAssetPrices(string[] memory assets, uint256[] memory prices) internal {
         require(assets.length == prices.length, "Assets and prices arrays must have the same length");
 
+        // Assets outside the asset list have no slot and are skipped, known ones are compacted
+        // to the front so the event only reports the prices that were stored
+        uint256 stored = 0;
         for (uint256 i = 0; i < assets.length; i++) {
-            string memory asset = assets[i];
-            uint256 price = prices[i];
-            assetPrices[asset] = price;
+            (bool found, uint256 index) = findAsset(assets[i]);
+            if (found) {
+                setAssetPrice(index, prices[i]);
+                assets[stored] = assets[i];
+                prices[stored] = prices[i];
+                stored++;
+            }
+        }
+        assembly {
+            mstore(assets, stored)
+            mstore(prices, stored)
         }
 
         // Emit event for the frontend
         emit AssetPricesUpdated(assets, prices);
-
-        // Send the new prices to all agents
-        updateAllAgentPrices();
     }
 
     /**
-     * @notice Send the new prices to all agent contracts so they can store them.
+     * @notice Mark all agent contracts to market at the current prices.
      */
     function updateAllAgentPrices() internal {
-        for (uint256 i = 0; i < agentContracts.length; i++) {
-            Agent agent = Agent(agentContracts[i]);
+        updateAgentPricesInRange(0, agentContracts.length);
+    }
 
-            // Send the updated prices to the agent contracts
-            uint256[] memory prices = new uint256[](assetKeys.length);
-            for (uint256 j = 0; j < assetKeys.length; j++) {
-                prices[j] = assetPrices[assetKeys[j]];
-            }
+    function updateAgentPricesInRange(uint256 from, uint256 to) internal {
+        if (to > agentContracts.length) {
+            to = agentContracts.length;
+        }
 
-            agent.storePrices(assetKeys, prices); // Each agent now stores the prices
+        // Every agent is marked against the same price vector, so read it once
+        uint256[] memory prices = getAssetPrices();
+
+        for (uint256 i = from; i < to; i++) {
+            Agent agent = Agent(agentContracts[i]);
+            agent.markToMarket(prices);
         }
     }
 
@@ -88,62 +158,108 @@ contract AlphaEnsemble is KeeperCompatibleInterface, ReentrancyGuard {
      * @notice Call this function to start a new LLM run for all agents.
      */
     function startAllAgentRuns() public nonReentrant onlyOwner {
-        for (uint256 i = 0; i < agentContracts.length; i++) {
+        startAgentRunsInRange(0, agentContracts.length);
+    }
+
+    /**
+     * @notice Start a new LLM run for the agents with IDs in [from, to).
+     * @param from First agent ID (inclusive)
+     * @param to Last agent ID (exclusive), capped at the number of agents
+     */
+    function startAgentRuns(uint256 from, uint256 to) public nonReentrant onlyOwner {
+        startAgentRunsInRange(from, to);
+    }
+
+    function startAgentRunsInRange(uint256 from, uint256 to) internal {
+        uint256 agentCount = agentContracts.length;
+        if (to > agentCount) {
+            to = agentCount;
+        }
+        if (from >= to) {
+            return;
+        }
+
+        // Every query describes every agent, so read each agent's state once and reuse it
+        string[] memory keys = assetKeys;
+        uint256[] memory prices = getAssetPrices();
+        int256[][] memory positions = new int256[][](agentCount);
+        int256[] memory pnls = new int256[](agentCount);
+        for (uint256 j = 0; j < agentCount; j++) {
+            Agent agent = Agent(agentContracts[j]);
+            positions[j] = agent.getPositionsRaw();
+            pnls[j] = agent.getPnl();
+        }
+
+        for (uint256 i = from; i < to; i++) {
             Agent agent = Agent(agentContracts[i]);
 
             // Generate the LLM query for the agent
-            string memory query = generateLLMQuery(i);
+            string memory query = generateLLMQuery(i, keys, prices, positions, pnls);
 
             agent.startAgentRun(query); // Generate LLM query and start agent run
             emit AgentRunStarted(i, query); // Emit event for the frontend
         }
     }
 
-    function generateLLMQuery(uint256 agentId) internal view returns (string memory) {
-        // Start with the specific agent's information
-        string memory query = "You are an AI agent tasked with optimizing asset positions for a financial portfolio in a setting where you can see all other agent's positions and PnL. You may take positions between -10 and 10, including fractional values. Provide the new positions for each asset in the format: {'BTC': <position>, 'ETH': <position} for every asset available. Return no other information. You are agent ";
-        query = string(abi.encodePacked(query, uint2str(agentId), ". Your current positions are: "));
+    function generateLLMQuery(
+        uint256 agentId,
+        string[] memory keys,
+        uint256[] memory prices,
+        int256[][] memory positions,
+        int256[] memory pnls
+    ) internal view returns (string memory) {
+        // The query is written into one growable buffer, appending never copies what is already there
+        QueryBuffer memory query = newQueryBuffer(1024);
 
-        Agent currAgent = Agent(agentContracts[agentId]);
-        for (uint256 i = 0; i < assetKeys.length; i++) {
-            string memory asset = assetKeys[i];
-            int256 position = currAgent.getPosition(asset);
-            query = string(abi.encodePacked(query, asset, "=", int2str(position), "; "));
-        }
+        // Start with the specific agent's information
+        append(query, "You are an AI agent tasked with optimizing asset positions for a financial portfolio in a setting where you can see all other agent's positions and PnL. You may take positions between -10 and 10, including fractional values. Provide the new positions for each asset in the format: {'BTC': <position>, 'ETH': <position} for every asset available. Return no other information. You are agent ");
+        appendUint(query, agentId);
+        append(query, ". Your current positions are: ");
+        appendPositions(query, keys, positions[agentId]);
 
         // Add information about other agents
-        query = string(abi.encodePacked(query, " Other agents' positions and total PnL: "));
-        for (uint256 j = 0; j < agentContracts.length; j++) {
+        append(query, " Other agents' positions and total PnL: ");
+        for (uint256 j = 0; j < positions.length; j++) {
             if (j != agentId) {  // Exclude the current agent's own info
-                Agent agent = Agent(agentContracts[j]);
-                query = string(abi.encodePacked(query, "Agent ", uint2str(j), " - PnL: ", int2str(agent.getPnl()), "; Positions: "));
-                for (uint256 k = 0; k < assetKeys.length; k++) {
-                    string memory asset = assetKeys[k];
-                    int256 otherPosition = agent.getPosition(asset);
-                    query = string(abi.encodePacked(query, asset, "=", int2str(otherPosition), "; "));
-                }
-                query = string(abi.encodePacked(query, " "));
+                append(query, "Agent ");
+                appendUint(query, j);
+                append(query, " - PnL: ");
+                appendInt(query, pnls[j]);
+                append(query, "; Positions: ");
+                appendPositions(query, keys, positions[j]);
+                append(query, " ");
             }
         }
 
         // Include current asset prices
-        query = string(abi.encodePacked(query, " Current asset prices: "));
-        for (uint256 i = 0; i < assetKeys.length; i++) {
-            string memory asset = assetKeys[i];
-            uint256 currentPrice = assetPrices[asset];
-            query = string(abi.encodePacked(query, asset, "=", uint2str(currentPrice), "; "));
+        append(query, " Current asset prices: ");
+        for (uint256 i = 0; i < keys.length; i++) {
+            append(query, bytes(keys[i]));
+            append(query, "=");
+            appendUint(query, prices[i]);
+            append(query, "; ");
         }
 
         // Append the custom strategy details if they exist (otherwise, use the default message)
-        string memory strategyDetails = currAgent.getStrategyDetails();
+        string memory strategyDetails = Agent(agentContracts[agentId]).getStrategyDetails();
         if (bytes(strategyDetails).length > 0) {
-            query = string(abi.encodePacked(query, " ", strategyDetails));
+            append(query, " ");
+            append(query, bytes(strategyDetails));
         } else {
             // Default message for optimizing PnL and avoiding similar positions
-            query = string(abi.encodePacked(query, " Avoid choosing identical positions to other agents. Note that rebalancing will only occur every few minutes, so plan accordingly. Optimize for maximum PnL while minimizing transaction costs and keeping a diverse portfolio. Trade based on the information known of other agents. Return the new positions now to maximize PnL."));
+            append(query, " Avoid choosing identical positions to other agents. Note that rebalancing will only occur every few minutes, so plan accordingly. Optimize for maximum PnL while minimizing transaction costs and keeping a diverse portfolio. Trade based on the information known of other agents. Return the new positions now to maximize PnL.");
         }
 
-        return query;
+        return toString(query);
+    }
+
+    function appendPositions(QueryBuffer memory query, string[] memory keys, int256[] memory agentPositions) internal pure {
+        for (uint256 i = 0; i < keys.length; i++) {
+            append(query, bytes(keys[i]));
+            append(query, "=");
+            appendInt(query, agentPositions[i]);
+            append(query, "; ");
+        }
     }
 
     // =================================================================================================
@@ -158,6 +274,69 @@ contract AlphaEnsemble is KeeperCompatibleInterface, ReentrancyGuard {
         return agentContracts;
     }
 
+    /**
+     * @notice Get the number of deployed agent contracts.
+     * @return The number of agents, used by keepers to split work into ranges.
+     */
+    function getAgentCount() public view returns (uint256) {
+        return agentContracts.length;
+    }
+
+    /**
+     * @notice Get the list of asset tickers, in index order.
+     */
+    function getAssetKeys() public view returns (string[] memory) {
+        return assetKeys;
+    }
+
+    /**
+     * @notice Look up the index of an asset ticker.
+     * @param asset Asset ticker (e.g., "BTC", "ETH").
+     * @return found Whether the asset is in the asset list.
+     * @return index The asset's index, 0 when not found.
+     */
+    function findAsset(string memory asset) public view returns (bool found, uint256 index) {
+        uint256 indexPlusOne = assetIndexPlusOne[keccak256(bytes(asset))];
+        if (indexPlusOne == 0) {
+            return (false, 0);
+        }
+        return (true, indexPlusOne - 1);
+    }
+
+    /**
+     * @notice Get the price of an asset by ticker, 0 for unknown assets.
+     * @param asset Asset ticker (e.g., "BTC", "ETH").
+     */
+    function assetPrices(string memory asset) public view returns (uint256) {
+        (bool found, uint256 index) = findAsset(asset);
+        return found ? getAssetPrice(index) : 0;
+    }
+
+    /**
+     * @notice Get the price of an asset by index.
+     * @param index Index of the asset in the asset list.
+     */
+    function getAssetPrice(uint256 index) public view returns (uint256) {
+        require(index < assetKeys.length, "Unknown asset index");
+        return (packedPrices[index / PRICES_PER_SLOT] >> ((index % PRICES_PER_SLOT) * PRICE_BITS)) & type(uint64).max;
+    }
+
+    /**
+     * @notice Get the prices of all assets, indexed like the asset list.
+     */
+    function getAssetPrices() public view returns (uint256[] memory prices) {
+        uint256 count = assetKeys.length;
+        prices = new uint256[](count);
+
+        uint256 word;
+        for (uint256 i = 0; i < count; i++) {
+            if (i % PRICES_PER_SLOT == 0) {
+                word = packedPrices[i / PRICES_PER_SLOT];
+            }
+            prices[i] = (word >> ((i % PRICES_PER_SLOT) * PRICE_BITS)) & type(uint64).max;
+        }
+    }
+
     /**
      * @notice Sets the Chainlink price feed contract address for an asset.
      * @param asset Asset ticker (e.g., "BTC", "ETH").
@@ -184,7 +363,7 @@ contract AlphaEnsemble is KeeperCompatibleInterface, ReentrancyGuard {
      * @param agentId The ID of the agent to set the strategy details for
      * @param strategyDetails The strategy details to set for the agent's LLM query
      */
-    function setStrategyDetails(uint8 agentId, string memory strategyDetails) public onlyOwner {
+    function setStrategyDetails(uint256 agentId, string memory strategyDetails) public onlyOwner {
         Agent agent = Agent(agentContracts[agentId]);
         agent.setStrategyDetails(strategyDetails);
     }
@@ -227,18 +406,16 @@ contract AlphaEnsemble is KeeperCompatibleInterface, ReentrancyGuard {
      * @notice Fetches and updates asset prices using Chainlink.
      */
     function updateAssetPricesFromChainlink() public nonReentrant {
-        string[] memory assets = new string[](assetKeys.length);
-        uint256[] memory prices = new uint256[](assetKeys.length);
+        string[] memory assets = assetKeys;
+        uint256[] memory prices = new uint256[](assets.length);
 
-        for (uint256 i = 0; i < assetKeys.length; i++) {
-            string memory asset = assetKeys[i];
-            AggregatorV3Interface priceFeed = AggregatorV3Interface(priceFeeds[asset]);
+        for (uint256 i = 0; i < assets.length; i++) {
+            AggregatorV3Interface priceFeed = AggregatorV3Interface(priceFeeds[assets[i]]);
             (, int256 price,,,) = priceFeed.latestRoundData();
             require(price > 0, "Invalid price retrieved");
             uint256 adjustedPrice = uint256(price);
-            assetPrices[asset] = adjustedPrice;
+            setAssetPrice(i, adjustedPrice);
             prices[i] = adjustedPrice;
-            assets[i] = asset;
         }
 
         // Emit event for frontend and update positions for all agents
@@ -249,52 +426,115 @@ contract AlphaEnsemble is KeeperCompatibleInterface, ReentrancyGuard {
     // Utility functions
     // =================================================================================================
 
-    function uint2str(uint _i) internal pure returns (string memory _uintAsString) {
-        if (_i == 0) {
-            return "0";
+    function addAsset(string memory asset) internal {
+        bytes32 key = keccak256(bytes(asset));
+        require(assetIndexPlusOne[key] == 0, "Duplicate asset");
+        require(assetKeys.length < MAX_ASSETS, "Too many assets");
+        assetKeys.push(asset);
+        assetIndexPlusOne[key] = assetKeys.length;
+    }
+
+    function setAssetPrice(uint256 index, uint256 price) internal {
+        require(price <= type(uint64).max, "Price does not fit in 64 bits");
+        uint256 slot = index / PRICES_PER_SLOT;
+        uint256 shift = (index % PRICES_PER_SLOT) * PRICE_BITS;
+        packedPrices[slot] = (packedPrices[slot] & ~(uint256(type(uint64).max) << shift)) | (price << shift);
+    }
+
+    // Growable byte buffer for building LLM queries in linear time
+    struct QueryBuffer {
+        bytes data; // Allocated capacity, its length field is the capacity
+        uint256 length; // Bytes written so far
+    }
+
+    function newQueryBuffer(uint256 capacity) internal pure returns (QueryBuffer memory buffer) {
+        buffer.data = new bytes(capacity);
+    }
+
+    function append(QueryBuffer memory buffer, bytes memory value) internal pure {
+        reserve(buffer, value.length);
+        bytes memory data = buffer.data;
+        uint256 offset = buffer.length;
+        uint256 dest;
+        uint256 src;
+        assembly ("memory-safe") {
+            dest := add(add(data, 32), offset)
+            src := add(value, 32)
         }
-        uint j = _i;
-        uint len;
-        while (j != 0) {
-            len++;
-            j /= 10;
+        copyMemory(dest, src, value.length);
+        buffer.length = offset + value.length;
+    }
+
+    function appendUint(QueryBuffer memory buffer, uint256 value) internal pure {
+        uint256 digits = 1;
+        for (uint256 v = value; v >= 10; v /= 10) {
+            digits++;
         }
-        bytes memory bstr = new bytes(len);
-        uint k = len;
-        while (_i != 0) {
-            k = k - 1;
-            uint8 temp = (48 + uint8(_i - _i / 10 * 10));
-            bstr[k] = bytes1(temp);
-            _i /= 10;
+        reserve(buffer, digits);
+
+        // Write the digits right to left directly into the buffer
+        bytes memory data = buffer.data;
+        uint256 start = buffer.length;
+        for (uint256 k = start + digits; k > start; k--) {
+            data[k - 1] = bytes1(uint8(48 + value % 10));
+            value /= 10;
         }
-        return string(bstr);
+        buffer.length = start + digits;
     }
 
-    function int2str(int _i) internal pure returns (string memory) {
-        if (_i == 0) {
-            return "0";
+    function appendInt(QueryBuffer memory buffer, int256 value) internal pure {
+        if (value < 0) {
+            append(buffer, "-");
+            // Negating type(int256).min overflows, so negate value + 1 and add the 1 back unsigned
+            appendUint(buffer, uint256(-(value + 1)) + 1);
+        } else {
+            appendUint(buffer, uint256(value));
         }
-        bool negative = _i < 0;
-        uint i = uint(negative ? -_i : _i);
-        uint j = i;
-        uint len;
-        while (j != 0) {
-            len++;
-            j /= 10;
+    }
+
+    function toString(QueryBuffer memory buffer) internal pure returns (string memory) {
+        bytes memory data = buffer.data;
+        uint256 length = buffer.length;
+        assembly ("memory-safe") {
+            mstore(data, length)
         }
-        if (negative) ++len;
-        bytes memory bstr = new bytes(len);
-        uint k = len;
-        if (negative) {
-            bstr[0] = '-';
+        return string(data);
+    }
+
+    function reserve(QueryBuffer memory buffer, uint256 extra) private pure {
+        uint256 required = buffer.length + extra;
+        uint256 capacity = buffer.data.length;
+        if (required <= capacity) {
+            return;
         }
-        while (i != 0) {
-            k = k - 1;
-            uint8 temp = (48 + uint8(i - i / 10 * 10));
-            bstr[k] = bytes1(temp);
-            i /= 10;
+
+        // Double the capacity so the total copying stays linear in the final length
+        uint256 newCapacity = capacity * 2 > required ? capacity * 2 : required;
+        bytes memory oldData = buffer.data;
+        bytes memory newData = new bytes(newCapacity);
+        uint256 dest;
+        uint256 src;
+        assembly ("memory-safe") {
+            dest := add(newData, 32)
+            src := add(oldData, 32)
+        }
+        copyMemory(dest, src, buffer.length);
+        buffer.data = newData;
+    }
+
+    function copyMemory(uint256 dest, uint256 src, uint256 length) private pure {
+        assembly ("memory-safe") {
+            // Copy whole words, then merge the remaining bytes into the destination word
+            for { } gt(length, 31) { length := sub(length, 32) } {
+                mstore(dest, mload(src))
+                dest := add(dest, 32)
+                src := add(src, 32)
+            }
+            if gt(length, 0) {
+                let mask := sub(shl(mul(sub(32, length), 8), 1), 1)
+                mstore(dest, or(and(mload(src), not(mask)), and(mload(dest), mask)))
+            }
         }
-        return string(bstr);
     }
 
     // =================================================================================================
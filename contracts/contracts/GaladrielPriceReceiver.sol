@@ -14,6 +14,16 @@ contract GaladrielPriceReceiver {
         emit PriceUpdated(asset, price);
     }
 
+    // Function to update the prices for many assets in a single transaction
+    function updatePrices(string[] memory assets, int256[] memory newPrices) public {
+        require(assets.length == newPrices.length, "Mismatched arrays");
+
+        for (uint256 i = 0; i < assets.length; i++) {
+            prices[assets[i]] = newPrices[i];
+            emit PriceUpdated(assets[i], newPrices[i]);
+        }
+    }
+
     // Function to get the price of a specific asset
     function getPrice(string memory asset) public view returns (int256) {
         return prices[asset];
@@ -0,0 +1,17 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity ^0.8.9;
+
+/**
+ * @notice Asset registry and price source that agents read from, implemented by AlphaEnsemble.
+ * Assets are identified by their index in the ensemble's asset list.
+ */
+interface IAssetPrices {
+    function getAssetKeys() external view returns (string[] memory);
+
+    // Returns (false, 0) for assets that are not in the asset list
+    function findAsset(string memory asset) external view returns (bool found, uint256 index);
+
+    function getAssetPrice(uint256 index) external view returns (uint256);
+
+    function getAssetPrices() external view returns (uint256[] memory);
+}
@@ -0,0 +1,17 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity ^0.8.13;
+
+import "../AlphaEnsemble.sol";
+
+/**
+ * @notice Exposes AlphaEnsemble's internal query formatting to tests.
+ */
+contract AlphaEnsembleHarness is AlphaEnsemble {
+    constructor(address _oracleAddress) AlphaEnsemble(_oracleAddress) {}
+
+    function formatInt(int256 value) external pure returns (string memory) {
+        QueryBuffer memory buffer = newQueryBuffer(0);
+        appendInt(buffer, value);
+        return toString(buffer);
+    }
+}
@@ -0,0 +1,53 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity ^0.8.9;
+
+import "../interfaces/IOracle.sol";
+
+interface IOpenAiLlmCallback {
+    function onOracleOpenAiLlmResponse(uint runId, IOracle.OpenAiResponse memory response, string memory errorMessage) external;
+}
+
+/**
+ * @notice Stand-in for the Galadriel oracle on local networks.
+ * @dev Records OpenAI calls and lets anyone answer them, used by scripts/bench_keepers.py.
+ */
+contract MockOracle {
+    struct LlmCall {
+        address callbackAddress;
+        uint256 promptId;
+        bool answered;
+    }
+
+    LlmCall[] public calls;
+
+    event OpenAiLlmCallCreated(uint256 indexed callId, address indexed callbackAddress, uint256 promptId);
+
+    function createOpenAiLlmCall(uint promptId, IOracle.OpenAiRequest memory) external returns (uint) {
+        calls.push(LlmCall(msg.sender, promptId, false));
+        emit OpenAiLlmCallCreated(calls.length - 1, msg.sender, promptId);
+        return calls.length - 1;
+    }
+
+    /**
+     * @notice Deliver LLM responses for several calls at once.
+     * @param callIds IDs from OpenAiLlmCallCreated
+     * @param contents Response content for each call, e.g. {"BTC": 1, "ETH": -2}
+     */
+    function respond(uint256[] memory callIds, string[] memory contents) external {
+        require(callIds.length == contents.length, "Mismatched arrays");
+
+        for (uint256 i = 0; i < callIds.length; i++) {
+            LlmCall storage llmCall = calls[callIds[i]];
+            require(!llmCall.answered, "Call already answered");
+            llmCall.answered = true;
+
+            IOracle.OpenAiResponse memory response;
+            response.content = contents[i];
+            IOpenAiLlmCallback(llmCall.callbackAddress).onOracleOpenAiLlmResponse(llmCall.promptId, response, "");
+        }
+    }
+
+    function getCallCount() external view returns (uint256) {
+        return calls.length;
+    }
+}
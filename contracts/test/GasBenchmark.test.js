@@ -0,0 +1,195 @@
+const { expect } = require("chai");
+const { ethers } = require("hardhat");
+
+// Compares gas of the baseline string-keyed contracts (test/LegacyAlphaEnsemble.sol) against the
+// index-keyed, packed-price contracts for a range of asset and agent counts, and checks that
+// both build the same LLM query text. The baseline has no ranged entry points, so both sides
+// are measured through updateAssetPricesManual and startAllAgentRuns. LLM calls go through
+// test/MockOracle.sol.
+// Run with: npx hardhat test test/GasBenchmark.test.js
+describe("Gas benchmark", function () {
+    this.timeout(0);
+
+    const assetCounts = [10, 50, 200];
+    const agentCounts = [5, 50];
+    const blockGasLimit = 30000000;
+    const results = [];
+
+    let owner;
+
+    before(async function () {
+        [owner] = await ethers.getSigners();
+    });
+
+    after(function () {
+        console.table(results);
+    });
+
+    function assetNames(count) {
+        return Array.from({ length: count }, (_, i) => `ASSET${i}`);
+    }
+
+    function pricesAt(count, step) {
+        // Prices only ever rise and every position is long: the legacy PnL math reverts on
+        // underflow when a long position is under water (or a short one in profit)
+        return Array.from({ length: count }, (_, i) => 100000000n * BigInt(i + 1) + BigInt(step) * 1000000n);
+    }
+
+    function llmResponse(assets, agentId) {
+        const pairs = assets.map((asset, i) => `"${asset}": ${1 + ((i + agentId) % 5)}`);
+        return `{${pairs.join(", ")}}`;
+    }
+
+    async function send(txPromise) {
+        try {
+            const tx = await txPromise;
+            return await tx.wait();
+        } catch (e) {
+            return null; // Reverted or exceeded the block gas limit
+        }
+    }
+
+    async function gasUsed(txPromise) {
+        const receipt = await send(txPromise);
+        return receipt === null ? null : receipt.gasUsed;
+    }
+
+    async function deployOracle() {
+        const MockOracle = await ethers.getContractFactory("MockOracle");
+        const oracle = await MockOracle.deploy();
+        await oracle.waitForDeployment();
+        return oracle;
+    }
+
+    async function deployLegacy(assets, agentCount) {
+        const oracle = await deployOracle();
+        const LegacyAlphaEnsemble = await ethers.getContractFactory("LegacyAlphaEnsemble");
+        const ensemble = await LegacyAlphaEnsemble.deploy(oracle.target, assets);
+        await ensemble.waitForDeployment();
+        for (let i = 0; i < agentCount; i++) {
+            await (await ensemble.deployAgent("")).wait();
+        }
+        return { ensemble, oracle, agentCount };
+    }
+
+    async function deployIndexed(assets, agentCount) {
+        const oracle = await deployOracle();
+        const AlphaEnsemble = await ethers.getContractFactory("AlphaEnsemble");
+        const ensemble = await AlphaEnsemble.deploy(oracle.target);
+        await ensemble.waitForDeployment();
+        await (await ensemble.setAssetKeys(assets)).wait();
+        for (let i = 0; i < agentCount; i++) {
+            await (await ensemble.deployAgent("")).wait();
+        }
+        return { ensemble, oracle, agentCount };
+    }
+
+    // Start a run for every agent, returning the gas of the whole batch and every query by agent
+    async function runAgents(ensemble) {
+        const receipt = await send(ensemble.startAllAgentRuns({ gasLimit: blockGasLimit }));
+        if (receipt === null) {
+            return { runGas: null, queries: null };
+        }
+        const queries = [];
+        for (const log of receipt.logs) {
+            const parsed = ensemble.interface.parseLog(log);
+            if (parsed && parsed.name === "AgentRunStarted") {
+                queries[Number(parsed.args[0])] = parsed.args[1];
+            }
+        }
+        return { runGas: receipt.gasUsed, queries };
+    }
+
+    async function measure({ ensemble, oracle, agentCount }, assets) {
+        const options = { gasLimit: blockGasLimit };
+
+        // First update writes every price slot from zero, the second is the steady state
+        await gasUsed(ensemble.updateAssetPricesManual(assets, pricesAt(assets.length, 0), options));
+
+        // Give every agent a position in every asset by answering its first LLM call
+        const firstRuns = await runAgents(ensemble);
+        let positionsGas = null;
+        if (firstRuns.queries !== null) {
+            for (let i = 0; i < agentCount; i++) {
+                positionsGas = await gasUsed(oracle.respond([i], [llmResponse(assets, i)], options));
+            }
+        }
+
+        const priceUpdateGas = await gasUsed(ensemble.updateAssetPricesManual(assets, pricesAt(assets.length, 1), options));
+
+        // Steady state query: every agent now has positions and PnL to describe
+        const { runGas, queries } = await runAgents(ensemble);
+        return { priceUpdateGas, positionsGas, runGas, queries };
+    }
+
+    for (const assetCount of assetCounts) {
+        for (const agentCount of agentCounts) {
+            it(`${assetCount} assets, ${agentCount} agents`, async function () {
+                const assets = assetNames(assetCount);
+                const legacy = await measure(await deployLegacy(assets, agentCount), assets);
+                const indexed = await measure(await deployIndexed(assets, agentCount), assets);
+
+                results.push({
+                    assets: assetCount,
+                    agents: agentCount,
+                    "price update (before)": legacy.priceUpdateGas?.toString() ?? "exceeds block",
+                    "price update (after)": indexed.priceUpdateGas?.toString() ?? "exceeds block",
+                    "set positions (before)": legacy.positionsGas?.toString() ?? "exceeds block",
+                    "set positions (after)": indexed.positionsGas?.toString() ?? "exceeds block",
+                    "agent runs (before)": legacy.runGas?.toString() ?? "exceeds block",
+                    "agent runs (after)": indexed.runGas?.toString() ?? "exceeds block",
+                });
+
+                if (legacy.priceUpdateGas !== null) {
+                    expect(indexed.priceUpdateGas).to.not.equal(null);
+                    expect(indexed.priceUpdateGas).to.be.lessThan(legacy.priceUpdateGas);
+                }
+                if (legacy.runGas !== null) {
+                    expect(indexed.runGas).to.not.equal(null);
+                    expect(indexed.runGas).to.be.lessThan(legacy.runGas);
+
+                    // The rewritten query builder must produce the same text, byte for byte
+                    expect(indexed.queries).to.deep.equal(legacy.queries);
+                }
+            });
+        }
+    }
+});
+
+describe("Asset price updates", function () {
+    it("leaves assets outside the asset list out of AssetPricesUpdated", async function () {
+        const MockOracle = await ethers.getContractFactory("MockOracle");
+        const oracle = await MockOracle.deploy();
+        await oracle.waitForDeployment();
+        const AlphaEnsemble = await ethers.getContractFactory("AlphaEnsemble");
+        const ensemble = await AlphaEnsemble.deploy(oracle.target);
+        await ensemble.waitForDeployment();
+
+        await expect(ensemble.setAssetPrices(["BTC", "NOPE", "ETH"], [100n, 200n, 300n]))
+            .to.emit(ensemble, "AssetPricesUpdated")
+            .withArgs(["BTC", "ETH"], [100n, 300n]);
+        expect(await ensemble.assetPrices("ETH")).to.equal(300n);
+    });
+});
+
+describe("LLM query formatting", function () {
+    let harness;
+
+    before(async function () {
+        const [owner] = await ethers.getSigners();
+        const AlphaEnsembleHarness = await ethers.getContractFactory("AlphaEnsembleHarness");
+        harness = await AlphaEnsembleHarness.deploy(owner.address);
+        await harness.waitForDeployment();
+    });
+
+    it("formats signed integers like the legacy int2str", async function () {
+        expect(await harness.formatInt(0)).to.equal("0");
+        expect(await harness.formatInt(7)).to.equal("7");
+        expect(await harness.formatInt(-42)).to.equal("-42");
+        expect(await harness.formatInt(ethers.MaxInt256)).to.equal(ethers.MaxInt256.toString());
+    });
+
+    it("formats type(int256).min without overflowing", async function () {
+        expect(await harness.formatInt(ethers.MinInt256)).to.equal(ethers.MinInt256.toString());
+    });
+});
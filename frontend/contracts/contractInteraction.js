@@ -37,6 +37,7 @@ export async function pollEvents(updateInstrumentOverview, updateLeaderboard, up
   const latestBlock = await provider.getBlockNumber();
 
   // Poll for AssetPricesUpdated events
+  // Each push may carry only the assets that moved, so the overview merges them by asset
   const assetPricesEvents = await contract.queryFilter("AssetPricesUpdated", lastCheckedBlock, latestBlock);
   assetPricesEvents.forEach((event) => {
     const { assets, prices } = event.args;
@@ -67,8 +67,13 @@ export default function Home() {
     addTimestamp();
   }, [addTimestamp]);
 
+  // Merge by asset, a partial price push keeps the other assets' last prices
   const updateInstrumentOverview = useCallback((data) => {
-    setInstrumentOverviewData(data);
+    setInstrumentOverviewData((prevData) => {
+      const byAsset = new Map(prevData.map((entry) => [entry.asset, entry]));
+      data.forEach((entry) => byAsset.set(entry.asset, entry));
+      return Array.from(byAsset.values());
+    });
   }, []);
 
   const updateLeaderboard = useCallback((newEntry) => {
@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+import numpy as np
+from connections import get_submitter, get_web3
+from keeper_daemon import EnsembleKeeper, PriceIngestion
+from price_store import loads
+
+# Offline throughput benchmark for the keeper pipeline. Runs keeper_daemon's EnsembleKeeper and
+# PriceIngestion, unchanged, against a local hardhat/anvil node, with a synthetic (or replayed)
+# Binance tick stream in place of the websocket and a MockOracle that answers LLM calls.
+#
+#   cd contracts && npx hardhat compile && npx hardhat node
+#   python scripts/bench_keepers.py --assets 10 --agents 5 --duration 60
+
+artifacts_dir = os.path.join(os.path.dirname(__file__), '../contracts/artifacts/contracts')
+
+# First funded account of both `npx hardhat node` and `anvil`, never use it outside a local node
+local_private_key = '0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80'
+
+default_assets = ['BTC', 'ETH', 'BNB', 'ADA', 'LINK', 'SOL', 'XRP', 'DOGE', 'DOT', 'MATIC']
+
+
+def load_artifact(path):
+    with open(os.path.join(artifacts_dir, path)) as f:
+        artifact = json.load(f)
+    return artifact['abi'], artifact['bytecode']
+
+
+def benchmark_assets(count):
+    return default_assets[:count] + [f"SYN{i}" for i in range(len(default_assets), count)]
+
+
+def synthetic_ticks(symbols, rate, duration, seed=0, volatility_bps=5):
+    """
+    Yield (offset_seconds, message) for a reproducible combined-stream miniTicker feed.
+    Each tick moves one random symbol up by the size of a normally distributed return. Prices
+    only ever rise, like in GasBenchmark.test.js, because Agent.holdingPnl reverts on underflow
+    for a long position under water.
+    """
+    rng = random.Random(seed)
+    prices = {symbol: 100.0 * (i + 1) for i, symbol in enumerate(symbols)}
+    count = int(rate * duration)
+    for n in range(count):
+        symbol = rng.choice(symbols)
+        prices[symbol] *= 1 + abs(rng.gauss(0, volatility_bps / 10000))
+        offset = n / rate
+        message = json.dumps({
+            'stream': f"{symbol.lower()}@miniTicker",
+            'data': {'e': '24hrMiniTicker', 'E': int(offset * 1000), 's': symbol, 'c': f"{prices[symbol]:.8f}"},
+        })
+        yield offset, message
+
+
+def record_ticks(ticks, path):
+    with open(path, 'w') as f:
+        for offset, message in ticks:
+            f.write(json.dumps({'t': offset, 'message': message}) + '\n')
+
+
+def replay_ticks(path):
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            yield entry['t'], entry['message']
+
+
+def stamp_ticks(ticks, start):
+    """Give every tick the wall-clock exchange time it will be fed at, so the keeper sees it fresh."""
+    for offset, message in ticks:
+        payload = loads(message)
+        payload['data']['E'] = int((start + offset) * 1000)
+        yield offset, json.dumps(payload)
+
+
+class BenchmarkKeeper(EnsembleKeeper):
+    """The daemon's keeper, keeping the transactions of every cycle for the report."""
+
+    def __init__(self, config, private_key):
+        super().__init__(config, private_key=private_key)
+        self.cycles = []  # (kind, [PendingTx], exchange time of the newest pushed tick)
+
+    def push_prices(self, symbol_prices):
+        timestamps = [self.price_store.timestamp(symbol) for symbol in symbol_prices]
+        pending = super().push_prices(symbol_prices)
+        if pending:
+            self.cycles.append(('prices', pending, max(timestamps) / 1000))
+        return pending
+
+    def start_agent_runs(self):
+        pending = super().start_agent_runs()
+        if pending:
+            self.cycles.append(('llm', pending, None))
+        return pending
+
+
+class KeeperBenchmark:
+    """Deploys the contracts on a local node and drives the daemon's keeper with a tick stream."""
+
+    def __init__(self, rpc_url, private_key, assets, agents, llm_interval=10, deviation_bps=25,
+                 heartbeat=60, gas_budget=8000000, oracle_delay=1.0, oracle_attempts=3):
+        self.rpc_url = rpc_url
+        self.web3 = get_web3(rpc_url)
+        self.private_key = private_key
+        self.assets = assets
+        self.agent_count = agents
+        self.oracle_delay = oracle_delay
+        self.oracle_attempts = oracle_attempts
+        self.keeper_config = {
+            'name': 'benchmark',
+            'network': rpc_url,
+            'deviation_bps': deviation_bps,
+            'heartbeat': heartbeat,
+            'llm_update_interval': llm_interval,
+            'gas_budget': gas_budget,
+        }
+
+        # The keeper signs through the same shared submitter, so deployment nonces carry over
+        self.submitter = get_submitter(rpc_url, private_key)
+        self.submitter.poll_interval = 0.05
+        self.oracle_responses = []
+        self.long_agents = set()  # agents whose last answer opened long positions
+        self.retry_calls = deque()  # (call_id, content, attempt) of answers that reverted
+        self.unanswered_calls = []
+        self._stop = threading.Event()
+
+    # Setup
+
+    def deploy(self):
+        oracle_abi, oracle_bytecode = load_artifact('test/MockOracle.sol/MockOracle.json')
+        ensemble_abi, ensemble_bytecode = load_artifact('AlphaEnsemble.sol/AlphaEnsemble.json')
+
+        oracle = self.web3.eth.contract(abi=oracle_abi, bytecode=oracle_bytecode)
+        pending = self.submitter.submit(oracle.constructor(), description="Deployed MockOracle")
+        self.oracle = self.web3.eth.contract(address=pending.wait()['contractAddress'], abi=oracle_abi)
+
+        ensemble = self.web3.eth.contract(abi=ensemble_abi, bytecode=ensemble_bytecode)
+        pending = self.submitter.submit(
+            ensemble.constructor(self.oracle.address), description="Deployed AlphaEnsemble",
+        )
+        self.ensemble = self.web3.eth.contract(address=pending.wait()['contractAddress'], abi=ensemble_abi)
+
+        if self.assets != default_assets:
+            self.submitter.submit(
+                self.ensemble.functions.setAssetKeys(self.assets), description="Set asset keys",
+            )
+        for i in range(self.agent_count):
+            self.submitter.submit(self.ensemble.functions.deployAgent(""), description=f"Deployed Agent {i+1}")
+        self.submitter.wait_all()
+
+        # Assets come from the contract's getAssetKeys(), like in production
+        self.keeper = BenchmarkKeeper(dict(self.keeper_config, address=self.ensemble.address), self.private_key)
+        self.ingestion = PriceIngestion([self.keeper])
+
+    # Tick stream and oracle, the parts the benchmark plays instead of Binance and the LLM
+
+    def feed_ticks(self, ticks, realtime=True):
+        start = time.perf_counter()
+        for offset, message in ticks:
+            if self._stop.is_set():
+                break
+            if realtime:
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self.ingestion.on_message(None, message)
+        self.ingest_seconds = time.perf_counter() - start
+
+    def llm_answer(self, agent_id, rng):
+        """
+        Positions for one agent's run. Agents alternate between random long positions and flat:
+        with rising prices every position then closes in profit, and no long is ever added to,
+        which would move its legacy cost basis above the price and revert the next markToMarket.
+        """
+        if agent_id in self.long_agents:
+            self.long_agents.discard(agent_id)
+            positions = [0] * len(self.assets)
+        else:
+            self.long_agents.add(agent_id)
+            positions = [rng.randint(1, 10) for _ in self.assets]
+        return '{' + ', '.join(f'"{asset}": {position}' for asset, position in zip(self.assets, positions)) + '}'
+
+    def answer_llm_call(self, call_id, content, attempt=1):
+        # One call per tx, so a revert costs only this answer and it can be sent again
+        def on_receipt(receipt):
+            if receipt['status'] == 1:
+                return
+            if attempt < self.oracle_attempts:
+                self.retry_calls.append((call_id, content, attempt + 1))
+            else:
+                print(f"Gave up answering LLM call {call_id} after {attempt} attempts")
+                self.unanswered_calls.append(call_id)
+
+        pending = self.submitter.submit(
+            self.oracle.functions.respond([call_id], [content]),
+            description=f"Answered LLM call {call_id}",
+            on_receipt=on_receipt,
+        )
+        self.oracle_responses.append(pending)
+
+    def answer_llm_calls(self):
+        """Answer every new MockOracle call after oracle_delay seconds, retrying the ones that revert."""
+        rng = random.Random(1)
+        next_call = 0
+        while not self._stop.is_set():
+            self._stop.wait(self.oracle_delay)
+            while self.retry_calls:
+                self.answer_llm_call(*self.retry_calls.popleft())
+
+            call_count = self.oracle.functions.getCallCount().call()
+            for call_id in range(next_call, call_count):
+                _, agent_id, _ = self.oracle.functions.calls(call_id).call()
+                self.answer_llm_call(call_id, self.llm_answer(agent_id, rng))
+            next_call = call_count
+
+    def run(self, ticks, realtime=True):
+        self.started_at = time.perf_counter()
+        ticks = list(stamp_ticks(ticks, time.time()))
+        stop_keeper = threading.Event()
+        keeper = threading.Thread(target=self.keeper.run, args=(stop_keeper,), daemon=True)
+        responder = threading.Thread(target=self.answer_llm_calls, daemon=True)
+        keeper.start()
+        responder.start()
+
+        self.feed_ticks(ticks, realtime)
+        stop_keeper.set()
+        keeper.join()
+
+        self.submitter.wait_all(timeout=120)
+        self._stop.set()
+        responder.join()
+        self.submitter.wait_all(timeout=120)
+        self.elapsed = time.perf_counter() - self.started_at
+        self.submitter.close()
+        # Retries still queued when the run ended never got an answer either
+        self.unanswered_calls += [call_id for call_id, _, _ in self.retry_calls]
+
+    # Reporting
+
+    def report(self):
+        cycles = self.keeper.cycles + [('llm responses', [tx], None) for tx in self.oracle_responses]
+        confirmed = [tx for _, pending, _ in cycles for tx in pending if tx.receipt is not None]
+        failed = [tx for tx in confirmed if tx.receipt['status'] != 1]
+
+        gas_per_cycle = {}
+        for kind, pending, _ in cycles:
+            receipts = [tx.receipt for tx in pending if tx.receipt is not None]
+            if receipts:
+                gas_per_cycle.setdefault(kind, []).append(sum(receipt['gasUsed'] for receipt in receipts))
+
+        # From the newest tick in a push to the price update's receipt
+        latencies = np.array([
+            pending[0].resolved_at - newest_tick for kind, pending, newest_tick in cycles
+            if kind == 'prices' and pending[0].receipt is not None and pending[0].receipt['status'] == 1
+        ]) * 1000
+        failed_per_kind = {}
+        for kind, pending, _ in cycles:
+            count = sum(1 for tx in pending if tx.receipt is not None and tx.receipt['status'] != 1)
+            if count:
+                failed_per_kind[kind] = failed_per_kind.get(kind, 0) + count
+
+        ticks = self.ingestion.price_store.total_ticks
+        return {
+            # Failures first: a run with reverts measures the retries, not the keeper
+            'failed_transactions': len(failed),
+            'failed_per_kind': failed_per_kind,
+            'unanswered_llm_calls': len(self.unanswered_calls),
+            'ticks': ticks,
+            'ticks_per_second': ticks / self.ingest_seconds if self.ingest_seconds else 0.0,
+            'tick_to_chain_ms': {
+                f"p{q}": float(np.percentile(latencies, q)) for q in (50, 90, 99)
+            } if len(latencies) else {},
+            'transactions': len(confirmed),
+            'tx_per_second': len(confirmed) / self.elapsed if self.elapsed else 0.0,
+            'gas_per_cycle': {
+                kind: {'cycles': len(values), 'mean': float(np.mean(values)), 'max': int(max(values))}
+                for kind, values in gas_per_cycle.items()
+            },
+            'llm_run_cache': self.keeper.llm_run_cache.stats(),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the keeper pipeline against a local node")
+    parser.add_argument('--rpc-url', default='http://127.0.0.1:8545', help="Local hardhat or anvil node")
+    parser.add_argument('--private-key', default=local_private_key, help="Funded key on the local node")
+    parser.add_argument('--assets', type=int, default=10, help="Number of assets (at most 256)")
+    parser.add_argument('--agents', type=int, default=5, help="Number of agents to deploy")
+    parser.add_argument('--duration', type=float, default=60, help="Length of the synthetic tick stream (seconds)")
+    parser.add_argument('--tick-rate', type=float, default=200, help="Synthetic ticks per second")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic tick stream")
+    parser.add_argument('--llm-interval', type=float, default=10, help="Seconds between LLM runs")
+    parser.add_argument('--oracle-delay', type=float, default=1.0, help="Seconds before the mock oracle answers")
+    parser.add_argument('--deviation-bps', type=float, default=25, help="Price push deviation threshold")
+    parser.add_argument('--record', help="Write the synthetic tick stream to this file and exit")
+    parser.add_argument('--replay', help="Replay a recorded tick stream instead of generating one")
+    parser.add_argument('--max-speed', action='store_true', help="Feed ticks as fast as possible instead of in real time")
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    assets = benchmark_assets(args.assets)
+    symbols = [f"{asset}USDT" for asset in assets]
+
+    if args.record:
+        record_ticks(synthetic_ticks(symbols, args.tick_rate, args.duration, args.seed), args.record)
+        print(f"Recorded {int(args.tick_rate * args.duration)} ticks to {args.record}")
+        raise SystemExit(0)
+
+    if args.replay:
+        ticks = list(replay_ticks(args.replay))
+    else:
+        ticks = list(synthetic_ticks(symbols, args.tick_rate, args.duration, args.seed))
+
+    benchmark = KeeperBenchmark(
+        args.rpc_url, args.private_key, assets, args.agents,
+        llm_interval=args.llm_interval, deviation_bps=args.deviation_bps, oracle_delay=args.oracle_delay,
+    )
+    benchmark.deploy()
+    benchmark.run(ticks, realtime=not args.max_speed)
+
+    report = benchmark.report()
+    print(json.dumps(report, indent=2))
+    if report['failed_transactions'] or report['unanswered_llm_calls']:
+        print(f"WARNING: {report['failed_transactions']} of {report['transactions']} transactions failed "
+              f"and {report['unanswered_llm_calls']} LLM calls went unanswered, the figures above include them")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import os
+import threading
+from functools import lru_cache
+
+# Shared, lazily created clients for every script. Nothing here touches the network or the
+# filesystem at import time: Web3 clients, ABIs, contracts and submitters are built on first
+# use and cached, so importing a helper from another script is cheap and all scripts in one
+# process share the same keep-alive HTTP connections (and the same nonce tracking per signer).
+
+repo_root = os.path.join(os.path.dirname(__file__), '..')
+env_path = os.path.join(repo_root, 'frontend/.env.local')
+
+# RPC endpoints per network, overridable from the environment
+rpc_urls = {
+    'galadriel': ('GALADRIEL_RPC_URL', "https://devnet.galadriel.com/"),
+    'sepolia': ('SEPOLIA_RPC_URL', "https://rpc.ankr.com/eth_sepolia"),
+    'local': ('LOCAL_RPC_URL', "http://127.0.0.1:8545"),
+}
+
+# Chain IDs signed into transactions, None lets the node fill it in
+chain_ids = {
+    'galadriel': ('GALADRIEL_CHAIN_ID', 696969),
+    'sepolia': ('SEPOLIA_CHAIN_ID', None),
+    'local': ('LOCAL_CHAIN_ID', None),
+}
+
+# HTTP tuning defaults shared by every client, overridable with RPC_TIMEOUT, RPC_RETRIES, RPC_BACKOFF
+# and RPC_POOL_SIZE in the environment
+rpc_timeout = 10  # seconds per request
+rpc_retries = 3  # retries on connection errors and 429/5xx responses, sends only retry failed connects
+rpc_backoff = 0.3  # exponential backoff factor between retries
+rpc_pool_size = 32  # keep-alive connections per host
+
+# Statuses worth retrying for reads. A send that times out or fails with one of these may still
+# have reached the node, and resending it fails with "already known" or "nonce too low", so
+# eth_sendRawTransaction goes through a session that only retries connections never made.
+retry_statuses = (429, 500, 502, 503, 504)
+send_methods = ('eth_sendRawTransaction',)
+
+
+@lru_cache(maxsize=None)
+def load_env():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=env_path)
+    return True
+
+
+def getenv(name, default=None):
+    load_env()
+    return os.getenv(name, default)
+
+
+def rpc_url(network):
+    """RPC URL for a named network, or the argument itself when it is already a URL."""
+    if '://' in network:
+        return network
+    env_name, default = rpc_urls[network]
+    if network == 'sepolia' and not getenv(env_name) and getenv('INFURA_PROJECT_ID'):
+        return f"https://sepolia.infura.io/v3/{getenv('INFURA_PROJECT_ID')}"
+    return getenv(env_name) or default
+
+
+def chain_id(network):
+    env_name, default = chain_ids.get(network, (None, None))
+    value = getenv(env_name) if env_name else None
+    return int(value) if value else default
+
+
+@lru_cache(maxsize=None)
+def get_session(sends=False):
+    """
+    requests session with pooled keep-alive connections and retries, shared by all clients.
+    With sends=True, only connection errors are retried, never timeouts or error statuses.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retries = int(getenv('RPC_RETRIES', rpc_retries))
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0 if sends else retries,
+        status=0 if sends else retries,
+        other=0 if sends else retries,
+        backoff_factor=float(getenv('RPC_BACKOFF', rpc_backoff)),
+        status_forcelist=() if sends else retry_statuses,
+        allowed_methods=None,  # JSON-RPC is all POST
+    )
+    pool_size = int(getenv('RPC_POOL_SIZE', rpc_pool_size))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def make_http_provider(url, request_kwargs):
+    """
+    HTTPProvider that posts reads through the retrying session and sends through the other.
+    web3 keeps its own session per thread, so every request is posted here instead, and the
+    confirm, gas price and keeper threads share the same pooled, retrying connections.
+    """
+    from web3 import Web3
+
+    class HTTPProvider(Web3.HTTPProvider):
+        # web3's http_retry_request middleware retries sends on timeouts and error statuses,
+        # so only get_session() decides what is retried
+        _middlewares = ()
+
+        def make_request(self, method, params):
+            response = get_session(sends=method in send_methods).post(
+                self.endpoint_uri, data=self.encode_rpc_request(method, params), **self.get_request_kwargs(),
+            )
+            response.raise_for_status()
+            return self.decode_rpc_response(response.content)
+
+    return HTTPProvider(url, request_kwargs=request_kwargs)
+
+
+def make_async_http_provider(url, timeout):
+    """
+    AsyncHTTPProvider with the same pool size and retry rules as get_session(): reads are
+    retried on connection errors, timeouts and retry_statuses, sends only when the connection
+    could not be opened. Each event loop gets its own aiohttp session; close() closes the
+    running loop's one.
+    """
+    import aiohttp
+    from web3 import AsyncWeb3
+
+    retries = int(getenv('RPC_RETRIES', rpc_retries))
+    backoff = float(getenv('RPC_BACKOFF', rpc_backoff))
+    pool_size = int(getenv('RPC_POOL_SIZE', rpc_pool_size))
+
+    class AsyncHTTPProvider(AsyncWeb3.AsyncHTTPProvider):
+        _middlewares = ()
+
+        def __init__(self, endpoint_uri):
+            super().__init__(endpoint_uri)
+            self._sessions = {}
+
+        def _session(self):
+            loop = asyncio.get_running_loop()
+            session = self._sessions.get(loop)
+            if session is None or session.closed:
+                session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit_per_host=pool_size),
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                )
+                self._sessions[loop] = session
+            return session
+
+        async def make_request(self, method, params):
+            sends = method in send_methods
+            data = self.encode_rpc_request(method, params)
+            for attempt in range(retries + 1):
+                last_attempt = attempt == retries
+                try:
+                    async with self._session().post(
+                        self.endpoint_uri, data=data, headers=self.get_request_headers(),
+                    ) as response:
+                        if sends or last_attempt or response.status not in retry_statuses:
+                            response.raise_for_status()
+                            return self.decode_rpc_response(await response.read())
+                except aiohttp.ClientResponseError:
+                    # The node answered with a status that is not worth retrying
+                    raise
+                except aiohttp.ClientConnectorError:
+                    if last_attempt:
+                        raise
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if sends or last_attempt:
+                        raise
+                await asyncio.sleep(backoff * 2 ** attempt)
+
+        async def close(self):
+            session = self._sessions.pop(asyncio.get_running_loop(), None)
+            if session is not None:
+                await session.close()
+
+    return AsyncHTTPProvider(url)
+
+
+def get_web3(network='galadriel'):
+    # Cached by URL, so a network name and its URL share one client
+    return _get_web3(rpc_url(network))
+
+
+@lru_cache(maxsize=None)
+def _get_web3(url):
+    from web3 import Web3
+    from metrics import rpc_metrics_middleware
+    request_kwargs = {'timeout': float(getenv('RPC_TIMEOUT', rpc_timeout))}
+    web3 = Web3(make_http_provider(url, request_kwargs))
+    web3.middleware_onion.add(rpc_metrics_middleware, 'rpc_metrics')
+    return web3
+
+
+@lru_cache(maxsize=None)
+def get_async_web3(network='galadriel'):
+    from web3 import AsyncWeb3
+    from metrics import async_rpc_metrics_middleware
+    web3 = AsyncWeb3(make_async_http_provider(rpc_url(network), float(getenv('RPC_TIMEOUT', rpc_timeout))))
+    web3.middleware_onion.add(async_rpc_metrics_middleware, 'rpc_metrics')
+    return web3
+
+
+@lru_cache(maxsize=None)
+def load_abi(path):
+    """Parsed ABI from a JSON file, relative to the repo root unless absolute."""
+    with open(os.path.join(repo_root, path)) as f:
+        abi = json.load(f)
+    # Hardhat artifacts wrap the ABI together with the bytecode
+    return abi['abi'] if isinstance(abi, dict) else abi
+
+
+@lru_cache(maxsize=None)
+def get_contract(network, address, abi_path):
+    from web3 import Web3
+    return get_web3(network).eth.contract(address=Web3.to_checksum_address(address), abi=load_abi(abi_path))
+
+
+def get_alpha_ensemble(address=None, network='galadriel'):
+    address = address or getenv('NEXT_PUBLIC_ALPHA_ENSEMBLE_ADDRESS')
+    return get_contract(network, address, 'frontend/contracts/AlphaEnsembleABI.json')
+
+
+def get_private_key():
+    return getenv('NEXT_PUBLIC_PRIVATE_KEY_GALADRIEL')
+
+
+@lru_cache(maxsize=None)
+def get_account(private_key=None):
+    return get_web3().eth.account.from_key(private_key or get_private_key())
+
+
+_submitters = {}
+_submitters_lock = threading.Lock()
+
+
+def get_submitter(network='galadriel', private_key=None):
+    """
+    One TxSubmitter per RPC endpoint and signer address, so every caller shares its nonce
+    tracking however it names the network or formats the key.
+    """
+    from tx_submitter import TxSubmitter
+    private_key = private_key or get_private_key()
+    key = (rpc_url(network), get_account(private_key).address)
+    with _submitters_lock:
+        if key not in _submitters:
+            _submitters[key] = TxSubmitter(get_web3(network), private_key, chain_id(network))
+        return _submitters[key]
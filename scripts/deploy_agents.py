@@ -1,71 +1,229 @@
-import time
-import json
-from web3 import Web3
-from pathlib import Path
 import os
-from dotenv import load_dotenv
-import websocket
-import threading
-
-# Load environment variables from frontend/.env.local
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '../frontend/.env.local'))
-
-# Initialize a Web3 instance for Galadriel testnet (to interact with AlphaEnsembleContract)
-galadriel_rpc_url = "https://devnet.galadriel.com/"
-galadriel_web3 = Web3(Web3.HTTPProvider(galadriel_rpc_url))
-
-# Load the ABI for AlphaEnsembleContract from the JSON file
-with open(os.path.join(os.path.dirname(__file__), "../frontend/contracts/AlphaEnsembleABI.json")) as f:
-    alpha_ensemble_abi = f.read()
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from web3.exceptions import TransactionNotFound
+from connections import get_account, get_alpha_ensemble, get_submitter, get_web3
 
-alpha_ensemble_address = os.getenv('NEXT_PUBLIC_ALPHA_ENSEMBLE_ADDRESS')
-alpha_ensemble_contract = galadriel_web3.eth.contract(address=alpha_ensemble_address, abi=alpha_ensemble_abi)
+# Headroom added on top of estimate_gas, agents deployed later write slightly more state
+gas_estimate_margin = 1.2
 
-private_key = os.getenv('NEXT_PUBLIC_PRIVATE_KEY_GALADRIEL')
-account = galadriel_web3.eth.account.from_key(private_key)
-chain_id = 696969  # Galadriel testnet chain ID
+# Longest to wait for a batch of deployments, stuck ones are reported instead of waited on
+confirm_timeout = 300  # seconds
 
 # Function to deploy 5 agents
 def deploy_agents(num_agents=5):
     try:
         for i in range(num_agents):
             strategy_details = f"Strategy for Agent {i+1}"
-            txn = alpha_ensemble_contract.functions.deployAgent(strategy_details).build_transaction({
-                'chainId': chain_id,
-                'gas': 3000000,  # Estimate the gas needed for deployment
-                'gasPrice': galadriel_web3.eth.gas_price,
-                'nonce': galadriel_web3.eth.get_transaction_count(account.address),
-            })
-
-            signed_txn = galadriel_web3.eth.account.sign_transaction(txn, private_key=private_key)
-            tx_hash = galadriel_web3.eth.send_raw_transaction(signed_txn.rawTransaction)
-            receipt = galadriel_web3.eth.wait_for_transaction_receipt(tx_hash)
-
-            print(f"Deployed Agent {i+1} with Tx: {tx_hash.hex()}, Status: {receipt['status']}")
-            time.sleep(10)  # Sleep to avoid nonce issues (optional)
+            get_submitter().submit(
+                get_alpha_ensemble().functions.deployAgent(strategy_details),
+                description=f"Deployed Agent {i+1}",
+            )
+
+        # Nonces are assigned locally, so all deployments can be mined together
+        if not get_submitter().wait_all(timeout=confirm_timeout):
+            print(f"Some agent deployments are still pending after {confirm_timeout}s")
     except Exception as e:
         print(f"Failed to deploy agents: {e}")
 
 def set_oracle_address(address):
     try:
-        txn = alpha_ensemble_contract.functions.setOracleAddress(address).build_transaction({
-            'chainId': chain_id,
-            'gas': 3000000,  # Estimate the gas needed for deployment
-            'gasPrice': galadriel_web3.eth.gas_price,
-            'nonce': galadriel_web3.eth.get_transaction_count(account.address),
-        })
-
-        signed_txn = galadriel_web3.eth.account.sign_transaction(txn, private_key=private_key)
-        tx_hash = galadriel_web3.eth.send_raw_transaction(signed_txn.rawTransaction)
-        receipt = galadriel_web3.eth.wait_for_transaction_receipt(tx_hash)
-
-        print(f"Set Oracle Address with Tx: {tx_hash.hex()}, Status: {receipt['status']}")
+        pending = get_submitter().submit(
+            get_alpha_ensemble().functions.setOracleAddress(address),
+            description="Set Oracle Address",
+        )
+        if pending.wait(timeout=confirm_timeout) is None:
+            print(f"Set Oracle Address not confirmed: {pending.error or 'still pending'}")
     except Exception as e:
         print(f"Failed to set Oracle address: {e}")
 
+def load_strategies(path):
+    # Either a JSON list (of strings or {"strategyDetails": ...} objects) or one strategy per line
+    with open(path) as f:
+        content = f.read()
+    if path.endswith('.json'):
+        return [entry['strategyDetails'] if isinstance(entry, dict) else entry for entry in json.loads(content)]
+    return [line.strip() for line in content.splitlines() if line.strip()]
+
+def estimate_deploy_gas(strategy_details):
+    estimate = get_alpha_ensemble().functions.deployAgent(strategy_details).estimate_gas({'from': get_account().address})
+    return int(estimate * gas_estimate_margin)
+
+def estimate_fleet_gas(entries, estimate_workers):
+    """Estimate every entry's deployment concurrently, recording a failed estimate on its entry."""
+    def estimate(entry):
+        try:
+            return estimate_deploy_gas(entry['strategyDetails'])
+        except Exception as e:
+            entry['error'] = f"gas estimate failed: {e}"
+            return None
+
+    with ThreadPoolExecutor(max_workers=estimate_workers) as pool:
+        gas_limits = list(pool.map(estimate, entries))
+    return [(entry, gas) for entry, gas in zip(entries, gas_limits) if gas is not None]
+
+def record_deployment(entry, receipt):
+    """Fill in an entry from its deployment receipt."""
+    entry['status'] = receipt['status']
+    entry['gasUsed'] = receipt['gasUsed']
+    if receipt['status'] != 1:
+        entry['error'] = "reverted"
+        return
+    events = get_alpha_ensemble().events.AgentContractDeployed().process_receipt(receipt)
+    if events:
+        entry['agentAddress'] = events[0]['args']['agentContractAddress']
+        entry['error'] = None
+    else:
+        entry['error'] = "no AgentContractDeployed event"
+
+def send_deployments(batch):
+    """Send every (entry, gas) deployment back-to-back, wait for them, and fill in the entries."""
+    deployments = []
+    for entry, gas in batch:
+        try:
+            pending = get_submitter().submit(
+                get_alpha_ensemble().functions.deployAgent(entry['strategyDetails']),
+                gas=gas,
+                description=f"Deployed Agent {entry['index']+1}",
+            )
+            entry['txHash'] = pending.tx_hash.hex()
+            deployments.append((entry, pending))
+        except Exception as e:
+            entry['error'] = f"submit failed: {e}"
+
+    get_submitter().wait_all(timeout=confirm_timeout)
+
+    for entry, pending in deployments:
+        receipt = pending.receipt
+        if receipt is not None:
+            record_deployment(entry, receipt)
+        elif pending.error in (None, 'timeout'):
+            # Not mined yet but may still be, so it is recorded with every hash it was sent
+            # under and reconciled on the next run instead of being deployed twice
+            entry['status'] = 'pending'
+            entry['txHash'] = pending.tx_hash.hex()
+            entry['txHashes'] = [tx_hash.hex() for tx_hash in pending.tx_hashes]
+        else:
+            entry['error'] = f"no receipt: {pending.error}"
+
+def reconcile_pending(entries):
+    """
+    Look up the receipts of deployments a previous run left pending. Those mined are filled
+    in, those the node still holds stay pending, and dropped ones are marked to be deployed.
+    """
+    web3 = get_web3()
+    for entry in entries:
+        tx_hashes = entry.get('txHashes') or [entry['txHash']]
+        receipt = None
+        for tx_hash in reversed(tx_hashes):
+            try:
+                receipt = web3.eth.get_transaction_receipt(tx_hash)
+                break
+            except TransactionNotFound:
+                continue
+        if receipt is not None:
+            entry['txHash'] = tx_hash
+            record_deployment(entry, receipt)
+            continue
+
+        in_mempool = False
+        for tx_hash in tx_hashes:
+            try:
+                web3.eth.get_transaction(tx_hash)
+                in_mempool = True
+                break
+            except TransactionNotFound:
+                continue
+        if not in_mempool:
+            print(f"Deployment of Agent {entry['index']+1} ({entry['txHash']}) was dropped, deploying it again")
+            entry.update(txHash=None, txHashes=None, status=None, error="dropped")
+
+def load_manifest(path, strategies):
+    """
+    The entries of a previous run's manifest, reused where the strategy at the same index is
+    unchanged, so agents already deployed or still pending are never deployed twice.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        previous = json.load(f)
+    return {
+        entry['index']: entry for entry in previous
+        if entry['index'] < len(strategies) and entry['strategyDetails'] == strategies[entry['index']]
+    }
+
+def deploy_fleet(strategies, manifest_path=None, estimate_workers=8):
+    """
+    Deploy one agent per strategy. Gas is estimated concurrently, every deployAgent tx is
+    sent back-to-back with sequential nonces, and receipts are collected as they land.
+    Returns (and optionally writes) a manifest with each agent's contract address, or the
+    error of every agent that could not be deployed. Deployments still unmined at the deadline
+    are recorded as pending; rerunning with the same manifest reconciles them against their
+    receipts and only deploys the agents that have no deployment mined or in flight.
+    """
+    previous = load_manifest(manifest_path, strategies)
+    manifest = [
+        previous.get(i) or {
+            'index': i,
+            'strategyDetails': strategy_details,
+            'txHash': None,
+            'txHashes': None,
+            'status': None,
+            'gasUsed': None,
+            'agentAddress': None,
+            'error': None,
+        }
+        for i, strategy_details in enumerate(strategies)
+    ]
+    pending = [entry for entry in manifest if entry['status'] == 'pending']
+    if pending:
+        print(f"Reconciling {len(pending)} deployments left pending by the previous run")
+        reconcile_pending(pending)
+
+    to_deploy = [entry for entry in manifest if entry['agentAddress'] is None and entry['status'] != 'pending']
+    if len(to_deploy) < len(manifest):
+        print(f"Skipping {len(manifest) - len(to_deploy)} agents already deployed or pending in {manifest_path}")
+    for entry in to_deploy:
+        entry.update(txHash=None, txHashes=None, status=None, gasUsed=None, error=None)
+    send_deployments(estimate_fleet_gas(to_deploy, estimate_workers))
+
+    # Every estimate ran against the state before the fleet, so a deployment can revert once the
+    # earlier ones landed. Re-estimate those against the current state and send them once more.
+    reverted = [entry for entry in manifest if entry['status'] == 0]
+    if reverted:
+        print(f"Retrying {len(reverted)} reverted deployments with fresh gas estimates")
+        for entry in reverted:
+            entry.update(txHash=None, txHashes=None, status=None, gasUsed=None, error=None)
+        send_deployments(estimate_fleet_gas(reverted, estimate_workers))
+
+    failed = [entry for entry in manifest if entry['error'] is not None]
+    for entry in failed:
+        print(f"Failed to deploy Agent {entry['index']+1}: {entry['error']}")
+    pending = [entry for entry in manifest if entry['status'] == 'pending']
+    for entry in pending:
+        print(f"Deployment of Agent {entry['index']+1} still pending: {entry['txHash']}")
+    deployed = len(manifest) - len(failed) - len(pending)
+    print(f"Deployed {deployed} of {len(manifest)} agents" + (", rerun to reconcile the pending ones" if pending else ""))
+
+    if manifest_path:
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        print(f"Wrote manifest for {len(manifest)} agents to {manifest_path}")
+    return manifest
+
 if __name__ == "__main__":
-    # Deploy 5 agents
-    deploy_agents(num_agents=5)
+    parser = argparse.ArgumentParser(description="Deploy agents to the AlphaEnsemble contract")
+    parser.add_argument('--strategies', help="JSON list or text file with one strategy per agent")
+    parser.add_argument('--manifest', default='agents_manifest.json', help="Where to write the deployed agent addresses")
+    parser.add_argument('--num-agents', type=int, default=5, help="Agents to deploy when no strategy file is given")
+    args = parser.parse_args()
+
+    if args.strategies:
+        deploy_fleet(load_strategies(args.strategies), manifest_path=args.manifest)
+    else:
+        # Deploy 5 agents
+        deploy_agents(num_agents=args.num_agents)
 
     # Set Oracle address
     set_oracle_address("0x0352b37E5680E324E804B5A6e1AddF0A064E201D")
@@ -0,0 +1,346 @@
+import argparse
+import sqlite3
+import time
+from eth_utils import encode_hex, event_abi_to_log_topic
+from connections import get_alpha_ensemble, get_web3, load_abi
+
+# Backfills and tails AlphaEnsemble and Agent events into SQLite, so dashboards and analysis
+# can read positions, PnL and price history without per-agent RPC calls.
+#
+#   python scripts/event_indexer.py --db events.sqlite --from-block 0
+#   python scripts/event_indexer.py --db events.sqlite --pnl 3
+
+agent_abi_path = 'frontend/contracts/AgentABI.json'
+
+ensemble_events = ('AgentContractDeployed', 'AssetPricesUpdated')
+agent_events = ('PositionsUpdated', 'PnLUpdated', 'OracleResponseCallback')
+
+# Blocks per eth_getLogs request, halved when a node rejects a range as too large
+default_batch_size = 2000
+
+# Blocks behind the head that are indexed; anything newer may still be reorged
+default_confirmations = 2
+
+# How many block hashes are kept to find the common ancestor after a reorg
+checkpoint_history = 256
+
+schema = """
+CREATE TABLE IF NOT EXISTS checkpoints (block_number INTEGER PRIMARY KEY, block_hash TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS blocks (block_number INTEGER PRIMARY KEY, timestamp INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS agents (address TEXT PRIMARY KEY, agent_id INTEGER NOT NULL, block_number INTEGER);
+CREATE TABLE IF NOT EXISTS asset_prices (
+    block_number INTEGER NOT NULL, log_index INTEGER NOT NULL, tx_hash TEXT NOT NULL,
+    asset TEXT NOT NULL, price INTEGER NOT NULL,
+    PRIMARY KEY (block_number, log_index, asset)
+);
+CREATE TABLE IF NOT EXISTS positions (
+    block_number INTEGER NOT NULL, log_index INTEGER NOT NULL, tx_hash TEXT NOT NULL,
+    agent_id INTEGER NOT NULL, asset TEXT NOT NULL, position INTEGER NOT NULL,
+    PRIMARY KEY (block_number, log_index, asset)
+);
+CREATE TABLE IF NOT EXISTS pnl (
+    block_number INTEGER NOT NULL, log_index INTEGER NOT NULL, tx_hash TEXT NOT NULL,
+    agent_id INTEGER NOT NULL, pnl INTEGER NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE TABLE IF NOT EXISTS oracle_responses (
+    block_number INTEGER NOT NULL, log_index INTEGER NOT NULL, tx_hash TEXT NOT NULL,
+    agent_id INTEGER NOT NULL, response TEXT NOT NULL, error_message TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS pnl_by_agent ON pnl (agent_id, block_number);
+CREATE INDEX IF NOT EXISTS positions_by_agent ON positions (agent_id, block_number);
+CREATE INDEX IF NOT EXISTS asset_prices_by_asset ON asset_prices (asset, block_number);
+"""
+
+event_tables = ('asset_prices', 'positions', 'pnl', 'oracle_responses', 'blocks')
+
+
+def sqlite_int(value):
+    # SQLite integers are 64-bit; the rare larger int256 value is stored as an (approximate) float
+    return value if -2**63 <= value < 2**63 else float(value)
+
+
+class EventStore:
+    """SQLite store for indexed events, with the queries dashboards need."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(schema)
+
+    # Checkpoints
+
+    def last_checkpoint(self):
+        return self.db.execute(
+            "SELECT block_number, block_hash FROM checkpoints ORDER BY block_number DESC LIMIT 1"
+        ).fetchone()
+
+    def checkpoints(self):
+        return self.db.execute("SELECT block_number, block_hash FROM checkpoints ORDER BY block_number DESC").fetchall()
+
+    def rewind(self, block_number):
+        """Drop everything indexed after block_number (used after a reorg)."""
+        with self.db:
+            for table in event_tables:
+                self.db.execute(f"DELETE FROM {table} WHERE block_number > ?", (block_number,))
+            self.db.execute("DELETE FROM agents WHERE block_number > ?", (block_number,))
+            self.db.execute("DELETE FROM checkpoints WHERE block_number > ?", (block_number,))
+
+    # Queries
+
+    def agents(self):
+        """Known agents as {address: agent_id}."""
+        return dict(self.db.execute("SELECT address, agent_id FROM agents ORDER BY agent_id"))
+
+    def pnl_series(self, agent_id, from_block=None, to_block=None):
+        """PnL updates for one agent as (block_number, timestamp, pnl) tuples, oldest first."""
+        return self.db.execute(
+            """
+            SELECT p.block_number, b.timestamp, p.pnl FROM pnl p
+            LEFT JOIN blocks b ON b.block_number = p.block_number
+            WHERE p.agent_id = ? AND p.block_number >= ? AND p.block_number <= ?
+            ORDER BY p.block_number, p.log_index
+            """,
+            (agent_id, from_block or 0, to_block if to_block is not None else 2**62),
+        ).fetchall()
+
+    def latest_pnl(self):
+        """Latest PnL of every agent as {agent_id: pnl}."""
+        return dict(self.db.execute(
+            """
+            SELECT agent_id, pnl FROM pnl p
+            WHERE (block_number, log_index) = (
+                SELECT block_number, log_index FROM pnl WHERE agent_id = p.agent_id
+                ORDER BY block_number DESC, log_index DESC LIMIT 1
+            )
+            """
+        ))
+
+    def positions_at(self, agent_id, block_number=None):
+        """An agent's latest position per asset as of block_number (default: latest)."""
+        return dict(self.db.execute(
+            """
+            SELECT asset, position FROM positions p
+            WHERE agent_id = ? AND block_number <= ? AND (block_number, log_index) = (
+                SELECT block_number, log_index FROM positions
+                WHERE agent_id = p.agent_id AND asset = p.asset AND block_number <= ?
+                ORDER BY block_number DESC, log_index DESC LIMIT 1
+            )
+            """,
+            (agent_id, block_number if block_number is not None else 2**62,
+             block_number if block_number is not None else 2**62),
+        ))
+
+    def price_series(self, asset, from_block=None, to_block=None):
+        """Price updates for one asset as (block_number, timestamp, price) tuples, oldest first."""
+        return self.db.execute(
+            """
+            SELECT a.block_number, b.timestamp, a.price FROM asset_prices a
+            LEFT JOIN blocks b ON b.block_number = a.block_number
+            WHERE a.asset = ? AND a.block_number >= ? AND a.block_number <= ?
+            ORDER BY a.block_number, a.log_index
+            """,
+            (asset, from_block or 0, to_block if to_block is not None else 2**62),
+        ).fetchall()
+
+
+class EventIndexer:
+    """
+    Indexes ensemble and agent events with eth_getLogs over block ranges. Each batch is
+    written together with a checkpoint (block number and hash) in one SQLite transaction.
+    Before indexing further the last checkpoint is compared with the chain; on a mismatch
+    the store is rewound to the newest checkpoint that is still canonical.
+    """
+
+    def __init__(self, web3, ensemble, store, start_block=0, batch_size=default_batch_size,
+                 confirmations=default_confirmations):
+        self.web3 = web3
+        self.ensemble = ensemble
+        self.agent = web3.eth.contract(abi=load_abi(agent_abi_path))
+        self.store = store
+        self.start_block = start_block
+        self.batch_size = batch_size
+        self.confirmations = confirmations
+
+        self.topics = {}
+        for contract, names in ((ensemble, ensemble_events), (self.agent, agent_events)):
+            for name in names:
+                event = getattr(contract.events, name)()
+                self.topics[event_abi_to_log_topic(event.abi)] = event
+
+        self.agents = store.agents()
+        if not self.agents:
+            # Agents deployed before start_block never show up in the indexed range
+            for agent_id, address in enumerate(ensemble.functions.getAgentContracts().call()):
+                self.agents[address] = agent_id
+            with store.db:
+                store.db.executemany(
+                    "INSERT OR IGNORE INTO agents (address, agent_id, block_number) VALUES (?, ?, NULL)",
+                    self.agents.items(),
+                )
+
+    def next_block(self):
+        checkpoint = self.store.last_checkpoint()
+        return self.start_block if checkpoint is None else checkpoint[0] + 1
+
+    def check_reorg(self):
+        """Rewind to the newest checkpoint still on the canonical chain. Returns True if a reorg was found."""
+        checkpoint = self.store.last_checkpoint()
+        if checkpoint is None or self._block_hash(checkpoint[0]) == checkpoint[1]:
+            return False
+
+        for block_number, block_hash in self.store.checkpoints():
+            if self._block_hash(block_number) == block_hash:
+                print(f"Reorg detected, rewinding to block {block_number}")
+                self.store.rewind(block_number)
+                break
+        else:
+            print(f"Reorg deeper than {checkpoint_history} checkpoints, rewinding to block {self.start_block}")
+            self.store.rewind(self.start_block - 1)
+        self.agents = self.store.agents()
+        return True
+
+    def index_to(self, head):
+        """Index every block from the last checkpoint up to head."""
+        start = self.next_block()
+        while start <= head:
+            end = min(start + self.batch_size - 1, head)
+            try:
+                logs = self._get_logs(start, end, list(self.ensemble_and_agents()))
+            except ValueError as e:
+                # Nodes cap the size of a getLogs response, retry with a smaller range
+                if self.batch_size == 1:
+                    raise
+                self.batch_size = max(1, self.batch_size // 2)
+                print(f"getLogs for {start}-{end} failed ({e}), batch size now {self.batch_size}")
+                continue
+            self._store_batch(start, end, logs)
+            start = end + 1
+
+    def ensemble_and_agents(self):
+        yield self.ensemble.address
+        yield from self.agents
+
+    def run(self, poll_interval=5):
+        """Backfill, then keep tailing the chain."""
+        while True:
+            try:
+                self.check_reorg()
+                head = self.web3.eth.block_number - self.confirmations
+                self.index_to(head)
+            except Exception as e:
+                print(f"Indexing failed: {e}")
+            time.sleep(poll_interval)
+
+    def _get_logs(self, start, end, addresses):
+        return self.web3.eth.get_logs({
+            'fromBlock': start,
+            'toBlock': end,
+            'address': addresses,
+            'topics': [[encode_hex(topic) for topic in self.topics]],
+        })
+
+    def _get_block(self, block_number, cache=None):
+        """eth_getBlock, looked up in cache first and stored there when one is given."""
+        if cache is None:
+            return self.web3.eth.get_block(block_number)
+        if block_number not in cache:
+            cache[block_number] = self.web3.eth.get_block(block_number)
+        return cache[block_number]
+
+    def _block_hash(self, block_number, cache=None):
+        return self._get_block(block_number, cache)['hash'].hex()
+
+    def _store_batch(self, start, end, logs):
+        # Agents deployed inside this range were not in the address filter yet: fetch their logs too
+        new_agents = {}
+        for log in logs:
+            event = self.topics.get(log['topics'][0])
+            if event is not None and event.event_name == 'AgentContractDeployed' and log['address'] == self.ensemble.address:
+                address = event.process_log(log)['args']['agentContractAddress']
+                if address not in self.agents and address not in new_agents:
+                    new_agents[address] = (len(self.agents) + len(new_agents), log['blockNumber'])
+        if new_agents:
+            logs = logs + self._get_logs(start, end, list(new_agents))
+            logs.sort(key=lambda log: (log['blockNumber'], log['logIndex']))
+
+        agents = dict(self.agents)
+        agents.update({address: agent_id for address, (agent_id, _) in new_agents.items()})
+        rows = {table: [] for table in event_tables}
+        for log in logs:
+            event = self.topics.get(log['topics'][0])
+            if event is None or (log['address'] != self.ensemble.address and log['address'] not in agents):
+                continue
+            self._rows(event.process_log(log), agents, rows)
+
+        # Timestamps for the blocks that had events. Every block is fetched once per batch, even
+        # with many events in it, and the checkpoint reuses the last one when it had events too
+        block_cache = {}
+        blocks = {row[0] for table in ('asset_prices', 'positions', 'pnl', 'oracle_responses') for row in rows[table]}
+        rows['blocks'] = [(block, self._get_block(block, block_cache)['timestamp']) for block in sorted(blocks)]
+
+        end_hash = self._block_hash(end, block_cache)
+        with self.store.db as db:
+            db.executemany(
+                "INSERT OR IGNORE INTO agents (address, agent_id, block_number) VALUES (?, ?, ?)",
+                [(address, agent_id, block) for address, (agent_id, block) in new_agents.items()],
+            )
+            db.executemany("INSERT OR REPLACE INTO asset_prices VALUES (?, ?, ?, ?, ?)", rows['asset_prices'])
+            db.executemany("INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?, ?, ?)", rows['positions'])
+            db.executemany("INSERT OR REPLACE INTO pnl VALUES (?, ?, ?, ?, ?)", rows['pnl'])
+            db.executemany("INSERT OR REPLACE INTO oracle_responses VALUES (?, ?, ?, ?, ?, ?)", rows['oracle_responses'])
+            db.executemany("INSERT OR REPLACE INTO blocks VALUES (?, ?)", rows['blocks'])
+            db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?)", (end, end_hash))
+            db.execute(
+                "DELETE FROM checkpoints WHERE block_number NOT IN "
+                "(SELECT block_number FROM checkpoints ORDER BY block_number DESC LIMIT ?)",
+                (checkpoint_history,),
+            )
+        self.agents = agents
+
+    def _rows(self, event, agents, rows):
+        args = event['args']
+        key = (event['blockNumber'], event['logIndex'], event['transactionHash'].hex())
+        if event['event'] == 'AssetPricesUpdated':
+            rows['asset_prices'] += [key + (asset, sqlite_int(price)) for asset, price in zip(args['assets'], args['prices'])]
+        elif event['event'] == 'PositionsUpdated':
+            # Agents emit their own ID, but the deployment order is authoritative
+            agent_id = agents.get(event['address'], args['agentId'])
+            rows['positions'] += [
+                key + (agent_id, asset, sqlite_int(position)) for asset, position in zip(args['assets'], args['positions'])
+            ]
+        elif event['event'] == 'PnLUpdated':
+            rows['pnl'].append(key + (agents.get(event['address'], args['agentId']), sqlite_int(args['pnl'])))
+        elif event['event'] == 'OracleResponseCallback':
+            rows['oracle_responses'].append(
+                key + (agents.get(event['address'], args['agentId']), args['response'], args['errorMessage'])
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index AlphaEnsemble and Agent events into SQLite")
+    parser.add_argument('--db', default='events.sqlite', help="SQLite database file")
+    parser.add_argument('--from-block', type=int, default=0, help="First block to index")
+    parser.add_argument('--batch-size', type=int, default=default_batch_size, help="Blocks per eth_getLogs request")
+    parser.add_argument('--confirmations', type=int, default=default_confirmations, help="Blocks to stay behind the head")
+    parser.add_argument('--poll-interval', type=float, default=5, help="Seconds between polls when tailing")
+    parser.add_argument('--once', action='store_true', help="Backfill up to the current head and exit")
+    parser.add_argument('--pnl', type=int, metavar='AGENT_ID', help="Print an agent's PnL series from the database and exit")
+    args = parser.parse_args()
+
+    store = EventStore(args.db)
+    if args.pnl is not None:
+        for block_number, timestamp, pnl in store.pnl_series(args.pnl):
+            print(f"{block_number}\t{timestamp}\t{pnl}")
+        raise SystemExit(0)
+
+    web3 = get_web3()
+    indexer = EventIndexer(
+        web3, get_alpha_ensemble(), store,
+        start_block=args.from_block, batch_size=args.batch_size, confirmations=args.confirmations,
+    )
+    if args.once:
+        indexer.check_reorg()
+        indexer.index_to(web3.eth.block_number - args.confirmations)
+    else:
+        indexer.run(poll_interval=args.poll_interval)
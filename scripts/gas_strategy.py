@@ -0,0 +1,249 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+from functools import lru_cache
+
+
+def method_key(contract_function):
+    """History key for a contract call: the target address and function name."""
+    return getattr(contract_function, 'address', None), getattr(contract_function, 'fn_name', 'constructor')
+
+
+def call_size(contract_function):
+    """
+    Total length of the call's list, string and bytes arguments, e.g. 2 * assets for
+    setAssetPrices(assets, prices). Calls of one method that differ in size differ in gas.
+    """
+    def size(value):
+        if isinstance(value, (str, bytes)):
+            return len(value)
+        if isinstance(value, (list, tuple)):
+            return len(value) + sum(size(item) for item in value)
+        return 0
+
+    args = list(getattr(contract_function, 'args', None) or ())
+    args += list((getattr(contract_function, 'kwargs', None) or {}).values())
+    return sum(size(arg) for arg in args)
+
+
+def ran_out_of_gas(receipt, gas):
+    """
+    Whether a failed receipt ran out of gas. An out-of-gas inside a nested call reverts the
+    outer call with up to 1/64 of the limit left unused (EIP-150), so using 63/64 counts.
+    """
+    return gas is not None and receipt['gasUsed'] >= gas * 63 // 64
+
+
+class GasPriceFeed:
+    """
+    eth_gasPrice cached for ttl seconds. With background=True a daemon thread refreshes it
+    before it expires, so reading the price never waits on a round trip. The thread runs from
+    the first start() until every start() has been matched by a close().
+    """
+
+    def __init__(self, web3, ttl=5, background=True):
+        self.web3 = web3
+        self.ttl = ttl
+        self.background = background
+        self._gas_price = None
+        self._gas_price_at = 0.0
+        self._lock = threading.Lock()
+        self._users = 0
+        self._stop = None
+        self._refresh_thread = None
+
+    def start(self):
+        with self._lock:
+            self._users += 1
+            if not self.background or self._refresh_thread is not None:
+                return
+            # Each thread gets its own stop event, so a restart never revives a stopping thread
+            self._stop = threading.Event()
+            self._refresh_thread = threading.Thread(target=self._refresh_loop, args=(self._stop,), daemon=True)
+            self._refresh_thread.start()
+
+    def cached(self):
+        with self._lock:
+            if self._gas_price is not None and time.time() - self._gas_price_at < self.ttl:
+                return self._gas_price
+        return None
+
+    def gas_price(self):
+        # Stale or never fetched (e.g. the refresh thread is failing): fetch inline
+        gas_price = self.cached()
+        return gas_price if gas_price is not None else self.refresh()
+
+    def refresh(self):
+        gas_price = self.web3.eth.gas_price
+        self._store(gas_price)
+        return gas_price
+
+    def close(self):
+        with self._lock:
+            self._users = max(self._users - 1, 0)
+            if self._users or self._refresh_thread is None:
+                return
+            stop, thread = self._stop, self._refresh_thread
+            self._refresh_thread = None
+        stop.set()
+        thread.join()
+
+    def _store(self, gas_price):
+        with self._lock:
+            self._gas_price = gas_price
+            self._gas_price_at = time.time()
+
+    def _refresh_loop(self, stop):
+        while not stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Failed to refresh gas price: {e}")
+            # Refresh before the cached value expires so callers never see it stale
+            stop.wait(self.ttl * 0.8)
+
+
+@lru_cache(maxsize=None)
+def gas_price_feed(web3, ttl=5):
+    """
+    The shared feed of a client, so every submitter on it polls eth_gasPrice from one thread,
+    which stops once the last of them is closed.
+    """
+    return GasPriceFeed(web3, ttl)
+
+
+class GasStrategy:
+    """
+    Gas price and gas limits for one chain. The gas price comes from the client's shared
+    GasPriceFeed. Gas limits come from the gasUsed of recent receipts for the same method
+    (the largest, times margin) when a call at least as large has been seen, and from
+    estimate_gas until min_samples receipts are in or when the call is larger than any
+    seen so far, e.g. the first price push for all assets after pushes for one.
+    """
+
+    def __init__(self, web3, ttl=5, margin=1.2, history=20, min_samples=3, max_gas=None, background=True, prices=None):
+        self.web3 = web3
+        self.margin = margin
+        self.min_samples = min_samples
+        self.max_gas = max_gas
+        if prices is None:
+            prices = gas_price_feed(web3, ttl) if background else GasPriceFeed(web3, ttl, background=False)
+        self.prices = prices
+        self._gas_used = defaultdict(lambda: deque(maxlen=history))  # method -> (size, gasUsed)
+        self._lock = threading.Lock()
+
+    def gas_price(self):
+        return self.prices.gas_price()
+
+    def refresh(self):
+        return self.prices.refresh()
+
+    def start(self):
+        self.prices.start()
+
+    def limit_from_history(self, contract_function):
+        """Learned limit for the call, or None when it has to be estimated."""
+        size = call_size(contract_function)
+        with self._lock:
+            history = list(self._gas_used[method_key(contract_function)])
+        if len(history) < self.min_samples or size > max(seen for seen, _ in history):
+            return None
+        return max(gas_used for _, gas_used in history) * self.margin
+
+    def gas_limit(self, contract_function, sender):
+        gas = self.limit_from_history(contract_function)
+        if gas is None:
+            gas = contract_function.estimate_gas({'from': sender}) * self.margin
+        return self._cap(gas)
+
+    def record(self, key, gas_used, size=0):
+        with self._lock:
+            self._gas_used[key].append((size, gas_used))
+
+    def on_receipt(self, key, gas, receipt, size=0):
+        """Feed a receipt back into the history; a tx that ran out of gas doubles the next limit."""
+        if receipt['status'] == 1:
+            self.record(key, receipt['gasUsed'], size)
+        elif ran_out_of_gas(receipt, gas):
+            self.record(key, gas * 2, size)
+
+    def close(self):
+        # The price feed is shared with every other strategy on the same client and only
+        # stops refreshing once all of them are closed
+        self.prices.close()
+
+    def _cap(self, gas):
+        gas = int(gas)
+        return min(gas, self.max_gas) if self.max_gas else gas
+
+
+class AsyncGasPriceFeed(GasPriceFeed):
+    """
+    GasPriceFeed for AsyncWeb3 clients, refreshed by one task on the running event loop for
+    as long as any strategy using it is started.
+    """
+
+    def __init__(self, web3, ttl=5):
+        super().__init__(web3, ttl, background=False)
+        self._refresh_task = None
+
+    def start(self):
+        self._users += 1
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def gas_price(self):
+        gas_price = self.cached()
+        return gas_price if gas_price is not None else await self.refresh()
+
+    async def refresh(self):
+        gas_price = await self.web3.eth.gas_price
+        self._store(gas_price)
+        return gas_price
+
+    async def close(self):
+        self._users = max(self._users - 1, 0)
+        if self._users or self._refresh_task is None:
+            return
+        self._refresh_task.cancel()
+        try:
+            await self._refresh_task
+        except asyncio.CancelledError:
+            pass
+        self._refresh_task = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Failed to refresh gas price: {e}")
+            await asyncio.sleep(self.ttl * 0.8)
+
+
+@lru_cache(maxsize=None)
+def async_gas_price_feed(web3, ttl=5):
+    return AsyncGasPriceFeed(web3, ttl)
+
+
+class AsyncGasStrategy(GasStrategy):
+    """GasStrategy for AsyncWeb3 clients, using the client's shared AsyncGasPriceFeed."""
+
+    def __init__(self, web3, ttl=5, margin=1.2, history=20, min_samples=3, max_gas=None):
+        super().__init__(web3, ttl, margin, history, min_samples, max_gas, prices=async_gas_price_feed(web3, ttl))
+
+    async def gas_price(self):
+        return await self.prices.gas_price()
+
+    async def refresh(self):
+        return await self.prices.refresh()
+
+    async def gas_limit(self, contract_function, sender):
+        gas = self.limit_from_history(contract_function)
+        if gas is None:
+            gas = await contract_function.estimate_gas({'from': sender}) * self.margin
+        return self._cap(gas)
+
+    async def close(self):
+        await self.prices.close()
@@ -0,0 +1,355 @@
+import argparse
+import json
+import threading
+import time
+from connections import get_contract, get_private_key, get_submitter, get_web3, getenv, load_abi
+from llm_run_cache import AgentResponses, LlmRunCache, contiguous_ranges
+from metrics import start_exporter, tick_to_tx, ticks_received
+from multicall import multicall
+from push_scheduler import DeviationPushScheduler
+from price_store import PriceStore, binance_combined_stream_url, fetch_binance_snapshot, iter_ticks, loads, subscribe_message
+from shard_scheduler import ShardScheduler
+from ws_supervisor import WebSocketSupervisor
+
+# Runs the keepers of many AlphaEnsemble contracts from one process. A single Binance
+# connection feeds one PriceStore covering every ensemble's symbols, and each tick is fanned
+# out to the push schedulers of the ensembles that trade it. Each ensemble then pushes prices
+# and starts agent runs from its own thread, signing through the shared submitter for its
+# network and key, so ensembles with different signers never share nonces and ensembles with
+# the same signer never race on them.
+#
+# See config/keeper_daemon.example.json for the config format.
+
+alpha_ensemble_abi_path = 'frontend/contracts/AlphaEnsembleABI.json'
+agent_abi_path = 'frontend/contracts/AgentABI.json'
+
+# Defaults for every ensemble, overridable per ensemble in the config
+ensemble_defaults = {
+    'network': 'galadriel',
+    'private_key_env': None,  # name of the env variable holding the signer's key, None for the default key
+    'assets': None,  # None reads getAssetKeys() from the contract
+    'quote': 'USDT',
+    'deviation_bps': 25,
+    'asset_deviation_bps': {},
+    'heartbeat': 60,  # seconds
+    'llm_update_interval': 60,  # seconds
+    'llm_run_cache_ttl': 600,  # seconds
+    'llm_response_timeout': 300,  # seconds to wait for the oracle before an agent is run again
+    'llm_price_step_bps': 10,
+    'gas_budget': 8000000,
+}
+
+binance_stream_type = 'miniTicker'
+price_max_age = 30  # seconds without a tick before a symbol is left out of pushes
+
+
+def fresh_prices(price_store, push_scheduler, symbol_prices):
+    """
+    The entries of symbol_prices that may be written on-chain: tracked, positive and not
+    stale. Stale ones are marked as pushed so their heartbeat does not keep them due, and
+    their next fresh tick makes them due again.
+    """
+    fresh = price_store.fresh(symbol_prices, price_max_age)
+    stale = {symbol: price for symbol, price in symbol_prices.items() if symbol not in fresh}
+    if stale:
+        push_scheduler.mark_pushed(stale)
+    return fresh
+
+
+def agent_run_input_calls(ensemble, agents):
+    """The reads behind every agent's LLM query, for one multicall: prices, positions and strategies."""
+    calls = [ensemble.functions.getAssetPrices()]
+    calls += [agent.functions.getPositionsRaw() for agent in agents]
+    calls += [agent.functions.getStrategyDetails() for agent in agents]
+    return calls
+
+
+def agent_run_inputs(results, agent_count):
+    """Split the multicall results of agent_run_input_calls into (prices, positions, strategies)."""
+    failed = [result.error for result in results if not result.success]
+    if failed:
+        raise RuntimeError(f"could not read agent state: {failed[0]}")
+
+    values = [result.value for result in results]
+    return values[0], values[1:agent_count + 1], values[agent_count + 1:]
+
+
+class BaseEnsembleKeeper:
+    """
+    The decisions of one AlphaEnsemble's keeper, shared by EnsembleKeeper and the asyncio
+    keeper, which only add the contract calls: which prices to push and what to do when the
+    push fails, and which agents to run and what to do when their shards land or are abandoned.
+    """
+
+    def __init__(self, config, price_store=None):
+        self.config = dict(ensemble_defaults, **config)
+        self.name = self.config.get('name') or self.config['address']
+        self.network = self.config['network']
+        self.price_store = price_store
+        self.symbols = {}
+        self.push_scheduler = None
+        self.llm_run_cache = LlmRunCache(
+            ttl=self.config['llm_run_cache_ttl'], price_step_bps=self.config['llm_price_step_bps'],
+            response_timeout=self.config['llm_response_timeout'],
+        )
+        # Refreshed on every LLM cycle, so price pushes never wait on a getAgentCount() call
+        self.agent_count = None
+
+    def private_key(self):
+        private_key = getenv(self.config['private_key_env']) if self.config['private_key_env'] else get_private_key()
+        if not private_key:
+            raise ValueError(f"No private key for ensemble {self.name} in {self.config['private_key_env']}")
+        return private_key
+
+    def track_assets(self, assets):
+        """Schedule pushes for the assets, the configured ones or else the contract's getAssetKeys()."""
+        quote = self.config['quote']
+        self.symbols = {f"{asset}{quote}".upper(): asset for asset in assets}
+        self.push_scheduler = DeviationPushScheduler(
+            list(self.symbols),
+            deviation_bps=self.config['deviation_bps'],
+            heartbeat=self.config['heartbeat'],
+            asset_deviation_bps={f"{asset}{quote}".upper(): bps for asset, bps in self.config['asset_deviation_bps'].items()},
+        )
+
+    def prices_to_push(self, symbol_prices):
+        """The fresh entries of symbol_prices, marked as pushed."""
+        # Never write a missing, zero or stale price on-chain
+        symbol_prices = fresh_prices(self.price_store, self.push_scheduler, symbol_prices)
+        # Mark as pushed right away so ticks arriving while the tx is pending do not resend it
+        if symbol_prices:
+            self.push_scheduler.mark_pushed(symbol_prices)
+        return symbol_prices
+
+    def price_update(self, symbol_prices):
+        """setAssetPrices arguments and callbacks; a push that fails makes its prices due again."""
+        assets = [self.symbols[symbol] for symbol in symbol_prices]
+        prices = [int(price * 1e8) for price in symbol_prices.values()]
+
+        def on_receipt(receipt):
+            if receipt['status'] != 1:
+                self.push_scheduler.reset(symbol_prices.keys())
+
+        def on_error(error):
+            self.push_scheduler.reset(symbol_prices.keys())
+
+        return (assets, prices), {
+            'description': f"Updated {len(assets)} prices on {self.name}",
+            'on_receipt': on_receipt,
+            'on_error': on_error,
+        }
+
+    def prices_sent(self, symbol_prices):
+        newest_tick = max(self.price_store.timestamp(symbol) for symbol in symbol_prices) / 1000
+        tick_to_tx.observe(max(time.time() - newest_tick, 0))
+
+    def price_push_failed(self, symbol_prices, error):
+        self.push_scheduler.reset(symbol_prices.keys())
+        print(f"Failed to update prices on {self.name}: {error}")
+
+    def plan_agent_runs(self, prices, positions, strategies):
+        """
+        The agents to run as (agent count, [from, to) ranges, shard callbacks). They are pending
+        in the run cache from here on, so the next cycle does not start them a second time.
+        """
+        fingerprints, due = self.llm_run_cache.due_runs(prices, positions, strategies)
+        for agent_id in due:
+            self.llm_run_cache.dispatch(agent_id, fingerprints[agent_id])
+
+        # Runs are cached once the oracle answers them; the wait for it starts when they land
+        def on_success(start, end):
+            for agent_id in range(start, end):
+                self.llm_run_cache.dispatch(agent_id, fingerprints[agent_id])
+
+        # Agents whose run was never started are due again on the next cycle
+        def on_abandoned(start, end):
+            for agent_id in range(start, end):
+                self.llm_run_cache.cancel(agent_id)
+
+        stats = self.llm_run_cache.stats()
+        print(f"{self.name}: {len(due)} of {len(fingerprints)} agents due, cache hit rate {stats['hit_rate']:.0%}")
+        return len(fingerprints), contiguous_ranges(due), {'on_success': on_success, 'on_abandoned': on_abandoned}
+
+    def agent_runs_failed(self, ranges):
+        # Shards sent before the failure are dispatched again by on_success when they land
+        for start, end in ranges:
+            for agent_id in range(start, end):
+                self.llm_run_cache.cancel(agent_id)
+
+
+class EnsembleKeeper(BaseEnsembleKeeper):
+    """
+    Price pushes and agent runs for one AlphaEnsemble, fed by the shared price store.
+    private_key overrides the configured signer, e.g. a funded account on a local node.
+    """
+
+    def __init__(self, config, price_store=None, private_key=None):
+        super().__init__(config, price_store)
+        self.contract = get_contract(self.network, self.config['address'], alpha_ensemble_abi_path)
+        self.submitter = get_submitter(self.network, private_key or self.private_key())
+        self.shard_scheduler = ShardScheduler(self.submitter, gas_budget=self.config['gas_budget'])
+        # Push exactly the assets the contract knows, unless the config narrows them down
+        self.track_assets(self.config['assets'] or self.contract.functions.getAssetKeys().call())
+        self.agent_responses = AgentResponses(get_web3(self.network), load_abi(agent_abi_path), self.llm_run_cache)
+
+    def run(self, stop):
+        next_llm_update = time.time() + self.config['llm_update_interval']
+        while not stop.is_set():
+            # Wake at least once a second so a stop request is noticed
+            wait = min(max(next_llm_update - time.time(), 0), 1.0)
+            due_prices = self.push_scheduler.wait_for_due(timeout=wait)
+            if due_prices:
+                self.push_prices(due_prices)
+
+            if time.time() >= next_llm_update:
+                self.start_agent_runs()
+                next_llm_update = time.time() + self.config['llm_update_interval']
+
+    def push_prices(self, symbol_prices):
+        """Push the fresh prices and forward them to the agents. Returns the PendingTx sent."""
+        symbol_prices = self.prices_to_push(symbol_prices)
+        if not symbol_prices:
+            return []
+
+        try:
+            args, options = self.price_update(symbol_prices)
+            pending = [self.submitter.submit(self.contract.functions.setAssetPrices(*args), **options)]
+            self.prices_sent(symbol_prices)
+
+            # Forward the prices to the agents in shards, nonces keep them ordered after the update above
+            if self.agent_count is None:
+                self.agent_count = self.contract.functions.getAgentCount().call()
+            pending += self.shard_scheduler.submit(
+                'updateAgentPrices',
+                lambda start, end: self.contract.functions.updateAgentPrices(start, end),
+                self.agent_count,
+                description=f"Updated agent prices on {self.name}",
+            )
+            return pending
+        except Exception as e:
+            self.price_push_failed(symbol_prices, e)
+            return []
+
+    def fetch_agent_run_inputs(self, agent_addresses):
+        agents = [get_contract(self.network, address, agent_abi_path) for address in agent_addresses]
+        results = multicall(get_web3(self.network), agent_run_input_calls(self.contract, agents))
+        return agent_run_inputs(results, len(agents))
+
+    def start_agent_runs(self):
+        """Start the runs of every agent whose query inputs changed. Returns the PendingTx sent."""
+        try:
+            agent_addresses = self.contract.functions.getAgentContracts().call()
+            self.agent_count = len(agent_addresses)
+            self.agent_responses.poll(agent_addresses)
+            agent_count, ranges, callbacks = self.plan_agent_runs(*self.fetch_agent_run_inputs(agent_addresses))
+            if not ranges:
+                return []
+            try:
+                return self.shard_scheduler.submit(
+                    'startAgentRuns',
+                    lambda start, end: self.contract.functions.startAgentRuns(start, end),
+                    agent_count,
+                    description=f"Started agent runs on {self.name}",
+                    ranges=ranges,
+                    **callbacks,
+                )
+            except Exception:
+                self.agent_runs_failed(ranges)
+                raise
+        except Exception as e:
+            print(f"Failed to start agent runs on {self.name}: {e}")
+            return []
+
+
+class PriceIngestion:
+    """One supervised Binance connection and price store, fanning ticks out to every keeper."""
+
+    def __init__(self, keepers, stream_type=binance_stream_type):
+        self.keepers = keepers
+        self.stream_type = stream_type
+        self.symbols = sorted({symbol for keeper in keepers for symbol in keeper.symbols})
+        self.price_store = PriceStore(self.symbols)
+
+        # Symbol index -> push schedulers of the ensembles trading it, so a tick costs one lookup
+        self.subscribers = [[] for _ in self.symbols]
+        for keeper in keepers:
+            keeper.price_store = self.price_store
+            for symbol in keeper.symbols:
+                self.subscribers[self.price_store.index[symbol]].append(keeper.push_scheduler)
+
+        self.supervisor = WebSocketSupervisor(
+            binance_combined_stream_url, self.on_message, on_open=self.on_open, on_resync=self.resync,
+        )
+
+    def on_message(self, ws, message):
+        count = 0
+        for symbol, price, timestamp in iter_ticks(loads(message)):
+            count += 1
+            self.on_price(symbol, price, timestamp)
+        ticks_received.inc(count, source='binance')
+
+    def on_price(self, symbol, price, timestamp):
+        i = self.price_store.update(symbol, price, timestamp)
+        if i >= 0:
+            for push_scheduler in self.subscribers[i]:
+                push_scheduler.on_price(symbol, price)
+
+    def on_open(self, ws):
+        ws.send(json.dumps(subscribe_message(self.symbols, self.stream_type)))
+
+    def resync(self):
+        for symbol, price, timestamp in fetch_binance_snapshot(self.symbols):
+            self.on_price(symbol, price, timestamp)
+
+    def start(self):
+        self.supervisor.start()
+
+    def stop(self):
+        self.supervisor.stop(timeout=5)
+
+
+def load_config(path):
+    with open(path) as f:
+        config = json.load(f)
+    defaults = config.get('defaults', {})
+    ensembles = [dict(defaults, **ensemble) for ensemble in config['ensembles']]
+    if not ensembles:
+        raise ValueError(f"No ensembles configured in {path}")
+    return config, ensembles
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the keepers of several AlphaEnsemble contracts in one process")
+    parser.add_argument('--config', default='config/keeper_daemon.json', help="JSON file listing the ensembles to serve")
+    args = parser.parse_args()
+
+    config, ensemble_configs = load_config(args.config)
+    price_max_age = config.get('price_max_age', price_max_age)
+    start_exporter(config.get('metrics_port'), config.get('metrics_log_interval'))
+
+    keepers = [EnsembleKeeper(ensemble_config) for ensemble_config in ensemble_configs]
+    ingestion = PriceIngestion(keepers, config.get('stream_type', binance_stream_type))
+    ingestion.start()
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=keeper.run, args=(stop,), daemon=True) for keeper in keepers]
+    for thread in threads:
+        thread.start()
+    print(f"Serving {len(keepers)} ensembles over {len(ingestion.symbols)} symbols")
+
+    try:
+        while not stop.is_set():
+            stop.wait(1)
+    except KeyboardInterrupt:
+        print("Received stop signal")
+
+    stop.set()
+    ingestion.stop()
+    for thread in threads:
+        thread.join()
+
+    # Give in-flight transactions of every signer a chance to confirm
+    for submitter in {id(keeper.submitter): keeper.submitter for keeper in keepers}.values():
+        submitter.wait_all(timeout=30)
+        submitter.close()
+    print("Keeper daemon stopped.")
@@ -0,0 +1,206 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from eth_utils import encode_hex, event_abi_to_log_topic
+
+# Keeper-side deduplication of agent runs. Every startAgentRuns query is built from the asset
+# prices, every agent's positions and PnL, and the agent's strategy, so two runs whose inputs
+# match (prices within the same bucket) ask the LLM the same question. The keeper fingerprints
+# those inputs before each cycle and skips agents whose fingerprint matches a run answered
+# within the last ttl seconds; once the ttl expires the agent runs again even if nothing moved.
+#
+# A run only counts once the oracle has answered it: dispatched runs wait in a pending state
+# until AgentResponses sees the agent's OracleResponseCallback. An answer without an error is
+# cached, an error or no answer within response_timeout makes the agent due again.
+
+
+def quantize_price(price, step_bps):
+    """Bucket index of a price on a geometric grid of step_bps, so buckets are equally wide in %."""
+    if price <= 0:
+        return 0
+    return math.floor(math.log(price) / math.log1p(step_bps / 10000))
+
+
+def contiguous_ranges(agent_ids):
+    """Group sorted agent ids into [from, to) ranges, e.g. [0, 1, 2, 5] -> [(0, 3), (5, 6)]."""
+    ranges = []
+    for agent_id in agent_ids:
+        if ranges and ranges[-1][1] == agent_id:
+            ranges[-1] = (ranges[-1][0], agent_id + 1)
+        else:
+            ranges.append((agent_id, agent_id + 1))
+    return ranges
+
+
+class LlmRunCache:
+    """
+    LRU of recently answered agent runs keyed by (agent_id, fingerprint), each entry
+    expiring ttl seconds after the run, plus the runs still waiting for an answer. Agents
+    with a pending run are not run again until it is answered or times out. Thread-safe,
+    since runs are dispatched from receipt callbacks on the submitter's thread.
+    """
+
+    def __init__(self, ttl=600, max_entries=4096, price_step_bps=10, response_timeout=300):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.price_step_bps = price_step_bps
+        self.response_timeout = response_timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.failures = 0
+        self.timeouts = 0
+        self._runs = OrderedDict()
+        self._pending = {}  # agent_id -> (fingerprint, dispatched at)
+        self._lock = threading.Lock()
+
+    def market_digest(self, prices, positions):
+        """Digest of the inputs every agent's query shares: quantized prices and all positions."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr([quantize_price(price, self.price_step_bps) for price in prices]).encode())
+        digest.update(repr([list(agent_positions) for agent_positions in positions]).encode())
+        return digest.digest()
+
+    def fingerprint(self, market_digest, agent_id, strategy):
+        digest = hashlib.blake2b(market_digest, digest_size=16)
+        digest.update(str(agent_id).encode())
+        digest.update(strategy.encode())
+        return digest.hexdigest()
+
+    def should_run(self, agent_id, fingerprint, now=None):
+        """
+        False (a hit) when the same inputs were answered within the ttl or the agent's last
+        run is still waiting for its answer, True otherwise.
+        """
+        now = time.time() if now is None else now
+        key = (agent_id, fingerprint)
+        with self._lock:
+            pending = self._pending.get(agent_id)
+            if pending is not None and now - pending[1] < self.response_timeout:
+                self.hits += 1
+                return False
+            if pending is not None:
+                del self._pending[agent_id]
+                self.timeouts += 1
+
+            ran_at = self._runs.get(key)
+            if ran_at is not None and now - ran_at < self.ttl:
+                self._runs.move_to_end(key)
+                self.hits += 1
+                return False
+            if ran_at is not None:
+                del self._runs[key]
+            self.misses += 1
+            return True
+
+    def due_runs(self, prices, positions, strategies, now=None):
+        """
+        Fingerprint every agent's query inputs and return (fingerprints, due agent ids), where
+        due agents are the ones should_run lets through.
+        """
+        market_digest = self.market_digest(prices, positions)
+        fingerprints = [self.fingerprint(market_digest, agent_id, strategy) for agent_id, strategy in enumerate(strategies)]
+        due = [agent_id for agent_id, fingerprint in enumerate(fingerprints) if self.should_run(agent_id, fingerprint, now)]
+        return fingerprints, due
+
+    def dispatch(self, agent_id, fingerprint, now=None):
+        """Mark a run as started; it is cached once on_response reports an answer."""
+        with self._lock:
+            self._pending[agent_id] = (fingerprint, time.time() if now is None else now)
+
+    def cancel(self, agent_id):
+        """Drop the agent's pending run without counting it as failed, e.g. its tx was never sent or reverted."""
+        with self._lock:
+            self._pending.pop(agent_id, None)
+
+    def on_response(self, agent_id, succeeded, now=None):
+        """Settle the agent's pending run: cache it if the oracle answered without an error."""
+        with self._lock:
+            pending = self._pending.pop(agent_id, None)
+            if pending is not None and not succeeded:
+                self.failures += 1
+        if pending is not None and succeeded:
+            self.record_run(agent_id, pending[0], now)
+
+    def record_run(self, agent_id, fingerprint, now=None):
+        with self._lock:
+            key = (agent_id, fingerprint)
+            self._runs[key] = time.time() if now is None else now
+            self._runs.move_to_end(key)
+            while len(self._runs) > self.max_entries:
+                self._runs.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, agent_id=None):
+        """Forget cached and pending runs for one agent (e.g. after its strategy changed), or for all agents."""
+        with self._lock:
+            for key in [key for key in self._runs if agent_id is None or key[0] == agent_id]:
+                del self._runs[key]
+            for key in [key for key in self._pending if agent_id is None or key == agent_id]:
+                del self._pending[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'size': len(self._runs),
+                'pending': len(self._pending),
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class AgentResponses:
+    """
+    Follows the OracleResponseCallback events of an ensemble's agents with one eth_getLogs
+    per poll and reports them to a LlmRunCache. Agent ids are the agents' positions in
+    getAgentContracts(), like everywhere else in the keepers.
+    """
+
+    def __init__(self, web3, agent_abi, llm_run_cache):
+        self.web3 = web3
+        self.event = web3.eth.contract(abi=agent_abi).events.OracleResponseCallback()
+        self.topic = encode_hex(event_abi_to_log_topic(self.event.abi))
+        self.llm_run_cache = llm_run_cache
+        self.next_block = None
+
+    def poll(self, agent_addresses):
+        """Settle the pending runs of every agent that was answered since the last poll."""
+        head = self.web3.eth.block_number
+        if self.next_block is None:
+            self.start(head)
+        elif self.next_block <= head:
+            self.settle(self.web3.eth.get_logs(self.log_filter(agent_addresses, head)), agent_addresses, head)
+
+    def log_filter(self, agent_addresses, head):
+        return {'fromBlock': self.next_block, 'toBlock': head, 'address': list(agent_addresses), 'topics': [self.topic]}
+
+    def start(self, head):
+        # Runs are only dispatched after the first poll, so older answers are not of interest
+        self.next_block = head + 1
+
+    def settle(self, logs, agent_addresses, head):
+        agent_ids = {address: agent_id for agent_id, address in enumerate(agent_addresses)}
+        for log in sorted(logs, key=lambda log: (log['blockNumber'], log['logIndex'])):
+            agent_id = agent_ids.get(log['address'])
+            if agent_id is not None:
+                error_message = self.event.process_log(log)['args']['errorMessage']
+                self.llm_run_cache.on_response(agent_id, not error_message)
+        self.next_block = head + 1
+
+
+class AsyncAgentResponses(AgentResponses):
+    """AgentResponses for AsyncWeb3 clients."""
+
+    async def poll(self, agent_addresses):
+        head = await self.web3.eth.block_number
+        if self.next_block is None:
+            self.start(head)
+        elif self.next_block <= head:
+            self.settle(await self.web3.eth.get_logs(self.log_filter(agent_addresses, head)), agent_addresses, head)
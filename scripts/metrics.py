@@ -0,0 +1,257 @@
+import bisect
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# In-process counters and histograms for the keepers, exposed as Prometheus text on a local
+# HTTP endpoint and/or written as one JSON line per interval. Recording is a lock and an
+# addition; histograms on hot paths take a sample_rate so only a fraction of events pay even that.
+#
+# Both are off by default. Set METRICS_PORT to serve http://127.0.0.1:<port>/metrics, and
+# METRICS_LOG_INTERVAL (seconds) for a JSON line on stderr every interval. The keeper daemon's
+# config can set metrics_port and metrics_log_interval instead; the env variables take precedence.
+
+# Seconds, from sub-millisecond RPCs to slow confirmations
+latency_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+gas_buckets = (25000, 50000, 100000, 250000, 500000, 1000000, 2500000, 5000000, 10000000, 30000000)
+
+metrics_port = None
+metrics_log_interval = 0
+
+
+class Counter:
+    def __init__(self, name, help='', labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(dict(zip(self.labels, key)), value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """
+    Cumulative bucket counts, sum and count per label set. With sample_rate below 1 only that
+    fraction of observations is recorded: quantiles stay representative, counts are scaled down.
+    """
+
+    def __init__(self, name, help='', labels=(), buckets=latency_buckets, sample_rate=1.0):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.sample_rate = sample_rate
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        key = tuple(str(labels.get(label, '')) for label in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            return [(dict(zip(self.labels, key)), list(counts), total) for key, (counts, total) in self._values.items()]
+
+    def quantile(self, counts, q):
+        """Upper bound of the bucket holding the q-th quantile, None when it is past the last bucket."""
+        target = q * sum(counts)
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if count and seen >= target:
+                return bound
+        return None
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help='', labels=()):
+        return self._get_or_create(Counter, name, help=help, labels=labels)
+
+    def histogram(self, name, help='', labels=(), buckets=latency_buckets, sample_rate=1.0):
+        return self._get_or_create(Histogram, name, help=help, labels=labels, buckets=buckets, sample_rate=sample_rate)
+
+    def _get_or_create(self, cls, name, **kwargs):
+        # Modules declare their metrics at import time, so the same name may be declared twice
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, **kwargs)
+            return self.metrics[name]
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        for metric in list(self.metrics.values()):
+            kind = 'counter' if isinstance(metric, Counter) else 'histogram'
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+            if kind == 'counter':
+                for labels, value in metric.samples():
+                    lines.append(f"{metric.name}{format_labels(labels)} {value}")
+                continue
+            for labels, counts, total in metric.samples():
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{metric.name}_bucket{format_labels(dict(labels, le=le))} {cumulative}")
+                lines.append(f"{metric.name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{metric.name}_count{format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Counters and histogram summaries (count, mean, p50/p90/p99 bucket bounds) as plain dicts."""
+        snapshot = {}
+        for metric in list(self.metrics.values()):
+            if isinstance(metric, Counter):
+                snapshot[metric.name] = [dict(labels, value=value) for labels, value in metric.samples()]
+                continue
+            snapshot[metric.name] = [
+                dict(
+                    labels,
+                    count=sum(counts),
+                    mean=total / sum(counts),
+                    p50=metric.quantile(counts, 0.5),
+                    p90=metric.quantile(counts, 0.9),
+                    p99=metric.quantile(counts, 0.99),
+                )
+                for labels, counts, total in metric.samples()
+            ]
+        return snapshot
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+# Process-wide registry shared by every script
+registry = Registry()
+
+
+def counter(name, help='', labels=()):
+    return registry.counter(name, help, labels)
+
+
+def histogram(name, help='', labels=(), buckets=latency_buckets, sample_rate=1.0):
+    return registry.histogram(name, help, labels, buckets, sample_rate)
+
+
+def serve(port, host='127.0.0.1', registry=registry):
+    """Serve the registry at http://host:port/metrics from a daemon thread. Returns the server."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes are not worth a log line each
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def log_json(interval, stream=sys.stderr, registry=registry):
+    """Write a JSON snapshot of the registry every interval seconds from a daemon thread."""
+
+    def log_loop():
+        while True:
+            time.sleep(interval)
+            stream.write(json.dumps({'time': time.time(), 'metrics': registry.snapshot()}) + '\n')
+            stream.flush()
+
+    thread = threading.Thread(target=log_loop, daemon=True)
+    thread.start()
+    return thread
+
+
+def start_exporter(port=None, log_interval=None):
+    """
+    Start the endpoint and/or JSON log configured by METRICS_PORT and METRICS_LOG_INTERVAL,
+    falling back to port and log_interval and then to the module defaults, which start neither.
+    """
+    from connections import getenv
+
+    port = getenv('METRICS_PORT', port if port is not None else metrics_port)
+    if port:
+        serve(int(port))
+    interval = float(getenv('METRICS_LOG_INTERVAL', log_interval if log_interval is not None else metrics_log_interval))
+    if interval > 0:
+        log_json(interval)
+
+
+# Ingestion health shared by the keepers and price sources
+ticks_received = counter('ticks_total', "Price ticks received", ('source',))
+tick_to_tx = histogram('tick_to_tx_seconds', "Exchange time of the newest pushed tick until its price tx was sent")
+ws_reconnects = counter('ws_reconnects_total', "Websocket connections that dropped and were reopened", ('source',))
+feed_failures = counter('feed_failures_total', "Failed reads from a price feed", ('feed',))
+
+# JSON-RPC latency per method, recorded by web3 middleware on every client from connections.py
+rpc_requests = counter('rpc_requests_total', "JSON-RPC requests sent", ('method',))
+rpc_errors = counter('rpc_errors_total', "JSON-RPC requests that raised or returned an error", ('method',))
+rpc_latency = histogram('rpc_latency_seconds', "JSON-RPC round trip time", ('method',), sample_rate=0.25)
+
+
+def rpc_metrics_middleware(make_request, web3):
+    def middleware(method, params):
+        rpc_requests.inc(method=method)
+        start = time.perf_counter()
+        try:
+            response = make_request(method, params)
+        except Exception:
+            rpc_errors.inc(method=method)
+            raise
+        rpc_latency.observe(time.perf_counter() - start, method=method)
+        if 'error' in response:
+            rpc_errors.inc(method=method)
+        return response
+    return middleware
+
+
+async def async_rpc_metrics_middleware(make_request, web3):
+    async def middleware(method, params):
+        rpc_requests.inc(method=method)
+        start = time.perf_counter()
+        try:
+            response = await make_request(method, params)
+        except Exception:
+            rpc_errors.inc(method=method)
+            raise
+        rpc_latency.observe(time.perf_counter() - start, method=method)
+        if 'error' in response:
+            rpc_errors.inc(method=method)
+        return response
+    return middleware
@@ -0,0 +1,153 @@
+from eth_utils import function_abi_to_4byte_selector
+
+# Multicall3 is deployed at the same address on Sepolia, mainnet and most public testnets
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+multicall3_abi = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]
+
+# Whether Multicall3 has code on a given chain, checked once per client
+_multicall_deployed = {}
+
+
+class CallResult:
+    """Outcome of one call in a batch, so a single failing feed does not sink the others."""
+
+    def __init__(self, success, value=None, error=None):
+        self.success = success
+        self.value = value
+        self.error = error
+
+    def __repr__(self):
+        if self.success:
+            return f"CallResult(success=True, value={self.value!r})"
+        return f"CallResult(success=False, error={self.error!r})"
+
+
+def encode_call(web3, contract_function):
+    fn_abi = contract_function.abi
+    input_types = [arg['type'] for arg in fn_abi['inputs']]
+    return function_abi_to_4byte_selector(fn_abi) + web3.codec.encode(input_types, contract_function.args)
+
+
+def decode_result(web3, contract_function, return_data):
+    output_types = [arg['type'] for arg in contract_function.abi['outputs']]
+    values = web3.codec.decode(output_types, return_data)
+    return values[0] if len(values) == 1 else list(values)
+
+
+def encode_batch(web3, contract_functions):
+    """aggregate3 calls for a batch, each allowed to fail on its own."""
+    return [(fn.address, True, encode_call(web3, fn)) for fn in contract_functions]
+
+
+def decode_batch(web3, contract_functions, responses):
+    """A CallResult per call from aggregate3's (success, returnData) responses."""
+    results = []
+    for fn, (success, return_data) in zip(contract_functions, responses):
+        if not success:
+            results.append(CallResult(False, error="call reverted"))
+            continue
+        try:
+            results.append(CallResult(True, value=decode_result(web3, fn, return_data)))
+        except Exception as e:
+            # An empty or malformed return usually means there is no contract at the target
+            results.append(CallResult(False, error=f"could not decode result: {e}"))
+    return results
+
+
+def batches(contract_functions, batch_size):
+    for start in range(0, len(contract_functions), batch_size):
+        yield contract_functions[start:start + batch_size]
+
+
+def multicall(web3, contract_functions, multicall_address=MULTICALL3_ADDRESS, batch_size=100):
+    """
+    Execute many view calls in one eth_call per batch_size calls through Multicall3.
+    Returns a CallResult per input call, in order. Falls back to sequential calls on
+    chains where Multicall3 is not deployed.
+    """
+    if not contract_functions:
+        return []
+
+    key = (id(web3), multicall_address)
+    if key not in _multicall_deployed:
+        _multicall_deployed[key] = len(web3.eth.get_code(multicall_address)) > 0
+    if not _multicall_deployed[key]:
+        return [_single_call(fn) for fn in contract_functions]
+
+    aggregator = web3.eth.contract(address=multicall_address, abi=multicall3_abi)
+    results = []
+    for batch in batches(contract_functions, batch_size):
+        try:
+            responses = aggregator.functions.aggregate3(encode_batch(web3, batch)).call()
+        except Exception as e:
+            results.extend(CallResult(False, error=str(e)) for _ in batch)
+            continue
+        results.extend(decode_batch(web3, batch, responses))
+    return results
+
+
+async def async_multicall(web3, contract_functions, multicall_address=MULTICALL3_ADDRESS, batch_size=100):
+    """multicall for AsyncWeb3 clients and their contract functions."""
+    if not contract_functions:
+        return []
+
+    key = (id(web3), multicall_address)
+    if key not in _multicall_deployed:
+        _multicall_deployed[key] = len(await web3.eth.get_code(multicall_address)) > 0
+    if not _multicall_deployed[key]:
+        return [await _async_single_call(fn) for fn in contract_functions]
+
+    aggregator = web3.eth.contract(address=multicall_address, abi=multicall3_abi)
+    results = []
+    for batch in batches(contract_functions, batch_size):
+        try:
+            responses = await aggregator.functions.aggregate3(encode_batch(web3, batch)).call()
+        except Exception as e:
+            results.extend(CallResult(False, error=str(e)) for _ in batch)
+            continue
+        results.extend(decode_batch(web3, batch, responses))
+    return results
+
+
+def _single_call(contract_function):
+    try:
+        return CallResult(True, value=contract_function.call())
+    except Exception as e:
+        return CallResult(False, error=str(e))
+
+
+async def _async_single_call(contract_function):
+    try:
+        return CallResult(True, value=await contract_function.call())
+    except Exception as e:
+        return CallResult(False, error=str(e))
@@ -0,0 +1,243 @@
+import argparse
+import numpy as np
+
+# Off-chain replay of Agent.sol position and PnL accounting. Given a price grid, a list of
+# position changes and the times each agent was marked to market, it reproduces, to the unit,
+# the cost basis and running PnL total the contracts would report, for every agent, asset and
+# time at once.
+#
+# Semantics (Agent.sol, prices are the ensemble's integer prices at the event). A holding's
+# term is |position| * (price - basis) on either side, and the contract keeps one running total:
+#   - markToMarket adds the term of every open holding to the total
+#   - closing or switching side adds the term; the basis becomes 0 or the price
+#   - any other change, including opening from flat or re-sending the same position, sets the
+#     basis to (basis * |old| + price * |new|) // |new|
+#   The contract's price - basis and basis - price are unsigned, so it reverts for a long below
+#   its basis (a negative term) and for a short above its basis (a positive term). Indexed
+#   histories never contain those events, and the replay does not check for them. A short below
+#   its basis is accepted and adds a negative term.
+
+# Event keys order events inside a block: block_number * log_stride + log_index
+log_stride = 1000000
+
+
+class ReplayResult:
+    """Running PnL total per time and agent, plus the holdings after the last update."""
+
+    def __init__(self, times, pnl, positions, cost_basis):
+        self.times = times  # (T,) event keys
+        self.pnl = pnl  # (T, agents)
+        self.positions = positions  # (agents, assets)
+        self.cost_basis = cost_basis  # (agents, assets)
+
+
+def holding_pnl(positions, cost_basis, prices):
+    return np.abs(positions) * (prices - cost_basis)
+
+
+def apply_updates(positions, cost_basis, agents, assets, new_positions, prices):
+    """
+    Apply one batch of position changes in place and return the PnL each change adds to its
+    agent's total. Each (agent, asset) pair may appear at most once; prices holds the asset
+    price for each change.
+    """
+    current = positions[agents, assets]
+    basis = cost_basis[agents, assets]
+
+    closing = (new_positions == 0) & (current != 0)
+    switching = (new_positions != 0) & (current != 0) & ((current > 0) != (new_positions > 0))
+    same_side = new_positions != 0
+    same_side &= ~switching
+
+    realized = np.where(closing | switching, holding_pnl(current, basis, prices), 0)
+
+    new_basis = basis.copy()
+    new_basis[closing] = 0
+    new_basis[switching] = prices[switching]
+    size = np.abs(new_positions[same_side])
+    new_basis[same_side] = (basis[same_side] * np.abs(current[same_side]) + prices[same_side] * size) // size
+
+    positions[agents, assets] = new_positions
+    cost_basis[agents, assets] = new_basis
+    return realized
+
+
+def replay(times, prices, update_times, update_agents, update_assets, update_positions, agent_count,
+           mark_times=(), mark_agents=()):
+    """
+    Replay position updates and marks against a price grid.
+
+    times: (T,) increasing event keys; prices: (T, assets) integer prices in effect at each key.
+    update_*: (U,) position changes sorted by time, applied with the price in effect at their key.
+    mark_*: (M,) markToMarket calls sorted by time, each marking one agent at the prices in effect at its key.
+    Returns a ReplayResult with pnl[t, agent] the agent's total after every event up to times[t].
+    """
+    times = np.asarray(times, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.int64)
+    update_times = np.asarray(update_times, dtype=np.int64)
+    update_agents = np.asarray(update_agents, dtype=np.int64)
+    update_assets = np.asarray(update_assets, dtype=np.int64)
+    update_positions = np.asarray(update_positions, dtype=np.int64)
+    mark_times = np.asarray(mark_times, dtype=np.int64)
+    mark_agents = np.asarray(mark_agents, dtype=np.int64)
+
+    asset_count = prices.shape[1]
+    positions = np.zeros((agent_count, asset_count), dtype=np.int64)
+    cost_basis = np.zeros((agent_count, asset_count), dtype=np.int64)
+
+    # Every event adds to its agent's total at the first row at or after its key, and the
+    # totals are the running sum of those additions. Events after the last row only change
+    # the final holdings.
+    pnl_delta = np.zeros((len(times) + 1, agent_count), dtype=np.int64)
+
+    # Row of the price grid in effect at each event (price 0 before the first row)
+    rows = np.searchsorted(times, update_times, side='right') - 1
+    update_prices = np.where(rows >= 0, prices[np.maximum(rows, 0), update_assets], 0)
+    rows = np.searchsorted(times, mark_times, side='right') - 1
+    mark_prices = np.where((rows >= 0)[:, None], prices[np.maximum(rows, 0)], 0)
+    mark_rows = np.searchsorted(times, mark_times, side='left')
+
+    # Updates sharing a key are one setPositions call; a pair repeated within a call is applied
+    # in order, so split each key into rounds where every (agent, asset) pair is unique
+    cells = update_agents * asset_count + update_assets
+    order = np.lexsort((np.arange(len(cells)), cells, update_times))
+    repeat = np.zeros(len(cells), dtype=np.int64)
+    same_cell = (np.diff(update_times[order]) == 0) & (np.diff(cells[order]) == 0)
+    for i in np.flatnonzero(same_cell):
+        repeat[order[i + 1]] = repeat[order[i]] + 1
+    steps = np.lexsort((repeat, update_times))
+    step_keys = np.stack([update_times[steps], repeat[steps]])
+    boundaries = np.flatnonzero(np.any(np.diff(step_keys, axis=1) != 0, axis=0)) + 1
+
+    # Holdings only change at updates, so all marks between two updates see the same holdings
+    # and are priced in one step
+    mark_start = 0
+    for batch in np.split(steps, boundaries) if len(steps) else []:
+        key = update_times[batch[0]]
+        mark_end = np.searchsorted(mark_times, key, side='left')
+        add_marks(pnl_delta, positions, cost_basis, mark_rows[mark_start:mark_end],
+                  mark_agents[mark_start:mark_end], mark_prices[mark_start:mark_end])
+        mark_start = mark_end
+
+        agents = update_agents[batch]
+        realized = apply_updates(
+            positions, cost_basis, agents, update_assets[batch], update_positions[batch], update_prices[batch],
+        )
+        np.add.at(pnl_delta, (np.searchsorted(times, key, side='left'), agents), realized)
+    add_marks(pnl_delta, positions, cost_basis, mark_rows[mark_start:], mark_agents[mark_start:], mark_prices[mark_start:])
+
+    pnl = np.cumsum(pnl_delta[:-1], axis=0)
+    return ReplayResult(times, pnl, positions, cost_basis)
+
+
+def add_marks(pnl_delta, positions, cost_basis, rows, agents, prices):
+    if not len(agents):
+        return
+    marked = holding_pnl(positions[agents], cost_basis[agents], prices).sum(axis=1)
+    np.add.at(pnl_delta, (rows, agents), marked)
+
+
+def load_history(store):
+    """
+    Build replay inputs from an event_indexer.EventStore: a price grid over every indexed
+    event key (prices forward-filled), and all position updates in event order.
+    """
+    assets = [row[0] for row in store.db.execute("SELECT DISTINCT asset FROM asset_prices ORDER BY asset")]
+    assets += [
+        row[0] for row in store.db.execute("SELECT DISTINCT asset FROM positions ORDER BY asset")
+        if row[0] not in assets
+    ]
+    asset_index = {asset: i for i, asset in enumerate(assets)}
+    agent_count = 1 + max((row[0] for row in store.db.execute("SELECT agent_id FROM agents UNION SELECT agent_id FROM positions")), default=-1)
+
+    price_rows = store.db.execute(
+        "SELECT block_number * ? + log_index, asset, price FROM asset_prices ORDER BY block_number, log_index",
+        (log_stride,),
+    ).fetchall()
+    update_rows = store.db.execute(
+        "SELECT block_number * ? + log_index, agent_id, asset, position FROM positions ORDER BY block_number, log_index, rowid",
+        (log_stride,),
+    ).fetchall()
+    pnl_rows = store.db.execute(
+        "SELECT block_number * ? + log_index, agent_id, pnl, tx_hash FROM pnl ORDER BY block_number, log_index",
+        (log_stride,),
+    ).fetchall()
+
+    # setPositions only runs inside an oracle callback, and markToMarket never does, so a
+    # PnLUpdated without a callback for its agent in the same transaction is a mark
+    callbacks = set(store.db.execute("SELECT tx_hash, agent_id FROM oracle_responses"))
+    marks = [(key, agent_id) for key, agent_id, _, tx_hash in pnl_rows if (tx_hash, agent_id) not in callbacks]
+
+    times = np.unique(np.array(
+        [row[0] for row in price_rows] + [row[0] for row in update_rows] + [row[0] for row in pnl_rows],
+        dtype=np.int64,
+    ))
+
+    # Price changes land on their own row, then every row inherits the latest price per asset
+    prices = np.zeros((len(times), len(assets)), dtype=np.int64)
+    changed = np.zeros((len(times), len(assets)), dtype=bool)
+    if price_rows:
+        keys, price_assets, values = zip(*price_rows)
+        rows = np.searchsorted(times, keys)
+        columns = np.array([asset_index[asset] for asset in price_assets])
+        prices[rows, columns] = values
+        changed[rows, columns] = True
+    last_change = np.where(changed, np.arange(len(times))[:, None], -1)
+    np.maximum.accumulate(last_change, axis=0, out=last_change)
+    prices = np.where(last_change >= 0, prices[np.maximum(last_change, 0), np.arange(len(assets))], 0)
+
+    return {
+        'assets': assets,
+        'agent_count': agent_count,
+        'times': times,
+        'prices': prices,
+        'update_times': np.array([row[0] for row in update_rows], dtype=np.int64),
+        'update_agents': np.array([row[1] for row in update_rows], dtype=np.int64),
+        'update_assets': np.array([asset_index[row[2]] for row in update_rows], dtype=np.int64),
+        'update_positions': np.array([row[3] for row in update_rows], dtype=np.int64),
+        'mark_times': np.array([key for key, _ in marks], dtype=np.int64),
+        'mark_agents': np.array([agent_id for _, agent_id in marks], dtype=np.int64),
+        'pnl_events': [(key, agent_id, pnl) for key, agent_id, pnl, _ in pnl_rows],
+    }
+
+
+def replay_store(store):
+    history = load_history(store)
+    result = replay(
+        history['times'], history['prices'],
+        history['update_times'], history['update_agents'], history['update_assets'], history['update_positions'],
+        history['agent_count'], history['mark_times'], history['mark_agents'],
+    )
+    return history, result
+
+
+def audit(store):
+    """Compare every indexed PnLUpdated event with the replay. Returns the mismatches."""
+    history, result = replay_store(store)
+    rows = np.searchsorted(result.times, [key for key, _, _ in history['pnl_events']])
+    return [
+        (key, agent_id, onchain, int(result.pnl[row, agent_id]))
+        for (key, agent_id, onchain), row in zip(history['pnl_events'], rows)
+        if onchain != result.pnl[row, agent_id]
+    ]
+
+
+if __name__ == "__main__":
+    from event_indexer import EventStore
+
+    parser = argparse.ArgumentParser(description="Replay indexed positions and prices to reproduce agent PnL")
+    parser.add_argument('--db', default='events.sqlite', help="SQLite database written by event_indexer.py")
+    parser.add_argument('--audit', action='store_true', help="Check the replay against every on-chain PnLUpdated event")
+    args = parser.parse_args()
+
+    store = EventStore(args.db)
+    if args.audit:
+        mismatches = audit(store)
+        for key, agent_id, onchain, replayed in mismatches:
+            print(f"Block {key // log_stride} log {key % log_stride}: agent {agent_id} on-chain {onchain}, replay {replayed}")
+        print(f"{len(mismatches)} mismatches")
+    else:
+        history, result = replay_store(store)
+        for agent_id in range(history['agent_count']):
+            final = int(result.pnl[-1, agent_id]) if len(result.times) else 0
+            print(f"Agent {agent_id}: PnL {final}")
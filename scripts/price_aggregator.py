@@ -0,0 +1,215 @@
+import json
+import statistics
+import threading
+import time
+from metrics import feed_failures, start_exporter, ticks_received
+from push_scheduler import DeviationPushScheduler
+from price_store import binance_combined_stream_url, fetch_binance_snapshot, iter_ticks, loads, subscribe_message
+from ws_supervisor import WebSocketSupervisor
+
+# On-chain asset universe, must match assetKeys in AlphaEnsemble.sol
+aggregated_assets = ['BTC', 'ETH', 'BNB', 'ADA', 'LINK', 'SOL', 'XRP', 'DOGE', 'DOT', 'MATIC']
+
+# Quotes older than this (seconds) are ignored, per source
+source_max_age = {
+    'binance': 30,
+    'chainlink': 3600,  # Chainlink heartbeats on Sepolia are up to an hour
+    'sepolia_oracle': 300,
+}
+
+# How often the on-chain sources are polled (seconds)
+chainlink_poll_interval = 15
+sepolia_oracle_poll_interval = 30
+
+# Quotes further than this from the cross-source median are rejected as outliers
+outlier_bps = 200
+
+# Push thresholds for the consolidated vector
+price_heartbeat_interval = 60  # seconds
+price_deviation_bps = 25
+
+
+def normalize_asset(name):
+    """Map source-specific names ("BTCUSDT", "BTC/USD") to the on-chain ticker ("BTC")."""
+    name = name.upper()
+    for suffix in ('/USD', 'USDT'):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+class PriceAggregator:
+    """
+    Keeps the latest quote per asset per source and combines them into one price per asset.
+    Stale quotes (older than the source's max age) are skipped, and quotes that deviate from
+    the cross-source median by more than outlier_bps are rejected before the final median
+    (or weighted mean) is taken. Sources update independently, so a slow source only ever
+    means its quotes age out; it never holds up the others.
+    """
+
+    def __init__(self, assets, max_age=None, outlier_bps=200, min_sources=1, method='median', source_weights=None):
+        self.assets = list(assets)
+        self.max_age = max_age or {}
+        self.outlier_bps = outlier_bps
+        self.min_sources = min_sources
+        self.method = method
+        self.source_weights = source_weights or {}
+        self.on_price = None  # Called with (asset, consolidated price) after each accepted quote
+
+        self._quotes = {asset: {} for asset in self.assets}
+        self._lock = threading.Lock()
+
+    def update(self, source, asset, price, timestamp):
+        if asset not in self._quotes or price is None or price <= 0:
+            return
+        with self._lock:
+            self._quotes[asset][source] = (price, timestamp)
+            price = self._aggregate(asset, time.time())
+        if price is not None and self.on_price is not None:
+            self.on_price(asset, price)
+
+    def aggregate(self, now=None):
+        """Consolidated price for every asset that currently has enough fresh, agreeing quotes."""
+        now = now or time.time()
+        with self._lock:
+            prices = {asset: self._aggregate(asset, now) for asset in self.assets}
+        return {asset: price for asset, price in prices.items() if price is not None}
+
+    def _aggregate(self, asset, now):
+        fresh = {
+            source: price for source, (price, timestamp) in self._quotes[asset].items()
+            if now - timestamp <= self.max_age.get(source, 60)
+        }
+        if len(fresh) < self.min_sources:
+            return None
+
+        median = statistics.median(fresh.values())
+        accepted = {
+            source: price for source, price in fresh.items()
+            if abs(price - median) * 10000 <= self.outlier_bps * median
+        }
+        if len(accepted) < self.min_sources:
+            return None
+
+        if self.method == 'weighted':
+            weights = {source: self.source_weights.get(source, 1.0) for source in accepted}
+            return sum(price * weights[source] for source, price in accepted.items()) / sum(weights.values())
+        return statistics.median(accepted.values())
+
+
+def run_binance_source(aggregator, symbols, stop):
+    def on_message(ws, message):
+        count = 0
+        for symbol, price, timestamp in iter_ticks(loads(message)):
+            count += 1
+            aggregator.update('binance', normalize_asset(symbol), price, timestamp / 1000)
+        ticks_received.inc(count, source='binance')
+
+    def on_open(ws):
+        ws.send(json.dumps(subscribe_message(symbols, 'miniTicker')))
+
+    def on_resync():
+        for symbol, price, timestamp in fetch_binance_snapshot(symbols):
+            aggregator.update('binance', normalize_asset(symbol), price, timestamp / 1000)
+
+    supervisor = WebSocketSupervisor(binance_combined_stream_url, on_message, on_open=on_open, on_resync=on_resync)
+    supervisor.start()
+    stop.wait()
+    supervisor.stop(timeout=5)
+
+
+def run_chainlink_source(aggregator, stop):
+    from price_feed import fetch_latest_round_data
+
+    while not stop.is_set():
+        try:
+            for feed, (_, answer, _, updated_at, _) in fetch_latest_round_data().items():
+                aggregator.update('chainlink', normalize_asset(feed), answer / 1e8, updated_at)
+        except Exception as e:
+            feed_failures.inc(feed='chainlink')
+            print(f"Failed to poll Chainlink feeds: {e}")
+        stop.wait(chainlink_poll_interval)
+
+
+def run_sepolia_oracle_source(aggregator, stop):
+    try:
+        from relay_prices import fetch_oracle_prices
+    except Exception as e:
+        print(f"SepoliaOracle source disabled: {e}")
+        return
+
+    while not stop.is_set():
+        try:
+            # The oracle stores no update time, so quotes are stamped when they are read
+            observed_at = time.time()
+            for asset, price in fetch_oracle_prices().items():
+                aggregator.update('sepolia_oracle', normalize_asset(asset), price / 1e8, observed_at)
+        except Exception as e:
+            feed_failures.inc(feed='sepolia_oracle')
+            print(f"Failed to poll SepoliaOracle: {e}")
+        stop.wait(sepolia_oracle_poll_interval)
+
+
+def publish_prices(contract, submitter, scheduler, asset_prices):
+    assets = list(asset_prices.keys())
+    prices = [int(price * 1e8) for price in asset_prices.values()]
+    scheduler.mark_pushed(asset_prices)
+
+    def on_receipt(receipt):
+        if receipt['status'] != 1:
+            scheduler.reset(assets)
+
+    try:
+        submitter.submit(
+            contract.functions.updateAssetPricesManual(assets, prices),
+            description=f"Published {len(assets)} aggregated prices on AlphaEnsembleContract",
+            on_receipt=on_receipt,
+            on_error=lambda error: scheduler.reset(assets),
+        )
+    except Exception as e:
+        scheduler.reset(assets)
+        print(f"Failed to publish aggregated prices: {e}")
+
+
+def publish_due_prices(contract, submitter, aggregator, scheduler, due_prices, now=None):
+    """Publish the due assets that still have a consolidated price, returning what was published."""
+    # Re-check against fresh quotes so a heartbeat never republishes a stale price
+    current = aggregator.aggregate(now)
+    stale = {asset: price for asset, price in due_prices.items() if asset not in current}
+    if stale:
+        scheduler.mark_pushed(stale)
+
+    fresh = {asset: current[asset] for asset in due_prices if asset in current}
+    if fresh:
+        publish_prices(contract, submitter, scheduler, fresh)
+    return fresh
+
+
+if __name__ == "__main__":
+    from connections import get_alpha_ensemble, get_submitter
+
+    start_exporter()
+    alpha_ensemble_contract = get_alpha_ensemble()
+    submitter = get_submitter()
+
+    aggregator = PriceAggregator(aggregated_assets, max_age=source_max_age, outlier_bps=outlier_bps)
+    scheduler = DeviationPushScheduler(aggregated_assets, deviation_bps=price_deviation_bps, heartbeat=price_heartbeat_interval)
+    aggregator.on_price = scheduler.on_price
+
+    stop = threading.Event()
+    binance_symbols = [f"{asset.lower()}usdt" for asset in aggregated_assets]
+    sources = [
+        threading.Thread(target=run_binance_source, args=(aggregator, binance_symbols, stop), daemon=True),
+        threading.Thread(target=run_chainlink_source, args=(aggregator, stop), daemon=True),
+        threading.Thread(target=run_sepolia_oracle_source, args=(aggregator, stop), daemon=True),
+    ]
+    for source in sources:
+        source.start()
+
+    try:
+        while True:
+            publish_due_prices(alpha_ensemble_contract, submitter, aggregator, scheduler, scheduler.wait_for_due())
+    except KeyboardInterrupt:
+        print("Received stop signal")
+        stop.set()
+        submitter.wait_all(timeout=30)
@@ -1,20 +1,8 @@
 import time
-import json
-from web3 import Web3
-from pathlib import Path
-import os
-from dotenv import load_dotenv
-
-# Load environment variables from frontend/.env.local
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '../frontend/.env.local'))
-
-# Initialize a Web3 instance for Sepolia testnet (to read prices)
-sepolia_rpc_url = "https://rpc.ankr.com/eth_sepolia"
-sepolia_web3 = Web3(Web3.HTTPProvider(sepolia_rpc_url))
-
-# Initialize a Web3 instance for Galadriel testnet (to interact with AlphaEnsembleContract)
-galadriel_rpc_url = "https://devnet.galadriel.com/"
-galadriel_web3 = Web3(Web3.HTTPProvider(galadriel_rpc_url))
+from functools import lru_cache
+from connections import get_alpha_ensemble, get_submitter, get_web3
+from metrics import feed_failures, start_exporter
+from multicall import multicall
 
 # Simplified ABI for the AggregatorV3Interface (for latestRoundData function)
 aggregator_v3_interface_abi = [
@@ -57,18 +45,14 @@ price_feeds = {
     "XAU/USD": "0xC5981F461d74c46eB4b0CF3f4Ec79f025573B0Ea"
 }
 
-# Load the ABI for AlphaEnsembleContract from the JSON file
-with open(os.path.join(os.path.dirname(__file__), "../frontend/contracts/AlphaEnsembleABI.json")) as f:
-    alpha_ensemble_abi = f.read()
-
-alpha_ensemble_address = os.getenv('NEXT_PUBLIC_ALPHA_ENSEMBLE_ADDRESS')
-
-# Create the contract instance for AlphaEnsembleContract on Galadriel
-alpha_ensemble_contract = galadriel_web3.eth.contract(address=alpha_ensemble_address, abi=alpha_ensemble_abi)
-
-private_key = os.getenv('NEXT_PUBLIC_PRIVATE_KEY_GALADRIEL')
-account = galadriel_web3.eth.account.from_key(private_key)
-chain_id = 696969  # Galadriel testnet chain ID
+# Price feed contract instances, created on first use and reused for every batched read
+@lru_cache(maxsize=None)
+def get_price_feed_contracts():
+    sepolia_web3 = get_web3('sepolia')
+    return {
+        asset: sepolia_web3.eth.contract(address=address, abi=aggregator_v3_interface_abi)
+        for asset, address in price_feeds.items()
+    }
 
 # Upkeep intervals
 price_update_interval = 15  # seconds
@@ -76,61 +60,60 @@ llm_update_interval = 60 * 5  # 5 minutes
 last_price_update_time = time.time()
 last_llm_update_time = time.time()
 
+def fetch_latest_round_data():
+    # Read latestRoundData for every feed in a single round trip, keyed by asset
+    price_feed_contracts = get_price_feed_contracts()
+    feed_assets = list(price_feed_contracts.keys())
+    calls = [price_feed_contracts[asset].functions.latestRoundData() for asset in feed_assets]
+    results = multicall(get_web3('sepolia'), calls)
+
+    round_data = {}
+    for asset, result in zip(feed_assets, results):
+        if not result.success:
+            feed_failures.inc(feed=asset)
+            print(f"Failed to fetch price for {asset} from Sepolia: {result.error}")
+            continue
+        round_data[asset] = result.value
+    return round_data
+
 def fetch_latest_prices():
     assets = []
     prices = []
-    for asset, address in price_feeds.items():
-        try:
-            # Create contract instance for the price feed on Sepolia
-            price_feed_contract = sepolia_web3.eth.contract(address=address, abi=aggregator_v3_interface_abi)
 
-            # Call latestRoundData to get the latest price
-            latest_data = price_feed_contract.functions.latestRoundData().call()
+    try:
+        round_data = fetch_latest_round_data()
+    except Exception as e:
+        print(f"Failed to fetch prices from Sepolia: {e}")
+        return assets, prices
 
-            # Extract the price (adjust for decimals if necessary)
-            price = latest_data[1] / 1e8  # Assuming 8 decimal places as typical for Chainlink price feeds
+    for asset, latest_data in round_data.items():
+        # Extract the price (adjust for decimals if necessary)
+        price = latest_data[1] / 1e8  # Assuming 8 decimal places as typical for Chainlink price feeds
 
-            # Store the asset and price in the lists
-            assets.append(asset)
-            prices.append(int(price * 1e8))
+        # Store the asset and price in the lists
+        assets.append(asset)
+        prices.append(int(price * 1e8))
 
-            # Print the price
-            print(f"Latest {asset} price from Sepolia: {price} USD")
-        except Exception as e:
-            print(f"Failed to fetch price for {asset} from Sepolia: {e}")
+        # Print the price
+        print(f"Latest {asset} price from Sepolia: {price} USD")
 
     return assets, prices
 
 def update_alpha_ensemble_asset_prices(assets, prices):
     try:
-        txn = alpha_ensemble_contract.functions.updateAssetPricesManual(assets, prices).build_transaction({
-            'chainId': chain_id,
-            'gas': 1000000,
-            'gasPrice': galadriel_web3.eth.gas_price,
-            'nonce': galadriel_web3.eth.get_transaction_count(account.address),
-        })
-
-        signed_txn = galadriel_web3.eth.account.sign_transaction(txn, private_key=private_key)
-        tx_hash = galadriel_web3.eth.send_raw_transaction(signed_txn.rawTransaction)
-        receipt = galadriel_web3.eth.wait_for_transaction_receipt(tx_hash)
-        print(f"Updated prices on AlphaEnsembleContract with Tx: {tx_hash.hex()}, Status: {receipt['status']}")
+        get_submitter().submit(
+            get_alpha_ensemble().functions.updateAssetPricesManual(assets, prices),
+            description="Updated prices on AlphaEnsembleContract",
+        )
     except Exception as e:
         print(f"Failed to update prices in AlphaEnsembleContract on Galadriel: {e}")
 
 def update_alpha_ensemble_llm_positions():
     try:
-        txn = alpha_ensemble_contract.functions.updatePositions().build_transaction({
-            'chainId': chain_id,
-            'gas': 15000000,
-            'gasPrice': galadriel_web3.eth.gas_price,
-            'nonce': galadriel_web3.eth.get_transaction_count(account.address),
-        })
-
-        signed_txn = galadriel_web3.eth.account.sign_transaction(txn, private_key=private_key)
-        tx_hash = galadriel_web3.eth.send_raw_transaction(signed_txn.rawTransaction)
-        receipt = galadriel_web3.eth.wait_for_transaction_receipt(tx_hash)
-        print(f"Updated LLM positions on AlphaEnsembleContract with Tx: {tx_hash.hex()}, Status: {receipt['status']}")
-        print(f"Gas used: {receipt['gasUsed']}")
+        get_submitter().submit(
+            get_alpha_ensemble().functions.updatePositions(),
+            description="Updated LLM positions on AlphaEnsembleContract",
+        )
     except Exception as e:
         print(f"Failed to update LLM positions in AlphaEnsembleContract on Galadriel: {e}")
 
@@ -141,6 +124,8 @@ def check_upkeep():
     return price_update_needed, llm_update_needed
 
 if __name__ == "__main__":
+    start_exporter()
+
     while True:
         # Check if upkeep is needed
         price_update_needed, llm_update_needed = check_upkeep()
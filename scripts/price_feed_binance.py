@@ -1,162 +1,134 @@
-import time
-import json
-from web3 import Web3
-from pathlib import Path
-import os
-from dotenv import load_dotenv
-import websocket
 import threading
+import time
+from functools import lru_cache
+from connections import getenv
+from keeper_daemon import EnsembleKeeper, PriceIngestion
+from metrics import start_exporter
+
+# Keeper for the single AlphaEnsemble in NEXT_PUBLIC_ALPHA_ENSEMBLE_ADDRESS. It runs the keeper
+# daemon's EnsembleKeeper and PriceIngestion with the settings below, so price pushes, sharded
+# agent runs, the LLM run cache and the supervised Binance connection behave exactly as they do
+# for every ensemble the daemon serves. The functions below keep this script's API as thin
+# wrappers over them; the keeper is created on first use.
+
+# Binance stream for real-time prices: 'bookTicker' for mid prices, 'ticker' for the full 24h payload
+binance_stream_type = 'miniTicker'
+binance_symbols = [
+    'btcusdt', 'ethusdt', 'bnbusdt', 'adausdt', 'linkusdt', 'solusdt', 'xrpusdt', 'dogeusdt', 'dotusdt', 'maticusdt'
+]
 
-# Load environment variables from frontend/.env.local
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '../frontend/.env.local'))
+keeper_config = {
+    # Remove the "USDT" part of the symbol before pushing on-chain
+    'assets': [symbol.upper().replace('USDT', '') for symbol in binance_symbols],
+
+    # Prices are pushed when they move past a deviation threshold or when their heartbeat expires
+    'heartbeat': 60,  # seconds
+    'deviation_bps': 25,  # default threshold, 25 bps = 0.25%
+    'asset_deviation_bps': {
+        'BTC': 10,
+        'ETH': 10,
+    },
+
+    # Agents whose prompt inputs (prices within llm_price_step_bps, positions, strategy) match a
+    # run the oracle answered in the last llm_run_cache_ttl seconds are skipped instead of asking
+    # the LLM again. A run without an answer after llm_response_timeout seconds is started again.
+    'llm_update_interval': 60,  # seconds
+    'llm_run_cache_ttl': 600,  # seconds
+    'llm_price_step_bps': 10,
+    'llm_response_timeout': 300,  # seconds
+
+    # Per-agent work is split into ranges sized from measured gasUsed so no tx hits the block gas limit
+    'gas_budget': 8000000,
+}
+
+# Upkeep interval
+llm_update_interval = keeper_config['llm_update_interval']
+last_llm_update_time = time.time()
 
-# Initialize a Web3 instance for Galadriel testnet (to interact with AlphaEnsembleContract)
-galadriel_rpc_url = "https://devnet.galadriel.com/"
-galadriel_web3 = Web3(Web3.HTTPProvider(galadriel_rpc_url))
 
-# Load the ABI for AlphaEnsembleContract from the JSON file
-with open(os.path.join(os.path.dirname(__file__), "../frontend/contracts/AlphaEnsembleABI.json")) as f:
-    alpha_ensemble_abi = f.read()
+@lru_cache(maxsize=None)
+def get_price_ingestion():
+    keeper = EnsembleKeeper(dict(keeper_config, address=getenv('NEXT_PUBLIC_ALPHA_ENSEMBLE_ADDRESS')))
+    return PriceIngestion([keeper], binance_stream_type)
 
-alpha_ensemble_address = os.getenv('NEXT_PUBLIC_ALPHA_ENSEMBLE_ADDRESS')
-alpha_ensemble_contract = galadriel_web3.eth.contract(address=alpha_ensemble_address, abi=alpha_ensemble_abi)
 
-private_key = os.getenv('NEXT_PUBLIC_PRIVATE_KEY_GALADRIEL')
-account = galadriel_web3.eth.account.from_key(private_key)
-chain_id = 696969  # Galadriel testnet chain ID
+def get_keeper():
+    # Created together with the ingestion, which hands it the price store
+    return get_price_ingestion().keepers[0]
 
-# Binance WebSocket setup for real-time price updates
-binance_socket_url = "wss://stream.binance.com:9443/ws"
-binance_symbols = [
-    'btcusdt', 'ethusdt', 'bnbusdt', 'adausdt', 'linkusdt', 'solusdt', 'xrpusdt', 'dogeusdt', 'dotusdt', 'maticusdt'
-]
 
-# Store real-time prices from Binance WebSocket in a dictionary
-real_time_prices = {symbol.upper(): None for symbol in binance_symbols}
+def get_shard_scheduler():
+    return get_keeper().shard_scheduler
 
-# Global WebSocket object to allow proper shutdown
-ws = None
-stop_websocket_flag = False
 
-# Function to handle WebSocket messages
-def on_message(ws, message):
-    data = json.loads(message)
-    if 's' in data and 'c' in data:
-        symbol = data['s'].upper()  # Keep the symbols in uppercase for consistency
-        price = float(data['c'])  # Current price
-        if symbol in real_time_prices:
-            real_time_prices[symbol] = price
-            print(f"Real-time {symbol} price from Binance: {price} USD")
+def __getattr__(name):
+    # The keeper's state under the names this script used to define at import time
+    lazy = {
+        'price_store': lambda: get_price_ingestion().price_store,
+        'push_scheduler': lambda: get_keeper().push_scheduler,
+        'llm_run_cache': lambda: get_keeper().llm_run_cache,
+        'websocket_supervisor': lambda: get_price_ingestion().supervisor,
+    }
+    if name not in lazy:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return lazy[name]()
+
 
-def on_error(ws, error):
-    print(f"Error in WebSocket: {error}")
+# Function to handle WebSocket messages, kept free of logging since it runs once per tick
+def on_message(ws, message):
+    get_price_ingestion().on_message(ws, message)
 
-def on_close(ws):
-    print("WebSocket connection closed")
 
 def on_open(ws):
-    # Subscribe to the WebSocket ticker stream for selected symbols
-    subscribe_message = {
-        "method": "SUBSCRIBE",
-        "params": [f"{symbol}@ticker" for symbol in binance_symbols],
-        "id": 1
-    }
-    ws.send(json.dumps(subscribe_message))
-
-# Function to start Binance WebSocket
-def start_binance_websocket():
-    global ws
-    ws = websocket.WebSocketApp(binance_socket_url, on_message=on_message, on_error=on_error, on_close=on_close)
-    ws.on_open = on_open
-    while not stop_websocket_flag:
-        ws.run_forever()
-        time.sleep(1)  # Prevents CPU overload in case the WebSocket connection drops
-
-# Upkeep intervals
-price_update_interval = 30  # seconds
-llm_update_interval = 60  # seconds
-last_price_update_time = time.time()
-last_llm_update_time = time.time()
+    get_price_ingestion().on_open(ws)
+
+
+# Re-seed every symbol from the REST API after (re)connecting
+def resync_prices():
+    get_price_ingestion().resync()
+
 
 # Function to update asset prices on Galadriel based on real-time data
-def update_alpha_ensemble_asset_prices():
-    try:
-        # Remove the "USDT" part of the symbol before pushing on-chain
-        assets = [symbol.replace('USDT', '') for symbol in real_time_prices.keys()]
-        # Make sure prices correspond to the correct assets in the dictionary
-        prices = [int(real_time_prices[symbol] * 1e8) if real_time_prices[symbol] is not None else 0 for symbol in real_time_prices.keys()]
-
-        # Check if assets and prices are properly matched
-        print(f"Assets: {assets}")
-        print(f"Prices: {prices}")
-
-        txn = alpha_ensemble_contract.functions.updateAssetPricesManual(assets, prices).build_transaction({
-            'chainId': chain_id,
-            'gas': 10000000,
-            'gasPrice': galadriel_web3.eth.gas_price,
-            'nonce': galadriel_web3.eth.get_transaction_count(account.address),
-        })
-
-        signed_txn = galadriel_web3.eth.account.sign_transaction(txn, private_key=private_key)
-        tx_hash = galadriel_web3.eth.send_raw_transaction(signed_txn.rawTransaction)
-        receipt = galadriel_web3.eth.wait_for_transaction_receipt(tx_hash)
-        print(f"Updated prices on AlphaEnsembleContract with Tx: {tx_hash.hex()}, Status: {receipt['status']}")
-        print(f"Gas used: {receipt['gasUsed']}")
-    except Exception as e:
-        print(f"Failed to update prices in AlphaEnsembleContract on Galadriel: {e}")
+def update_alpha_ensemble_asset_prices(symbol_prices=None):
+    # Push the full vector unless only a subset of symbols is due
+    if symbol_prices is None:
+        symbol_prices = get_keeper().price_store.snapshot()
+    return get_keeper().push_prices(symbol_prices)
+
+
+# Read the inputs of every agent's LLM query in one multicall: prices, positions and strategies
+def fetch_agent_run_inputs():
+    keeper = get_keeper()
+    return keeper.fetch_agent_run_inputs(keeper.contract.functions.getAgentContracts().call())
+
 
 # Function to update positions in AlphaEnsembleContract using LLM
 def update_alpha_ensemble_llm_positions():
-    try:
-        txn = alpha_ensemble_contract.functions.startAllAgentRuns().build_transaction({
-            'chainId': chain_id,
-            'gas': 15000000,
-            'gasPrice': galadriel_web3.eth.gas_price,
-            'nonce': galadriel_web3.eth.get_transaction_count(account.address),
-        })
-
-        signed_txn = galadriel_web3.eth.account.sign_transaction(txn, private_key=private_key)
-        tx_hash = galadriel_web3.eth.send_raw_transaction(signed_txn.rawTransaction)
-        receipt = galadriel_web3.eth.wait_for_transaction_receipt(tx_hash)
-        print(f"Updated LLM positions on AlphaEnsembleContract with Tx: {tx_hash.hex()}, Status: {receipt['status']}")
-        print(f"Gas used: {receipt['gasUsed']}")
-    except Exception as e:
-        print(f"Failed to update LLM positions in AlphaEnsembleContract on Galadriel: {e}")
+    return get_keeper().start_agent_runs()
+
 
 def check_upkeep():
     current_time = time.time()
-    price_update_needed = (current_time - last_price_update_time) > price_update_interval
     llm_update_needed = (current_time - last_llm_update_time) > llm_update_interval
-    return price_update_needed, llm_update_needed
+    return llm_update_needed
 
-if __name__ == "__main__":
-    # Start WebSocket in a separate thread
-    websocket_thread = threading.Thread(target=start_binance_websocket)
-    websocket_thread.start()
-
-    try:
-        while True:
-            # Check if upkeep is needed
-            price_update_needed, llm_update_needed = check_upkeep()
 
-            if price_update_needed and real_time_prices:
-                # Update the AlphaEnsembleContract on Galadriel with the latest real-time prices from Binance
-                update_alpha_ensemble_asset_prices()
-
-                # Update the last price update time
-                last_price_update_time = time.time()
+if __name__ == "__main__":
+    start_exporter()
 
-            if llm_update_needed:
-                # Start LLM process to update positions
-                update_alpha_ensemble_llm_positions()
+    keeper = get_keeper()
+    ingestion = get_price_ingestion()
 
-                last_llm_update_time = time.time()
+    # Start WebSocket in a separate thread
+    ingestion.start()
 
-            # Wait for a short period before checking again
-            time.sleep(5)
+    stop = threading.Event()
+    try:
+        keeper.run(stop)
     except KeyboardInterrupt:
         print("Received stop signal")
-        stop_websocket_flag = True
-        ws.close()
-        websocket_thread.join()  # Ensure WebSocket thread is properly closed
+        ingestion.stop()  # Ensure WebSocket thread is properly closed
+        keeper.submitter.wait_all(timeout=30)
         print("WebSocket closed and program stopped.")
+    finally:
+        keeper.submitter.close()
@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import json
+import signal
+import time
+import websockets
+from web3 import Web3
+import keeper_daemon
+from connections import chain_id, get_async_web3, getenv, load_abi, rpc_url
+from keeper_daemon import (
+    BaseEnsembleKeeper, agent_abi_path, agent_run_input_calls, agent_run_inputs, alpha_ensemble_abi_path,
+    binance_stream_type, load_config,
+)
+from llm_run_cache import AsyncAgentResponses
+from metrics import start_exporter, ticks_received, ws_reconnects
+from multicall import async_multicall
+from shard_scheduler import AsyncShardScheduler
+from ws_supervisor import backoff_delay
+from tx_submitter import AsyncTxSubmitter
+from price_store import PriceStore, binance_combined_stream_url, fetch_binance_snapshot, iter_ticks, loads, subscribe_message
+
+# The keeper daemon on a single asyncio event loop. Ensembles come from the daemon's config
+# file (see config/keeper_daemon.example.json), or without one from the comma separated
+# addresses in NEXT_PUBLIC_ALPHA_ENSEMBLE_ADDRESS with the daemon's defaults. Price and run
+# decisions are the daemon's BaseEnsembleKeeper; only the RPCs and the scheduling differ.
+
+# Binance WebSocket setup, each group of symbols gets its own connection on the same event loop
+binance_socket_url = binance_combined_stream_url
+symbols_per_connection = 5
+
+# Jobs wait for the submitters in a bounded queue
+job_queue_size = 16
+
+
+def alpha_ensemble_addresses():
+    addresses = getenv('NEXT_PUBLIC_ALPHA_ENSEMBLE_ADDRESS', '')
+    return [address.strip() for address in addresses.split(',') if address.strip()]
+
+
+_submitters = {}
+
+
+def get_async_submitter(network, private_key):
+    """One AsyncTxSubmitter per RPC endpoint and signer address, like connections.get_submitter()."""
+    web3 = get_async_web3(network)
+    key = (rpc_url(network), web3.eth.account.from_key(private_key).address)
+    if key not in _submitters:
+        _submitters[key] = AsyncTxSubmitter(web3, private_key, chain_id(network))
+    return _submitters[key]
+
+
+class AsyncEnsembleKeeper(BaseEnsembleKeeper):
+    """EnsembleKeeper for AsyncWeb3 clients. Call load_assets() before scheduling prices."""
+
+    def __init__(self, config, price_store=None, private_key=None):
+        super().__init__(config, price_store)
+        self.submitter = get_async_submitter(self.network, private_key or self.private_key())
+        self.web3 = self.submitter.web3
+        self.contract = self.web3.eth.contract(
+            address=Web3.to_checksum_address(self.config['address']), abi=load_abi(alpha_ensemble_abi_path),
+        )
+        self.shard_scheduler = AsyncShardScheduler(self.submitter, gas_budget=self.config['gas_budget'])
+        self.agent_responses = AsyncAgentResponses(self.web3, load_abi(agent_abi_path), self.llm_run_cache)
+
+        # Latest price per symbol not yet seen by the push scheduler, set wakes schedule_prices
+        self.ticks = {}
+        self.ticks_ready = asyncio.Event()
+        # Set by submit_jobs once the queued price job of this keeper has run
+        self.price_job_done = asyncio.Event()
+
+    async def load_assets(self):
+        # Push exactly the assets the contract knows, unless the config narrows them down
+        self.track_assets(self.config['assets'] or await self.contract.functions.getAssetKeys().call())
+
+    def agent(self, address):
+        return self.web3.eth.contract(address=address, abi=load_abi(agent_abi_path))
+
+    async def push_prices(self, symbol_prices):
+        symbol_prices = self.prices_to_push(symbol_prices)
+        if not symbol_prices:
+            return []
+
+        try:
+            args, options = self.price_update(symbol_prices)
+            pending = [await self.submitter.submit(self.contract.functions.setAssetPrices(*args), **options)]
+            self.prices_sent(symbol_prices)
+
+            # Forward the prices to the agents in shards, nonces keep them ordered after the update above
+            if self.agent_count is None:
+                self.agent_count = await self.contract.functions.getAgentCount().call()
+            pending += await self.shard_scheduler.submit(
+                'updateAgentPrices',
+                lambda start, end: self.contract.functions.updateAgentPrices(start, end),
+                self.agent_count,
+                description=f"Updated agent prices on {self.name}",
+            )
+            return pending
+        except Exception as e:
+            self.price_push_failed(symbol_prices, e)
+            return []
+
+    async def fetch_agent_run_inputs(self, agent_addresses):
+        # Prices, positions and strategies of every agent in one multicall
+        agents = [self.agent(address) for address in agent_addresses]
+        results = await async_multicall(self.web3, agent_run_input_calls(self.contract, agents))
+        return agent_run_inputs(results, len(agents))
+
+    async def start_agent_runs(self):
+        try:
+            agent_addresses = await self.contract.functions.getAgentContracts().call()
+            self.agent_count = len(agent_addresses)
+            await self.agent_responses.poll(agent_addresses)
+            agent_count, ranges, callbacks = self.plan_agent_runs(*await self.fetch_agent_run_inputs(agent_addresses))
+            if not ranges:
+                return []
+            try:
+                return await self.shard_scheduler.submit(
+                    'startAgentRuns',
+                    lambda start, end: self.contract.functions.startAgentRuns(start, end),
+                    agent_count,
+                    description=f"Started agent runs on {self.name}",
+                    ranges=ranges,
+                    **callbacks,
+                )
+            except Exception:
+                self.agent_runs_failed(ranges)
+                raise
+        except Exception as e:
+            print(f"Failed to start agent runs on {self.name}: {e}")
+            return []
+
+
+def offer_tick(keeper, symbol, price):
+    # A newer tick of the same symbol replaces the one waiting, so backpressure never loses a
+    # symbol's only pending update and memory stays bounded by the number of symbols
+    keeper.ticks[symbol] = price
+    keeper.ticks_ready.set()
+
+
+def on_price(price_store, subscribers, symbol, price, timestamp):
+    # Ticks older than the stored one are ignored by the store and never reach the schedulers
+    i = price_store.update(symbol, price, timestamp)
+    if i >= 0:
+        for keeper in subscribers[i]:
+            offer_tick(keeper, symbol, price)
+
+
+async def resync_prices(symbols, price_store, subscribers):
+    # Re-seed every symbol from the REST API after (re)connecting, so prices missed while the
+    # socket was down do not wait for the next tick
+    try:
+        snapshot = await asyncio.to_thread(fetch_binance_snapshot, symbols)
+    except Exception as e:
+        print(f"Resync for {symbols} failed: {e}")
+        return
+    for symbol, price, timestamp in snapshot:
+        on_price(price_store, subscribers, symbol, price, timestamp)
+
+
+async def ingest(symbols, price_store, subscribers, stop, stream_type=binance_stream_type):
+    attempt = 0
+    while not stop.is_set():
+        connected_at = time.monotonic()
+        try:
+            async with websockets.connect(binance_socket_url, ping_interval=20, ping_timeout=10) as ws:
+                await ws.send(json.dumps(subscribe_message(symbols, stream_type)))
+                # Subscribed first, so no tick between the snapshot and the stream is lost
+                await resync_prices(symbols, price_store, subscribers)
+                async for message in ws:
+                    count = 0
+                    for symbol, price, timestamp in iter_ticks(loads(message)):
+                        count += 1
+                        on_price(price_store, subscribers, symbol, price, timestamp)
+                    ticks_received.inc(count, source='binance')
+        except Exception as e:
+            print(f"Error in WebSocket for {symbols}: {e}")
+        ws_reconnects.inc(source='binance')
+
+        # Jittered exponential backoff, reset once a connection has stayed up for a minute
+        if time.monotonic() - connected_at > 60:
+            attempt = 0
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+async def schedule_prices(keeper, jobs):
+    push_scheduler = keeper.push_scheduler
+    while True:
+        # Wake on a new tick, or once the next heartbeat is due
+        timeout = push_scheduler.time_to_heartbeat()
+        if timeout > 0:
+            try:
+                await asyncio.wait_for(keeper.ticks_ready.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        keeper.ticks_ready.clear()
+        ticks, keeper.ticks = keeper.ticks, {}
+        for symbol, price in ticks.items():
+            push_scheduler.on_price(symbol, price)
+        if not push_scheduler.due_assets():
+            continue
+
+        # One price job per keeper at a time. The job reads the due prices when it runs, so
+        # ticks arriving while the submitter is behind are coalesced into it
+        keeper.price_job_done.clear()
+        await jobs.put(('prices', keeper))
+        await keeper.price_job_done.wait()
+
+        # Still due after the job means the push failed: try again on the next tick, not at once
+        if push_scheduler.due_assets():
+            await keeper.ticks_ready.wait()
+
+
+async def schedule_llm_runs(keeper, jobs):
+    while True:
+        await asyncio.sleep(keeper.config['llm_update_interval'])
+        await jobs.put(('llm', keeper))
+
+
+async def submit_jobs(jobs):
+    while True:
+        kind, keeper = await jobs.get()
+        try:
+            if kind == 'prices':
+                await keeper.push_prices(keeper.push_scheduler.due_assets())
+            else:
+                await keeper.start_agent_runs()
+        except Exception as e:
+            print(f"Failed to submit {kind} update for {keeper.name}: {e}")
+        finally:
+            if kind == 'prices':
+                keeper.price_job_done.set()
+            jobs.task_done()
+
+
+def symbol_groups(symbols):
+    return [symbols[i:i + symbols_per_connection] for i in range(0, len(symbols), symbols_per_connection)]
+
+
+async def main(config_path=None):
+    if config_path:
+        config, ensemble_configs = load_config(config_path)
+        keeper_daemon.price_max_age = config.get('price_max_age', keeper_daemon.price_max_age)
+    else:
+        config, ensemble_configs = {}, [{'address': address} for address in alpha_ensemble_addresses()]
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    start_exporter(config.get('metrics_port'), config.get('metrics_log_interval'))
+    keepers = [AsyncEnsembleKeeper(ensemble_config) for ensemble_config in ensemble_configs]
+    submitters = list(_submitters.values())
+    for submitter in submitters:
+        submitter.start()
+    for keeper in keepers:
+        await keeper.load_assets()
+
+    # One price store for every ensemble's symbols, each tick is offered to the keepers trading it
+    symbols = sorted({symbol for keeper in keepers for symbol in keeper.symbols})
+    price_store = PriceStore(symbols)
+    subscribers = [[] for _ in symbols]
+    for keeper in keepers:
+        keeper.price_store = price_store
+        for symbol in keeper.symbols:
+            subscribers[price_store.index[symbol]].append(keeper)
+    jobs = asyncio.Queue(maxsize=job_queue_size)
+
+    stream_type = config.get('stream_type', binance_stream_type)
+    tasks = [
+        asyncio.create_task(ingest(group, price_store, subscribers, stop, stream_type))
+        for group in symbol_groups(symbols)
+    ]
+    tasks += [asyncio.create_task(schedule_prices(keeper, jobs)) for keeper in keepers]
+    tasks += [asyncio.create_task(schedule_llm_runs(keeper, jobs)) for keeper in keepers]
+    tasks.append(asyncio.create_task(submit_jobs(jobs)))
+    print(f"Serving {len(keepers)} ensembles over {len(symbols)} symbols")
+
+    await stop.wait()
+    print("Received stop signal")
+
+    # Stop producing work, then give in-flight transactions a chance to confirm
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for submitter in submitters:
+        await submitter.wait_all(timeout=30)
+        await submitter.close()
+    for web3 in {id(submitter.web3): submitter.web3 for submitter in submitters}.values():
+        await web3.provider.close()
+    print("Keeper stopped.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the AlphaEnsemble keepers on one asyncio event loop")
+    parser.add_argument('--config', help="keeper_daemon JSON config, default the ensembles in NEXT_PUBLIC_ALPHA_ENSEMBLE_ADDRESS")
+    args = parser.parse_args()
+    asyncio.run(main(args.config))
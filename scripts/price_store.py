@@ -0,0 +1,154 @@
+import json
+import threading
+import time
+import numpy as np
+
+# orjson decodes Binance payloads several times faster than the standard library when installed
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+# Combined stream endpoint: payloads arrive wrapped as {"stream": ..., "data": ...}
+binance_combined_stream_url = "wss://stream.binance.com:9443/stream"
+
+# REST endpoint used to re-seed prices after a reconnect. Its rolling window stats carry the
+# exchange time they were last updated (closeTime), unlike /ticker/price
+binance_ticker_url = "https://api.binance.com/api/v3/ticker"
+
+# Stream types that carry a usable price, lightest first
+binance_stream_types = ('bookTicker', 'miniTicker', 'ticker')
+
+
+class PriceStore:
+    """
+    Preallocated, symbol-indexed arrays holding the last price, exchange timestamp (ms) and
+    per-symbol update sequence. Updates are a dict lookup and three array writes, so the
+    ingestion thread stays cheap as the symbol universe grows. A tick older than the stored
+    one is ignored, so a REST snapshot racing the websocket never rolls a price back, and a
+    lock keeps the ingestion and resync threads from interleaving their writes.
+    """
+
+    def __init__(self, symbols):
+        self.symbols = [symbol.upper() for symbol in symbols]
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.prices = np.full(len(self.symbols), np.nan, dtype=np.float64)
+        self.timestamps = np.zeros(len(self.symbols), dtype=np.int64)
+        self.sequence = np.zeros(len(self.symbols), dtype=np.int64)
+        self.total_ticks = 0
+        self._lock = threading.Lock()
+
+    def update(self, symbol, price, timestamp):
+        """
+        Store a tick and return its symbol index, or -1 for symbols that are not tracked and
+        for ticks older than the one already stored.
+        """
+        i = self.index.get(symbol, -1)
+        if i < 0:
+            return i
+        with self._lock:
+            if timestamp < self.timestamps[i]:
+                return -1
+            self.prices[i] = price
+            self.timestamps[i] = timestamp
+            self.sequence[i] += 1
+            self.total_ticks += 1
+        return i
+
+    def get(self, symbol):
+        with self._lock:
+            price = self.prices[self.index[symbol]]
+        return None if np.isnan(price) else float(price)
+
+    def timestamp(self, symbol):
+        """Exchange time (ms) of the symbol's last tick, 0 if it never had one."""
+        with self._lock:
+            return int(self.timestamps[self.index[symbol]])
+
+    def snapshot(self, max_age=None, now=None):
+        """
+        Latest price per symbol for every symbol that has a positive price, leaving out
+        symbols whose last tick is older than max_age seconds when it is given.
+        """
+        with self._lock:
+            usable = self.prices > 0  # NaN compares False, so symbols without a tick are excluded
+            if max_age is not None:
+                usable &= ~self._stale_mask(max_age, now)
+            return {self.symbols[i]: float(self.prices[i]) for i in np.flatnonzero(usable)}
+
+    def stale(self, max_age, now=None):
+        """Symbols with no tick, or none within the last max_age seconds."""
+        with self._lock:
+            stale = self._stale_mask(max_age, now) | np.isnan(self.prices)
+        return [self.symbols[i] for i in np.flatnonzero(stale)]
+
+    def fresh(self, symbol_prices, max_age, now=None):
+        """The entries of symbol_prices whose symbol is tracked, priced and not stale."""
+        stale = set(self.stale(max_age, now))
+        return {
+            symbol: price for symbol, price in symbol_prices.items()
+            if symbol in self.index and symbol not in stale and price > 0
+        }
+
+    def age(self, symbol, now=None):
+        """Seconds since the symbol's last tick, None if it never had one."""
+        i = self.index[symbol]
+        with self._lock:
+            if np.isnan(self.prices[i]):
+                return None
+            timestamp = self.timestamps[i]
+        now = time.time() if now is None else now
+        return now - timestamp / 1000
+
+    def _stale_mask(self, max_age, now=None):
+        now_ms = (time.time() if now is None else now) * 1000
+        return self.timestamps < now_ms - max_age * 1000
+
+
+def fetch_binance_snapshot(symbols, timeout=5):
+    """
+    Current prices for symbols from the Binance REST API as (symbol, price, timestamp_ms)
+    ticks, stamped with the exchange's closeTime like websocket ticks are with their event
+    time, so which one wins never depends on the local clock.
+    """
+    import requests
+
+    response = requests.get(
+        binance_ticker_url,
+        params={
+            'symbols': json.dumps([symbol.upper() for symbol in symbols], separators=(',', ':')),
+            'type': 'MINI',
+        },
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    return [(ticker['symbol'], float(ticker['lastPrice']), int(ticker['closeTime'])) for ticker in response.json()]
+
+
+def subscribe_message(symbols, stream_type='miniTicker', request_id=1):
+    # Any other stream subscribes fine but never yields a tick iter_ticks understands
+    if stream_type not in binance_stream_types:
+        raise ValueError(f"Unsupported Binance stream type {stream_type!r}, expected one of {binance_stream_types}")
+    return {
+        "method": "SUBSCRIBE",
+        "params": [f"{symbol.lower()}@{stream_type}" for symbol in symbols],
+        "id": request_id
+    }
+
+
+def iter_ticks(payload):
+    """
+    Yield (symbol, price, timestamp_ms) from a decoded Binance message. Handles raw and
+    combined-stream payloads for ticker, miniTicker and bookTicker (mid price) streams.
+    """
+    data = payload.get('data', payload) if isinstance(payload, dict) else payload
+    events = data if isinstance(data, list) else (data,)
+    for event in events:
+        symbol = event.get('s')
+        if symbol is None:
+            continue
+        if 'c' in event:
+            yield symbol, float(event['c']), event.get('E') or int(time.time() * 1000)
+        elif 'b' in event and 'a' in event:
+            yield symbol, (float(event['b']) + float(event['a'])) / 2, event.get('E') or int(time.time() * 1000)
@@ -0,0 +1,97 @@
+import threading
+import time
+
+
+class DeviationPushScheduler:
+    """
+    Decides when prices should be pushed on-chain. An asset is due when its price has moved
+    more than its deviation threshold (in basis points) since the last push, or when its
+    heartbeat has expired. Price ticks wake waiting callers immediately, so a push can go
+    out as soon as a tick crosses a threshold instead of on the next polling interval.
+    """
+
+    def __init__(self, assets, deviation_bps=25, heartbeat=60, asset_deviation_bps=None):
+        asset_deviation_bps = asset_deviation_bps or {}
+        self.assets = list(assets)
+        self.heartbeat = heartbeat
+        self.deviation_bps = {asset: asset_deviation_bps.get(asset, deviation_bps) for asset in self.assets}
+
+        self._latest = {asset: None for asset in self.assets}
+        self._last_pushed = {asset: None for asset in self.assets}
+        self._last_push_time = {asset: 0.0 for asset in self.assets}
+        self._cond = threading.Condition()
+
+    def on_price(self, asset, price):
+        """Record a new tick and wake the push loop if it makes the asset due."""
+        with self._cond:
+            if asset not in self._latest:
+                return
+            self._latest[asset] = price
+            if self._deviated(asset):
+                self._cond.notify_all()
+
+    def wait_for_due(self, timeout=None):
+        """
+        Block until at least one asset is due or the timeout passes.
+        Returns a dict of due asset -> latest price (empty on timeout).
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                due = self._due_assets(time.time())
+                if due:
+                    return due
+
+                wait = self._time_to_heartbeat(time.time())
+                if deadline is not None:
+                    wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    return {}
+                self._cond.wait(wait)
+
+    def due_assets(self):
+        """Non-blocking check, for callers that run their own wait loop (e.g. asyncio)."""
+        with self._cond:
+            return self._due_assets(time.time())
+
+    def time_to_heartbeat(self):
+        with self._cond:
+            return self._time_to_heartbeat(time.time())
+
+    def mark_pushed(self, prices):
+        with self._cond:
+            now = time.time()
+            for asset, price in prices.items():
+                self._last_pushed[asset] = price
+                self._last_push_time[asset] = now
+
+    def reset(self, assets):
+        """Forget the last push for these assets (e.g. the tx failed) so they are due again."""
+        with self._cond:
+            for asset in assets:
+                self._last_pushed[asset] = None
+                self._last_push_time[asset] = 0.0
+            self._cond.notify_all()
+
+    def _deviated(self, asset):
+        latest = self._latest[asset]
+        last = self._last_pushed[asset]
+        if latest is None:
+            return False
+        if not last:
+            return True
+        return abs(latest - last) * 10000 >= self.deviation_bps[asset] * last
+
+    def _due_assets(self, now):
+        return {
+            asset: price for asset, price in self._latest.items()
+            if price is not None and (self._deviated(asset) or now - self._last_push_time[asset] >= self.heartbeat)
+        }
+
+    def _time_to_heartbeat(self, now):
+        # Only assets that have a price can become due through their heartbeat
+        deadlines = [
+            self._last_push_time[asset] + self.heartbeat - now
+            for asset, price in self._latest.items() if price is not None
+        ]
+        return min(deadlines) if deadlines else self.heartbeat
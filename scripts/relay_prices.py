@@ -1,93 +1,109 @@
 import os
 import time
-from web3 import Web3
-from dotenv import load_dotenv
+from functools import lru_cache
+from connections import get_contract, get_submitter, get_web3, getenv
+from metrics import feed_failures, start_exporter
+from multicall import multicall
 
-# Load environment variables from frontend/.env.local
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '../frontend/.env.local'))
+# ABIs for the Sepolia oracle and the Galadriel receiver, next to this script
+sepolia_oracle_abi_path = os.path.join(os.path.dirname(__file__), "USDPriceOracleABI.json")
+galadriel_receiver_abi_path = os.path.join(os.path.dirname(__file__), "GaladrielPriceReceiverABI.json")
 
-# Initialize Web3 instances for Sepolia and Galadriel networks
-sepolia_web3 = Web3(Web3.HTTPProvider(f"https://sepolia.infura.io/v3/{os.getenv('INFURA_PROJECT_ID')}"))
-galadriel_web3 = Web3(Web3.HTTPProvider(os.getenv('GALADRIEL_RPC_URL')))
+@lru_cache(maxsize=None)
+def get_sepolia_oracle():
+    return get_contract('sepolia', getenv('NEXT_PUBLIC_USD_PRICE_ORACLE_ADDRESS'), sepolia_oracle_abi_path)
 
-# Contract addresses and ABIs (replace with actual ABIs or paths to ABI files)
-sepolia_oracle_address = Web3.to_checksum_address(os.getenv('NEXT_PUBLIC_USD_PRICE_ORACLE_ADDRESS'))
-galadriel_receiver_address = Web3.to_checksum_address(os.getenv('NEXT_PUBLIC_GALADRIEL_PRICE_RECEIVER_ADDRESS'))
+@lru_cache(maxsize=None)
+def get_galadriel_receiver():
+    return get_contract('galadriel', getenv('NEXT_PUBLIC_GALADRIEL_PRICE_RECEIVER_ADDRESS'), galadriel_receiver_abi_path)
 
-# Load the ABIs
-with open(os.path.join(os.path.dirname(__file__), "USDPriceOracleABI.json")) as f:
-    sepolia_oracle_abi = f.read()
+# Last price confirmed on Galadriel for each asset, used to relay only what changed
+last_relayed_prices = {}
 
-with open(os.path.join(os.path.dirname(__file__), "GaladrielPriceReceiverABI.json")) as f:
-    galadriel_receiver_abi = f.read()
-
-# Initialize contract instances
-sepolia_oracle = sepolia_web3.eth.contract(address=sepolia_oracle_address, abi=sepolia_oracle_abi)
-galadriel_receiver = galadriel_web3.eth.contract(address=galadriel_receiver_address, abi=galadriel_receiver_abi)
-
-# Private key and account for sending transactions on Galadriel
-private_key = os.getenv('NEXT_PUBLIC_PRIVATE_KEY_GALADRIEL')
-account = galadriel_web3.eth.account.from_key(private_key)
-
-# Ensure GALADRIEL_CHAIN_ID is loaded correctly
-galadriel_chain_id = os.getenv('GALADRIEL_CHAIN_ID')
-if galadriel_chain_id is None:
-    raise ValueError("GALADRIEL_CHAIN_ID environment variable is not set.")
-chain_id = int(galadriel_chain_id)
+# Longest a cycle waits for its transactions, a stuck one is left to the submitter and the
+# loop moves on to the next cycle
+confirm_timeout = 180  # seconds
 
 def update_oracle_prices():
     try:
         # Assuming the oracle contract has an updatePrices function
-        update_txn = sepolia_oracle.functions.updatePrices().build_transaction({
-            'from': account.address,
-            'gas': 300000,
-            'gasPrice': sepolia_web3.eth.gas_price,
-            'nonce': sepolia_web3.eth.get_transaction_count(account.address),
-        })
-
-        # Sign the transaction
-        signed_update_txn = sepolia_web3.eth.account.sign_transaction(update_txn, private_key=private_key)
-
-        # Send the transaction
-        update_tx_hash = sepolia_web3.eth.send_raw_transaction(signed_update_txn.rawTransaction)
+        pending = get_submitter('sepolia').submit(
+            get_sepolia_oracle().functions.updatePrices(),
+            description="Oracle prices updated on Sepolia",
+        )
 
-        # Wait for transaction receipt
-        update_receipt = sepolia_web3.eth.wait_for_transaction_receipt(update_tx_hash)
-        print(f"Oracle prices updated on Sepolia with Tx: {update_tx_hash.hex()}, Status: {update_receipt['status']}")
+        # The relay reads these prices back, so this one has to be mined first
+        if pending.wait(timeout=confirm_timeout) is None:
+            print(f"Oracle price update on Sepolia not confirmed: {pending.error or 'still pending'}")
 
     except Exception as e:
         print(f"An error occurred while updating prices on Sepolia: {e}")
 
-def relay_prices():
+def fetch_oracle_prices():
+    sepolia_oracle = get_sepolia_oracle()
     assets = sepolia_oracle.functions.getAssets().call()
 
-    for asset in assets:
+    # Fetch every price from the Sepolia Oracle in a single round trip
+    results = multicall(get_web3('sepolia'), [sepolia_oracle.functions.getPrice(asset) for asset in assets])
+
+    prices = {}
+    for asset, result in zip(assets, results):
+        if not result.success:
+            feed_failures.inc(feed=asset)
+            print(f"An error occurred while fetching the price of {asset}: {result.error}")
+            continue
+        prices[asset] = result.value
+    return prices
+
+def relay_prices(bulk=True):
+    prices = fetch_oracle_prices()
+
+    if bulk:
+        relay_prices_bulk(prices)
+        return
+
+    for asset, price in prices.items():
         try:
-            # Fetch price from Sepolia Oracle
-            price = sepolia_oracle.functions.getPrice(asset).call()
-
-            # Prepare transaction to update the price on Galadriel
-            nonce = galadriel_web3.eth.get_transaction_count(account.address)
-            txn = galadriel_receiver.functions.updatePrice(asset, price).build_transaction({
-                'chainId': chain_id,  # Use the validated chain_id
-                'gas': 200000,
-                'gasPrice': galadriel_web3.eth.gas_price,
-                'nonce': nonce,
-            })
-
-            # Sign the transaction
-            signed_txn = galadriel_web3.eth.account.sign_transaction(txn, private_key=private_key)
-
-            # Send the transaction
-            tx_hash = galadriel_web3.eth.send_raw_transaction(signed_txn.rawTransaction)
-
-            # Wait for transaction receipt
-            receipt = galadriel_web3.eth.wait_for_transaction_receipt(tx_hash)
-            print(f"Updated {asset} price on Galadriel with Tx: {tx_hash.hex()}, Status: {receipt['status']}")
+            # Send the update without waiting, receipts are confirmed in the background
+            get_submitter('galadriel').submit(
+                get_galadriel_receiver().functions.updatePrice(asset, price),
+                description=f"Updated {asset} price on Galadriel",
+            )
         except Exception as e:
             print(f"An error occurred while processing asset {asset}: {e}")
 
+    # All updates land in roughly the same block, wait for them before the next cycle
+    if not get_submitter('galadriel').wait_all(timeout=confirm_timeout):
+        print(f"Price updates on Galadriel still pending after {confirm_timeout}s")
+
+def relay_prices_bulk(prices):
+    # Only push assets whose price differs from what was last confirmed on Galadriel
+    changed = {asset: price for asset, price in prices.items() if last_relayed_prices.get(asset) != price}
+    if not changed:
+        print("No price changes to relay to Galadriel")
+        return
+
+    assets = list(changed.keys())
+    new_prices = list(changed.values())
+
+    def on_receipt(receipt):
+        if receipt['status'] == 1:
+            last_relayed_prices.update(changed)
+
+    try:
+        pending = get_submitter('galadriel').submit(
+            get_galadriel_receiver().functions.updatePrices(assets, new_prices),
+            description=f"Updated {len(assets)} prices on Galadriel",
+            on_receipt=on_receipt,
+        )
+        if pending.wait(timeout=confirm_timeout) is None:
+            print(f"Relay of {len(assets)} prices not confirmed: {pending.error or 'still pending'}")
+    except Exception as e:
+        print(f"An error occurred while relaying {len(assets)} prices: {e}")
+
 if __name__ == "__main__":
+    start_exporter()
+
     # Permanent loop with a sleep interval
     try:
         while True:
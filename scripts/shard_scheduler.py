@@ -0,0 +1,184 @@
+import asyncio
+import threading
+from collections import defaultdict, deque
+from gas_strategy import ran_out_of_gas
+
+
+class ShardScheduler:
+    """
+    Splits per-agent work (startAgentRuns, updateAgentPrices) into [from, to) ranges that
+    fit a gas budget. Shard sizes come from the gasUsed of earlier shards, measured per
+    agent, so they adapt as the agent count (and the cost of each agent's query) grows.
+    A shard that runs out of gas is split in half and resubmitted; a shard that reverts for
+    any other reason is logged and left alone, since resending it would revert again.
+    """
+
+    def __init__(self, submitter, gas_budget=8000000, margin=1.25, history=20):
+        self.submitter = submitter
+        self.gas_budget = gas_budget
+        self.margin = margin
+        self._gas_per_agent = defaultdict(lambda: deque(maxlen=history))
+        self._lock = threading.Lock()
+
+    def record(self, method, gas_used, shard_size):
+        with self._lock:
+            self._gas_per_agent[method].append(gas_used / shard_size)
+
+    def gas_per_agent(self, method, make_call):
+        per_agent = self._measured_gas_per_agent(method)
+        if per_agent is None:
+            # No measurements yet: seed from a one-agent estimate
+            per_agent = self._seed(method, make_call(0, 1).estimate_gas({'from': self.submitter.account.address}))
+        return per_agent
+
+    def _measured_gas_per_agent(self, method):
+        with self._lock:
+            history = list(self._gas_per_agent[method])
+        # Use the most expensive recent agent so shards stay under budget as costs drift
+        return max(history) * self.margin if history else None
+
+    def _seed(self, method, estimate):
+        self.record(method, estimate, 1)
+        return estimate * self.margin
+
+    def on_failure(self, method, receipt, gas, start, end, description):
+        """
+        Handle a failed shard receipt and return the [from, to) ranges to resubmit. Only a
+        shard that used at least 63/64 of its gas limit ran out of gas (a nested call that
+        runs out leaves the rest unused); anything else is a revert.
+        """
+        size = end - start
+        if not ran_out_of_gas(receipt, gas):
+            print(f"{description} reverted for agents {start}-{end - 1} after {receipt['gasUsed']} gas")
+            return []
+
+        if size == 1 and gas >= self.gas_budget:
+            # Nothing larger can be sent, and recording it would shrink every later shard to one agent
+            print(f"{description} for agent {start} needs more than the {self.gas_budget} gas budget")
+            return []
+
+        # Out of gas: learn a larger limit and retry in halves (a single agent with the larger limit)
+        self.record(method, gas * 2, size)
+        if size == 1:
+            return [(start, end)]
+        middle = start + size // 2
+        return [(start, middle), (middle, end)]
+
+    def shards(self, method, make_call, agent_count, first=0):
+        return self._split(self.gas_per_agent(method, make_call), agent_count, first)
+
+    def _split(self, per_agent, agent_count, first):
+        size = max(1, int(self.gas_budget // per_agent))
+        return [(start, min(start + size, agent_count)) for start in range(first, agent_count, size)]
+
+    def submit(self, method, make_call, agent_count, description=None, ranges=None, on_success=None,
+               on_abandoned=None):
+        """
+        Submit make_call(from, to) for every shard back-to-back, without waiting for receipts.
+        make_call builds the contract function for one range, e.g.
+        lambda start, end: contract.functions.startAgentRuns(start, end).
+        ranges limits the work to some [from, to) ranges instead of all agent_count agents, and
+        on_success(from, to) is called for every shard that lands, including retried halves.
+        on_abandoned(from, to) is called for every failed, dropped or timed out shard that is
+        not retried.
+        """
+        description = description or method
+        pending = []
+        for first, last in ranges if ranges is not None else [(0, agent_count)]:
+            for start, end in self.shards(method, make_call, last, first):
+                pending.append(self._submit_shard(method, make_call, start, end, description, on_success, on_abandoned))
+        return pending
+
+    def _submit_shard(self, method, make_call, start, end, description, on_success=None, on_abandoned=None):
+        gas = self._shard_gas(self.gas_per_agent(method, make_call), end - start)
+
+        def resubmit(retries):
+            for retry_start, retry_end in retries:
+                try:
+                    self._submit_shard(method, make_call, retry_start, retry_end, description, on_success, on_abandoned)
+                except Exception as e:
+                    self._resubmit_failed(retry_start, retry_end, description, on_abandoned, e)
+
+        return self.submitter.submit(
+            make_call(start, end),
+            gas=gas,
+            description=f"{description} for agents {start}-{end - 1}",
+            **self._callbacks(method, gas, start, end, description, on_success, on_abandoned, resubmit),
+        )
+
+    def _shard_gas(self, per_agent, size):
+        return min(int(per_agent * size), self.gas_budget)
+
+    def _callbacks(self, method, gas, start, end, description, on_success, on_abandoned, resubmit):
+        """Receipt and error callbacks for one shard; resubmit(ranges) sends the retried halves."""
+
+        def on_receipt(receipt):
+            if receipt['status'] == 1:
+                self.record(method, receipt['gasUsed'], end - start)
+                if on_success is not None:
+                    on_success(start, end)
+                return
+
+            retries = self.on_failure(method, receipt, gas, start, end, description)
+            if retries:
+                resubmit(retries)
+            elif on_abandoned is not None:
+                on_abandoned(start, end)
+
+        # Dropped from the mempool or given up on, no receipt will come
+        def on_error(error):
+            if on_abandoned is not None:
+                on_abandoned(start, end)
+
+        return {'on_receipt': on_receipt, 'on_error': on_error}
+
+    def _resubmit_failed(self, start, end, description, on_abandoned, error):
+        print(f"Failed to resubmit {description} for agents {start}-{end - 1}: {error}")
+        if on_abandoned is not None:
+            on_abandoned(start, end)
+
+
+class AsyncShardScheduler(ShardScheduler):
+    """ShardScheduler for AsyncTxSubmitter, retried halves are sent from a task on the loop."""
+
+    async def gas_per_agent(self, method, make_call):
+        per_agent = self._measured_gas_per_agent(method)
+        if per_agent is None:
+            per_agent = self._seed(
+                method, await make_call(0, 1).estimate_gas({'from': self.submitter.account.address}),
+            )
+        return per_agent
+
+    async def shards(self, method, make_call, agent_count, first=0):
+        return self._split(await self.gas_per_agent(method, make_call), agent_count, first)
+
+    async def submit(self, method, make_call, agent_count, description=None, ranges=None, on_success=None,
+                     on_abandoned=None):
+        description = description or method
+        pending = []
+        for first, last in ranges if ranges is not None else [(0, agent_count)]:
+            for start, end in await self.shards(method, make_call, last, first):
+                pending.append(await self._submit_shard(
+                    method, make_call, start, end, description, on_success, on_abandoned,
+                ))
+        return pending
+
+    async def _submit_shard(self, method, make_call, start, end, description, on_success=None, on_abandoned=None):
+        gas = self._shard_gas(await self.gas_per_agent(method, make_call), end - start)
+
+        def resubmit(retries):
+            asyncio.create_task(self._resubmit(method, make_call, retries, description, on_success, on_abandoned))
+
+        return await self.submitter.submit(
+            make_call(start, end),
+            gas=gas,
+            description=f"{description} for agents {start}-{end - 1}",
+            **self._callbacks(method, gas, start, end, description, on_success, on_abandoned, resubmit),
+        )
+
+    async def _resubmit(self, method, make_call, ranges, description, on_success, on_abandoned):
+        for start, end in ranges:
+            try:
+                await self._submit_shard(method, make_call, start, end, description, on_success, on_abandoned)
+            except Exception as e:
+                self._resubmit_failed(start, end, description, on_abandoned, e)
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import connections
+
+
+class StatusServer:
+    """Local HTTP server answering every POST with one status, counting the requests."""
+
+    def __init__(self, status):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                server.requests += 1
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.requests = 0
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def rpc_settings(monkeypatch):
+    monkeypatch.setenv('RPC_RETRIES', '2')
+    monkeypatch.setenv('RPC_BACKOFF', '0')
+    connections.get_session.cache_clear()
+    yield
+    connections.get_session.cache_clear()
+
+
+@pytest.fixture
+def server_502():
+    server = StatusServer(502)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def server_404():
+    server = StatusServer(404)
+    yield server
+    server.close()
+
+
+def web3_for(url):
+    from web3 import Web3
+    return Web3(connections.make_http_provider(url, {'timeout': 5}))
+
+
+def test_reads_are_retried_on_error_statuses(rpc_settings, server_502):
+    with pytest.raises(requests.RequestException):
+        web3_for(server_502.url).manager.request_blocking('eth_blockNumber', [])
+    assert server_502.requests == 3
+
+
+def test_sends_are_never_retried_once_they_reached_the_node(rpc_settings, server_502):
+    with pytest.raises(requests.RequestException):
+        web3_for(server_502.url).manager.request_blocking('eth_sendRawTransaction', ['0x00'])
+    assert server_502.requests == 1
+
+
+def async_request(url, method, params):
+    async def run():
+        provider = connections.make_async_http_provider(url, 5)
+        try:
+            return await provider.make_request(method, params)
+        finally:
+            await provider.close()
+
+    return asyncio.run(run())
+
+
+def test_async_reads_are_retried_on_error_statuses(rpc_settings, server_502):
+    import aiohttp
+    with pytest.raises(aiohttp.ClientResponseError):
+        async_request(server_502.url, 'eth_blockNumber', [])
+    assert server_502.requests == 3
+
+
+def test_async_reads_are_not_retried_on_client_errors(rpc_settings, server_404):
+    import aiohttp
+    with pytest.raises(aiohttp.ClientResponseError):
+        async_request(server_404.url, 'eth_blockNumber', [])
+    assert server_404.requests == 1
+
+
+def test_async_sends_are_never_retried_once_they_reached_the_node(rpc_settings, server_502):
+    import aiohttp
+    with pytest.raises(aiohttp.ClientResponseError):
+        async_request(server_502.url, 'eth_sendRawTransaction', ['0x00'])
+    assert server_502.requests == 1
@@ -0,0 +1,138 @@
+import json
+
+import pytest
+from hexbytes import HexBytes
+from web3.exceptions import TransactionNotFound
+
+import deploy_agents
+
+
+class FakeEth:
+    def __init__(self):
+        self.receipts = {}
+        self.mempool = set()
+
+    def get_transaction_receipt(self, tx_hash):
+        if tx_hash not in self.receipts:
+            raise TransactionNotFound(tx_hash)
+        return self.receipts[tx_hash]
+
+    def get_transaction(self, tx_hash):
+        if tx_hash not in self.mempool:
+            raise TransactionNotFound(tx_hash)
+        return {'hash': tx_hash}
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+class FakeEvent:
+    def process_receipt(self, receipt):
+        return [{'args': {'agentContractAddress': receipt['agent']}}] if receipt['status'] == 1 else []
+
+
+class FakeEvents:
+    def AgentContractDeployed(self):
+        return FakeEvent()
+
+
+class FakeFunctions:
+    def deployAgent(self, strategy_details):
+        return strategy_details
+
+
+class FakeEnsemble:
+    events = FakeEvents()
+    functions = FakeFunctions()
+
+
+class FakePendingTx:
+    def __init__(self, n, receipt=None, error=None):
+        self.tx_hash = HexBytes(bytes([n]) * 32)
+        self.tx_hashes = [self.tx_hash]
+        self.receipt = receipt
+        self.error = error
+
+
+class FakeSubmitter:
+    """Answers each deployAgent with the outcome the test queued for its strategy."""
+
+    def __init__(self):
+        self.outcomes = {}
+        self.submitted = []
+
+    def submit(self, strategy_details, gas, description):
+        self.submitted.append(strategy_details)
+        return self.outcomes[strategy_details]
+
+    def wait_all(self, timeout):
+        return True
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    web3, submitter = FakeWeb3(), FakeSubmitter()
+    monkeypatch.setattr(deploy_agents, 'get_web3', lambda: web3)
+    monkeypatch.setattr(deploy_agents, 'get_submitter', lambda: submitter)
+    monkeypatch.setattr(deploy_agents, 'get_alpha_ensemble', lambda: FakeEnsemble())
+    monkeypatch.setattr(deploy_agents, 'estimate_deploy_gas', lambda strategy_details: 1_000_000)
+    return web3, submitter
+
+
+def test_unmined_deployments_are_recorded_as_pending(chain, tmp_path):
+    _, submitter = chain
+    manifest_path = str(tmp_path / 'manifest.json')
+    submitter.outcomes = {
+        'a': FakePendingTx(1, receipt={'status': 1, 'gasUsed': 500_000, 'agent': '0xA'}),
+        'b': FakePendingTx(2),  # still pending at the deadline
+        'c': FakePendingTx(3, error='timeout'),  # given up on, may still be mined
+        'd': FakePendingTx(4, error='dropped'),
+    }
+    deploy_agents.deploy_fleet(['a', 'b', 'c', 'd'], manifest_path=manifest_path)
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    assert [(entry['status'], entry['agentAddress'], entry['error']) for entry in manifest] == [
+        (1, '0xA', None),
+        ('pending', None, None),
+        ('pending', None, None),
+        (None, None, 'no receipt: dropped'),
+    ]
+    assert manifest[1]['txHash'] == HexBytes(b'\x02' * 32).hex()
+    assert manifest[1]['txHashes'] == [HexBytes(b'\x02' * 32).hex()]
+
+
+def test_rerun_reconciles_pending_deployments_against_receipts(chain, tmp_path):
+    web3, submitter = chain
+    manifest_path = str(tmp_path / 'manifest.json')
+    submitter.outcomes = {strategy: FakePendingTx(n) for n, strategy in enumerate('abcd', 1)}
+    submitter.outcomes['a'].receipt = {'status': 1, 'gasUsed': 500_000, 'agent': '0xA'}
+    deploy_agents.deploy_fleet(['a', 'b', 'c', 'd'], manifest_path=manifest_path)
+
+    # b was mined, c is still in the mempool and d was dropped while nobody watched
+    hashes = {strategy: pending.tx_hash.hex() for strategy, pending in submitter.outcomes.items()}
+    web3.eth.receipts[hashes['b']] = {'status': 1, 'gasUsed': 500_000, 'agent': '0xB'}
+    web3.eth.mempool.add(hashes['c'])
+    submitter.submitted.clear()
+    submitter.outcomes['d'] = FakePendingTx(5, receipt={'status': 1, 'gasUsed': 500_000, 'agent': '0xD'})
+
+    manifest = deploy_agents.deploy_fleet(['a', 'b', 'c', 'd'], manifest_path=manifest_path)
+    assert submitter.submitted == ['d']
+    assert [(entry['status'], entry['agentAddress']) for entry in manifest] == [
+        (1, '0xA'), (1, '0xB'), ('pending', None), (1, '0xD'),
+    ]
+
+
+def test_changed_strategies_are_not_matched_to_the_previous_manifest(chain, tmp_path):
+    _, submitter = chain
+    manifest_path = str(tmp_path / 'manifest.json')
+    submitter.outcomes = {'a': FakePendingTx(1, receipt={'status': 1, 'gasUsed': 500_000, 'agent': '0xA'})}
+    deploy_agents.deploy_fleet(['a'], manifest_path=manifest_path)
+
+    submitter.outcomes['x'] = FakePendingTx(2, receipt={'status': 1, 'gasUsed': 500_000, 'agent': '0xX'})
+    submitter.submitted.clear()
+    manifest = deploy_agents.deploy_fleet(['x', 'a'], manifest_path=manifest_path)
+    assert submitter.submitted == ['x', 'a']
+    assert [entry['agentAddress'] for entry in manifest] == ['0xX', '0xA']
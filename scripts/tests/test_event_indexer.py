@@ -0,0 +1,123 @@
+from collections import Counter
+
+import pytest
+from eth_abi import encode
+from eth_utils import event_abi_to_log_topic, keccak
+from hexbytes import HexBytes
+from web3 import Web3
+
+from connections import load_abi
+from event_indexer import EventIndexer, EventStore
+
+ensemble_address = Web3.to_checksum_address('0x' + '33' * 20)
+agent_address = Web3.to_checksum_address('0x' + '44' * 20)
+
+
+class FakeEth:
+    """A chain of blocks whose hashes the test can rewrite, with AssetPricesUpdated logs."""
+
+    def __init__(self, contract_factory):
+        self.contract = contract_factory
+        self.hashes = {}
+        self.logs = []
+        self.get_block_calls = Counter()
+        self.fork('a', range(10))
+
+    def fork(self, name, blocks):
+        for block_number in blocks:
+            self.hashes[block_number] = HexBytes(keccak(text=f"{name}{block_number}"))
+
+    @property
+    def block_number(self):
+        return max(self.hashes)
+
+    def get_block(self, block_number):
+        self.get_block_calls[block_number] += 1
+        return {'hash': self.hashes[block_number], 'timestamp': 1_700_000_000 + block_number}
+
+    def get_logs(self, params):
+        return [
+            log for log in self.logs
+            if params['fromBlock'] <= log['blockNumber'] <= params['toBlock'] and log['address'] in params['address']
+        ]
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth(Web3().eth.contract)
+
+
+@pytest.fixture
+def chain():
+    web3 = FakeWeb3()
+    ensemble = Web3().eth.contract(address=ensemble_address, abi=load_abi('frontend/contracts/AlphaEnsembleABI.json'))
+    store = EventStore(':memory:')
+    # Known agents keep the indexer from asking the contract for them
+    with store.db:
+        store.db.execute("INSERT INTO agents VALUES (?, 0, NULL)", (agent_address,))
+    indexer = EventIndexer(web3, ensemble, store, start_block=0, batch_size=4)
+    topic = event_abi_to_log_topic(ensemble.events.AssetPricesUpdated().abi)
+
+    def price_log(block_number, log_index, price):
+        web3.eth.logs.append({
+            'address': ensemble_address,
+            'topics': [HexBytes(topic)],
+            'data': HexBytes(encode(['string[]', 'uint256[]'], [['BTC'], [price]])),
+            'blockNumber': block_number,
+            'blockHash': web3.eth.hashes[block_number],
+            'logIndex': log_index,
+            'transactionIndex': 0,
+            'transactionHash': HexBytes(keccak(text=f"tx{block_number}{log_index}")),
+        })
+
+    return web3.eth, store, indexer, price_log
+
+
+def test_batches_are_checkpointed_and_fetch_each_block_once(chain):
+    eth, store, indexer, price_log = chain
+    price_log(3, 0, 100)
+    price_log(5, 0, 101)
+    price_log(5, 1, 102)
+
+    indexer.index_to(6)
+    assert store.checkpoints() == [(6, eth.hashes[6].hex()), (3, eth.hashes[3].hex())]
+    assert store.price_series('BTC') == [(3, 1_700_000_003, 100), (5, 1_700_000_005, 101), (5, 1_700_000_005, 102)]
+    # Block 3 gave both a timestamp and the checkpoint hash, block 5 had two events
+    assert eth.get_block_calls == {3: 1, 5: 1, 6: 1}
+    assert indexer.next_block() == 7
+
+
+def test_reorg_rewinds_to_the_newest_canonical_checkpoint(chain):
+    eth, store, indexer, price_log = chain
+    price_log(3, 0, 100)
+    price_log(5, 0, 101)
+    indexer.index_to(6)
+    assert indexer.check_reorg() is False
+
+    # Blocks from 5 on are replaced, and the price update moved to block 7
+    eth.fork('b', range(5, 10))
+    eth.logs.pop()
+    price_log(7, 0, 103)
+
+    assert indexer.check_reorg() is True
+    assert store.checkpoints() == [(3, eth.hashes[3].hex())]
+    assert store.price_series('BTC') == [(3, 1_700_000_003, 100)]
+
+    indexer.index_to(8)
+    assert indexer.check_reorg() is False
+    assert store.price_series('BTC') == [(3, 1_700_000_003, 100), (7, 1_700_000_007, 103)]
+    assert store.last_checkpoint() == (8, eth.hashes[8].hex())
+
+
+def test_reorg_past_every_checkpoint_rewinds_to_the_start_block(chain):
+    eth, store, indexer, price_log = chain
+    price_log(3, 0, 100)
+    indexer.index_to(6)
+
+    eth.fork('b', range(10))
+    assert indexer.check_reorg() is True
+    assert store.checkpoints() == []
+    assert store.price_series('BTC') == []
+    assert indexer.next_block() == 0
+    # Agents known before the indexed range survive the rewind
+    assert store.agents() == {agent_address: 0}
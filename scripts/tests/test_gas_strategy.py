@@ -0,0 +1,125 @@
+import pytest
+
+from gas_strategy import GasPriceFeed, GasStrategy, call_size, method_key, ran_out_of_gas
+from tx_submitter import TxSubmitter
+
+private_key = '0x' + '11' * 32
+
+
+class FakeEth:
+    def __init__(self):
+        from eth_account import Account
+        self.account = Account
+        self.gas_price = 10
+        self.chain_id = 1
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+class FakeCall:
+    """setAssetPrices(assets, prices) for n assets, estimated at estimate gas."""
+
+    address = '0x' + '22' * 20
+    fn_name = 'setAssetPrices'
+
+    def __init__(self, n, estimate=100_000):
+        self.args = (['BTC'] * n, [1] * n)
+        self.estimate = estimate
+        self.estimates = 0
+
+    def estimate_gas(self, tx_params):
+        self.estimates += 1
+        return self.estimate
+
+
+def receipt(status=1, gas_used=50_000):
+    return {'status': status, 'gasUsed': gas_used}
+
+
+@pytest.fixture
+def strategy():
+    return GasStrategy(FakeWeb3(), margin=1.5, min_samples=3, background=False)
+
+
+def test_limits_are_estimated_until_enough_receipts_are_in(strategy):
+    key = method_key(FakeCall(2))
+    for gas_used in (40_000, 50_000):
+        strategy.on_receipt(key, 100_000, receipt(gas_used=gas_used), size=call_size(FakeCall(2)))
+    call = FakeCall(2)
+    assert strategy.gas_limit(call, '0xkeeper') == 150_000
+    assert call.estimates == 1
+
+    strategy.on_receipt(key, 100_000, receipt(gas_used=45_000), size=call_size(FakeCall(2)))
+    call = FakeCall(2)
+    # The largest gasUsed seen, times the margin
+    assert strategy.gas_limit(call, '0xkeeper') == 75_000
+    assert call.estimates == 0
+
+
+def test_calls_larger_than_any_seen_are_estimated(strategy):
+    key = method_key(FakeCall(1))
+    for _ in range(3):
+        strategy.on_receipt(key, 100_000, receipt(gas_used=40_000), size=call_size(FakeCall(1)))
+    assert strategy.gas_limit(FakeCall(1), '0xkeeper') == 60_000
+    call = FakeCall(10, estimate=300_000)
+    assert strategy.gas_limit(call, '0xkeeper') == 450_000
+    assert call.estimates == 1
+
+
+def test_limits_are_capped_at_max_gas():
+    strategy = GasStrategy(FakeWeb3(), margin=1.5, max_gas=120_000, background=False)
+    assert strategy.gas_limit(FakeCall(1), '0xkeeper') == 120_000
+
+
+def test_reverted_receipts_are_not_learned_from(strategy):
+    key = method_key(FakeCall(1))
+    for _ in range(3):
+        strategy.on_receipt(key, 100_000, receipt(status=0, gas_used=30_000), size=call_size(FakeCall(1)))
+    assert strategy.limit_from_history(FakeCall(1)) is None
+
+
+@pytest.mark.parametrize('gas_used, out_of_gas', [
+    (100_000, True),  # the outer call ran out of gas
+    (100_000 * 63 // 64, True),  # a nested call did, leaving 1/64 unused
+    (100_000 * 63 // 64 - 1, False),
+    (30_000, False),  # an ordinary revert
+])
+def test_nested_out_of_gas_is_detected(gas_used, out_of_gas):
+    assert ran_out_of_gas(receipt(status=0, gas_used=gas_used), 100_000) is out_of_gas
+
+
+def test_out_of_gas_doubles_the_next_limit(strategy):
+    key = method_key(FakeCall(1))
+    for _ in range(2):
+        strategy.on_receipt(key, 100_000, receipt(gas_used=60_000), size=call_size(FakeCall(1)))
+    strategy.on_receipt(key, 100_000, receipt(status=0, gas_used=100_000 * 63 // 64), size=call_size(FakeCall(1)))
+    assert strategy.gas_limit(FakeCall(1), '0xkeeper') == 300_000
+
+
+def test_price_feed_refreshes_until_its_last_submitter_is_closed():
+    web3 = FakeWeb3()
+    first, second = TxSubmitter(web3, private_key), TxSubmitter(web3, private_key)
+    feed = first.gas.prices
+    assert second.gas.prices is feed
+    thread = feed._refresh_thread
+    assert thread.is_alive()
+
+    first.close()
+    first.close()  # closing twice does not release the feed for the other submitter
+    assert feed._refresh_thread is thread and thread.is_alive()
+
+    second.close()
+    assert feed._refresh_thread is None
+    assert not thread.is_alive()
+    assert feed.gas_price() == 10
+
+
+def test_feed_without_background_refresh_never_starts_a_thread():
+    feed = GasPriceFeed(FakeWeb3(), background=False)
+    feed.start()
+    assert feed._refresh_thread is None
+    assert feed.gas_price() == 10
+    feed.close()
@@ -0,0 +1,107 @@
+import pytest
+
+from llm_run_cache import LlmRunCache, contiguous_ranges, quantize_price
+
+strategies = ['momentum', 'mean reversion']
+positions = [[1, 0], [0, -2]]
+
+
+@pytest.fixture
+def cache():
+    return LlmRunCache(ttl=600, max_entries=4, price_step_bps=10, response_timeout=300)
+
+
+def run(cache, agent_id, fingerprint, now, succeeded=True):
+    """Dispatch a run and let the oracle answer it."""
+    cache.dispatch(agent_id, fingerprint, now=now)
+    cache.on_response(agent_id, succeeded, now=now)
+
+
+@pytest.mark.parametrize('a, b, same_bucket', [
+    (100.0, 100.05, True),  # 5 bps apart
+    (100.0, 100.2, False),  # 20 bps apart
+    (50000.0, 50025.0, True),  # equally wide in % at any price
+    (50000.0, 50100.0, False),
+])
+def test_prices_are_quantized_on_a_geometric_grid(a, b, same_bucket):
+    assert (quantize_price(a, 10) == quantize_price(b, 10)) is same_bucket
+
+
+def test_fingerprints_only_change_when_inputs_leave_their_bucket(cache):
+    fingerprints, _ = cache.due_runs([100.0, 200.0], positions, strategies, now=0)
+    assert cache.due_runs([100.01, 200.0], positions, strategies, now=0)[0] == fingerprints
+    assert cache.due_runs([101.0, 200.0], positions, strategies, now=0)[0][0] != fingerprints[0]
+    assert cache.due_runs([100.0, 200.0], [[2, 0], [0, -2]], strategies, now=0)[0][0] != fingerprints[0]
+    # Agents with the same strategy still get their own fingerprint
+    assert len(set(cache.due_runs([100.0, 200.0], positions, ['same', 'same'], now=0)[0])) == 2
+
+
+def test_dispatched_run_is_pending_until_the_oracle_answers(cache):
+    cache.dispatch(0, 'f', now=0)
+    assert cache.should_run(0, 'f', now=10) is False
+    assert cache.should_run(0, 'other', now=10) is False
+    assert cache.stats()['pending'] == 1
+
+    cache.on_response(0, True, now=20)
+    assert cache.stats()['pending'] == 0
+    assert cache.should_run(0, 'f', now=30) is False
+    assert cache.should_run(0, 'other', now=30) is True
+
+
+def test_failed_answer_is_not_cached(cache):
+    run(cache, 0, 'f', now=0, succeeded=False)
+    assert cache.should_run(0, 'f', now=1) is True
+    assert cache.stats()['failures'] == 1
+
+
+def test_unanswered_run_is_due_again_after_the_response_timeout(cache):
+    cache.dispatch(0, 'f', now=0)
+    assert cache.should_run(0, 'f', now=299) is False
+    assert cache.should_run(0, 'f', now=300) is True
+    assert cache.stats()['timeouts'] == 1
+
+
+def test_cancelled_run_is_due_on_the_next_cycle(cache):
+    # The shard carrying the run was never sent, so there is nothing to wait for
+    cache.dispatch(0, 'f', now=0)
+    cache.cancel(0)
+    assert cache.should_run(0, 'f', now=1) is True
+    assert cache.stats()['failures'] == 0
+    # An answer arriving anyway is not cached
+    cache.on_response(0, True, now=2)
+    assert cache.should_run(0, 'f', now=3) is True
+
+
+def test_answered_run_expires_after_the_ttl(cache):
+    run(cache, 0, 'f', now=0)
+    assert cache.should_run(0, 'f', now=599) is False
+    assert cache.should_run(0, 'f', now=600) is True
+    assert cache.stats()['size'] == 0
+
+
+def test_least_recently_used_run_is_evicted(cache):
+    for agent_id in range(4):
+        run(cache, agent_id, 'f', now=0)
+    # A hit refreshes agent 0, so agent 1 is the least recently used
+    assert cache.should_run(0, 'f', now=1) is False
+    run(cache, 4, 'f', now=2)
+
+    assert cache.stats()['evictions'] == 1
+    assert cache.should_run(1, 'f', now=3) is True
+    assert cache.should_run(0, 'f', now=3) is False
+
+
+def test_due_runs_skips_pending_and_answered_agents(cache):
+    prices = [100.0, 200.0]
+    fingerprints, due = cache.due_runs(prices, positions, strategies + ['trend'], now=0)
+    assert due == [0, 1, 2]
+    run(cache, 0, fingerprints[0], now=0)
+    cache.dispatch(1, fingerprints[1], now=0)
+
+    _, due = cache.due_runs(prices, positions, strategies + ['trend'], now=1)
+    assert due == [2]
+
+
+def test_contiguous_ranges():
+    assert contiguous_ranges([]) == []
+    assert contiguous_ranges([0, 1, 2, 5, 7, 8]) == [(0, 3), (5, 6), (7, 9)]
@@ -0,0 +1,31 @@
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def started(monkeypatch):
+    monkeypatch.delenv('METRICS_PORT', raising=False)
+    monkeypatch.delenv('METRICS_LOG_INTERVAL', raising=False)
+    started = []
+    monkeypatch.setattr(metrics, 'serve', lambda port: started.append(('serve', port)))
+    monkeypatch.setattr(metrics, 'log_json', lambda interval: started.append(('log', interval)))
+    return started
+
+
+def test_nothing_is_exported_by_default(started):
+    metrics.start_exporter()
+    metrics.start_exporter(None, None)
+    assert started == []
+
+
+def test_config_enables_the_exporters(started):
+    metrics.start_exporter(port=9100, log_interval=30)
+    assert started == [('serve', 9100), ('log', 30.0)]
+
+
+def test_env_overrides_the_config(started, monkeypatch):
+    monkeypatch.setenv('METRICS_LOG_INTERVAL', '0')
+    monkeypatch.setenv('METRICS_PORT', '9200')
+    metrics.start_exporter(port=9100, log_interval=30)
+    assert started == [('serve', 9200)]
@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+from web3 import Web3
+
+import multicall
+from multicall import async_multicall, multicall as sync_multicall
+
+codec = Web3().codec
+target = Web3.to_checksum_address('0x' + '55' * 20)
+
+get_price_abi = {
+    'name': 'getPrice', 'type': 'function', 'stateMutability': 'view',
+    'inputs': [{'name': 'asset', 'type': 'string'}],
+    'outputs': [{'name': '', 'type': 'uint256'}],
+}
+get_positions_abi = {
+    'name': 'getPositions', 'type': 'function', 'stateMutability': 'view',
+    'inputs': [],
+    'outputs': [{'name': 'assets', 'type': 'string[]'}, {'name': 'positions', 'type': 'int256[]'}],
+}
+
+
+class FakeCall:
+    def __init__(self, abi, args=(), value=None, error=None):
+        self.abi = abi
+        self.args = args
+        self.address = target
+        self.value = value
+        self.error = error
+        self.calls = 0
+
+    def call(self):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.value
+
+
+class FakeAggregate3:
+    def __init__(self, aggregator, calls):
+        self.aggregator = aggregator
+        self.calls = calls
+
+    def call(self):
+        self.aggregator.batches.append(self.calls)
+        if self.aggregator.error:
+            raise self.aggregator.error
+        return [self.aggregator.responses.pop(0) for _ in self.calls]
+
+
+class FakeAggregator:
+    """Multicall3 answering each call with the next queued (success, returnData) response."""
+
+    def __init__(self, responses=(), error=None):
+        self.responses = list(responses)
+        self.error = error
+        self.batches = []
+        self.functions = self
+
+    def aggregate3(self, calls):
+        return FakeAggregate3(self, calls)
+
+
+class FakeEth:
+    def __init__(self, code, aggregator):
+        self.code = code
+        self.aggregator = aggregator
+
+    def get_code(self, address):
+        return self.code
+
+    def contract(self, address, abi):
+        return self.aggregator
+
+
+class FakeWeb3:
+    def __init__(self, code=b'\x60\x80', aggregator=None):
+        self.codec = codec
+        self.eth = FakeEth(code, aggregator or FakeAggregator())
+
+
+@pytest.fixture(autouse=True)
+def fresh_code_checks(monkeypatch):
+    monkeypatch.setattr(multicall, '_multicall_deployed', {})
+
+
+def test_calls_are_sequential_without_multicall3():
+    web3 = FakeWeb3(code=b'')
+    calls = [FakeCall(get_price_abi, ('BTC',), value=100), FakeCall(get_price_abi, ('ETH',), error=ValueError('reverted'))]
+    results = sync_multicall(web3, calls)
+    assert [(result.success, result.value) for result in results] == [(True, 100), (False, None)]
+    assert results[1].error == 'reverted'
+    assert [call.calls for call in calls] == [1, 1]
+    assert web3.eth.aggregator.batches == []
+
+
+def test_failures_are_decoded_per_call():
+    aggregator = FakeAggregator([
+        (True, codec.encode(['uint256'], [100])),
+        (False, b''),
+        (True, codec.encode(['string[]', 'int256[]'], [['BTC', 'ETH'], [2, -1]])),
+        (True, b''),  # no contract at the target
+    ])
+    calls = [
+        FakeCall(get_price_abi, ('BTC',)),
+        FakeCall(get_price_abi, ('DOGE',)),
+        FakeCall(get_positions_abi),
+        FakeCall(get_price_abi, ('ETH',)),
+    ]
+    results = sync_multicall(FakeWeb3(aggregator=aggregator), calls, batch_size=3)
+
+    assert [result.success for result in results] == [True, False, True, False]
+    assert results[0].value == 100
+    assert results[1].error == "call reverted"
+    assert results[2].value == [('BTC', 'ETH'), (2, -1)]
+    assert results[3].error.startswith("could not decode result")
+    # Every call may fail on its own, and no call is made outside aggregate3
+    assert [len(batch) for batch in aggregator.batches] == [3, 1]
+    assert all(allow_failure for batch in aggregator.batches for _, allow_failure, _ in batch)
+    assert aggregator.batches[0][0] == (target, True, multicall.encode_call(FakeWeb3(), calls[0]))
+    assert sum(call.calls for call in calls) == 0
+
+
+def test_failed_batch_fails_each_of_its_calls():
+    aggregator = FakeAggregator(error=ValueError('execution reverted'))
+    results = sync_multicall(FakeWeb3(aggregator=aggregator), [FakeCall(get_price_abi, ('BTC',))] * 2)
+    assert [(result.success, result.error) for result in results] == [(False, 'execution reverted')] * 2
+
+
+class AsyncFakeCall(FakeCall):
+    async def call(self):
+        return super().call()
+
+
+class AsyncFakeAggregate3(FakeAggregate3):
+    async def call(self):
+        return super().call()
+
+
+class AsyncFakeAggregator(FakeAggregator):
+    def aggregate3(self, calls):
+        return AsyncFakeAggregate3(self, calls)
+
+
+class AsyncFakeEth(FakeEth):
+    async def get_code(self, address):
+        return self.code
+
+
+def async_web3(code=b'\x60\x80', aggregator=None):
+    web3 = FakeWeb3()
+    web3.eth = AsyncFakeEth(code, aggregator or AsyncFakeAggregator())
+    return web3
+
+
+def test_async_multicall_shares_the_decoding():
+    aggregator = AsyncFakeAggregator([(True, codec.encode(['uint256'], [100])), (False, b'')])
+    calls = [AsyncFakeCall(get_price_abi, ('BTC',)), AsyncFakeCall(get_price_abi, ('DOGE',))]
+    results = asyncio.run(async_multicall(async_web3(aggregator=aggregator), calls))
+    assert [(result.success, result.value, result.error) for result in results] == [
+        (True, 100, None), (False, None, "call reverted"),
+    ]
+
+
+def test_async_calls_are_sequential_without_multicall3():
+    calls = [AsyncFakeCall(get_price_abi, ('BTC',), value=100)]
+    results = asyncio.run(async_multicall(async_web3(code=b''), calls))
+    assert [(result.success, result.value) for result in results] == [(True, 100)]
+    assert calls[0].calls == 1
@@ -0,0 +1,156 @@
+import random
+
+import numpy as np
+import pytest
+
+from pnl_replay import replay
+
+
+class Reverted(Exception):
+    pass
+
+
+class ReferenceAgent:
+    """Agent.sol's setPositions and markToMarket for one agent, line by line on Python ints."""
+
+    def __init__(self, asset_count):
+        self.positions = [0] * asset_count
+        self.cost_basis = [0] * asset_count
+        self.total = 0
+
+    @staticmethod
+    def holding_pnl(position, cost_basis, price):
+        # price - costBasis and costBasis - price are uint256 in the contract
+        difference = price - cost_basis if position > 0 else cost_basis - price
+        if difference < 0:
+            raise Reverted()
+        return position * difference
+
+    def mark(self, prices):
+        total = self.total
+        for asset, position in enumerate(self.positions):
+            if position != 0:
+                total += self.holding_pnl(position, self.cost_basis[asset], prices[asset])
+        self.total = total
+
+    def set_positions(self, changes, prices):
+        positions, cost_basis, total = list(self.positions), list(self.cost_basis), self.total
+        for asset, new in changes:
+            current, basis, price = positions[asset], cost_basis[asset], prices[asset]
+            if new == 0:
+                if current == 0:
+                    continue
+                total += self.holding_pnl(current, basis, price)
+                basis = 0
+            elif (current > 0 > new) or (current < 0 < new):
+                total += self.holding_pnl(current, basis, price)
+                basis = price
+            else:
+                basis = (basis * abs(current) + price * abs(new)) // abs(new)
+            positions[asset], cost_basis[asset] = new, basis
+        # A revert anywhere leaves the agent untouched
+        self.positions, self.cost_basis, self.total = positions, cost_basis, total
+
+
+def random_history(seed, agent_count=3, asset_count=3, events=400):
+    """
+    Prices, setPositions calls and marks in chain order, with the calls that would revert
+    left out as they never reach the index. Returns the replay inputs and the reference totals.
+    """
+    rng = random.Random(seed)
+    agents = [ReferenceAgent(asset_count) for _ in range(agent_count)]
+    prices = [rng.randint(50, 150) for _ in range(asset_count)]
+    times, grid, totals = [], [], []
+    updates, marks = [], []
+
+    for key in range(events):
+        kind = rng.random()
+        agent_id = rng.randrange(agent_count)
+        agent = agents[agent_id]
+        if kind < 0.3:
+            asset = rng.randrange(asset_count)
+            prices[asset] = max(1, prices[asset] + rng.randint(-20, 20))
+        elif kind < 0.8:
+            # Pairs may repeat within a call and positions may be re-sent unchanged
+            changes = [(rng.randrange(asset_count), rng.choice([-3, -1, 0, 0, 1, 2, 5])) for _ in range(rng.randint(1, 4))]
+            try:
+                agent.set_positions(changes, prices)
+            except Reverted:
+                continue
+            updates += [(key, agent_id, asset, position) for asset, position in changes]
+            totals.append((len(times), agent_id, agent.total))
+        else:
+            try:
+                agent.mark(prices)
+            except Reverted:
+                continue
+            marks.append((key, agent_id))
+            totals.append((len(times), agent_id, agent.total))
+        times.append(key)
+        grid.append(list(prices))
+
+    update_times, update_agents, update_assets, update_positions = zip(*updates) if updates else ((),) * 4
+    mark_times, mark_agents = zip(*marks) if marks else ((), ())
+    result = replay(times, grid, update_times, update_agents, update_assets, update_positions, agent_count,
+                    mark_times, mark_agents)
+    return result, agents, totals
+
+
+@pytest.mark.parametrize('seed', range(25))
+def test_replay_matches_the_reference_model(seed):
+    result, agents, totals = random_history(seed)
+    assert len(totals) > 40
+    for row, agent_id, total in totals:
+        assert result.pnl[row, agent_id] == total
+    assert result.positions.tolist() == [agent.positions for agent in agents]
+    assert result.cost_basis.tolist() == [agent.cost_basis for agent in agents]
+
+
+def replay_one(events, asset_count=1):
+    """Replay (key, prices, changes or 'mark') events for agent 0. Returns the result."""
+    times = [key for key, _, _ in events]
+    grid = [prices for _, prices, _ in events]
+    updates = [(key, 0, asset, position) for key, _, changes in events if changes != 'mark' for asset, position in changes]
+    marks = [(key, 0) for key, _, changes in events if changes == 'mark']
+    update_times, update_agents, update_assets, update_positions = zip(*updates) if updates else ((),) * 4
+    mark_times, mark_agents = zip(*marks) if marks else ((), ())
+    return replay(times, grid, update_times, update_agents, update_assets, update_positions, 1, mark_times, mark_agents)
+
+
+# The legacy accounting quirks the replay has to keep, as Agent.sol reports them
+@pytest.mark.parametrize('events, pnl, cost_basis', [
+    # Adding to a position sets the basis to (basis * |old| + price * |new|) // |new|, not the average
+    ([(0, [100], [(0, 2)]), (1, [110], [(0, 3)])], [0, 0], 176),
+    # Re-sending the same position re-applies that formula
+    ([(0, [100], [(0, 2)]), (1, [110], [(0, 2)])], [0, 0], 210),
+    # The division floors
+    ([(0, [100], [(0, 1)]), (1, [101], [(0, 2)])], [0, 0], 151),
+    # Every mark adds the unrealized term to the running total again
+    ([(0, [100], [(0, 2)]), (1, [105], 'mark'), (2, [105], 'mark')], [0, 10, 20], 100),
+    # ...and closing realizes it once more
+    ([(0, [100], [(0, 2)]), (1, [105], 'mark'), (2, [105], [(0, 0)])], [0, 10, 20], 0),
+    # A short below its basis adds a negative term
+    ([(0, [100], [(0, -2)]), (1, [90], 'mark')], [0, -20], 100),
+    # Switching side realizes the old side and starts the new one at the price
+    ([(0, [100], [(0, 2)]), (1, [120], [(0, -1)])], [0, 40], 120),
+    # A pair repeated within one call is applied in order
+    ([(0, [100], [(0, 2), (0, 0), (0, 1)]), (1, [110], 'mark')], [0, 10], 100),
+])
+def test_legacy_quirks(events, pnl, cost_basis):
+    result = replay_one(events)
+    assert result.pnl[:, 0].tolist() == pnl
+    assert int(result.cost_basis[0, 0]) == cost_basis
+
+
+@pytest.mark.parametrize('changes, prices', [
+    ([(0, 2)], [90]),  # a long under water
+    ([(0, -2)], [110]),  # a short above its basis
+])
+def test_reference_reverts_where_the_contract_does(changes, prices):
+    agent = ReferenceAgent(1)
+    agent.set_positions(changes, [100])
+    with pytest.raises(Reverted):
+        agent.mark(prices)
+    with pytest.raises(Reverted):
+        agent.set_positions([(0, 0)], prices)
+    assert agent.positions == [changes[0][1]] and agent.total == 0
@@ -0,0 +1,102 @@
+import pytest
+
+from price_aggregator import PriceAggregator, publish_due_prices
+from push_scheduler import DeviationPushScheduler
+
+now = 1_700_000_000
+max_age = {'binance': 30, 'chainlink': 3600, 'sepolia_oracle': 300}
+
+
+def aggregate(quotes, **kwargs):
+    """Consolidated BTC price from (source, price, age in seconds) quotes, or None."""
+    aggregator = PriceAggregator(['BTC'], max_age=max_age, outlier_bps=200, **kwargs)
+    for source, price, age in quotes:
+        aggregator.update(source, 'BTC', price, now - age)
+    return aggregator.aggregate(now).get('BTC')
+
+
+@pytest.mark.parametrize('quotes, kwargs, expected', [
+    # Median of agreeing sources
+    ([('binance', 100, 0), ('chainlink', 101, 0), ('sepolia_oracle', 102, 0)], {}, 101),
+    # Weighted mean of agreeing sources
+    ([('binance', 100, 0), ('chainlink', 101, 0), ('sepolia_oracle', 102, 0)],
+     {'method': 'weighted', 'source_weights': {'binance': 2}}, 100.75),
+    # A quote 945 bps from the median is rejected before the median is taken...
+    ([('binance', 100, 0), ('chainlink', 100.5, 0), ('sepolia_oracle', 110, 0)], {}, 100.25),
+    # ...and before the weighted mean
+    ([('binance', 100, 0), ('chainlink', 100.5, 0), ('sepolia_oracle', 110, 0)], {'method': 'weighted'}, 100.25),
+    # Each source has its own max age: 31s is stale for binance, fresh for chainlink
+    ([('binance', 90, 31), ('chainlink', 100, 31)], {}, 100),
+    ([('binance', 100, 30), ('sepolia_oracle', 101, 301)], {}, 100),
+    # Sources without a configured max age go stale after 60s
+    ([('binance', 100, 0), ('other', 300, 61)], {}, 100),
+    # Every source stale
+    ([('binance', 100, 31), ('chainlink', 100, 3601), ('sepolia_oracle', 100, 301)], {}, None),
+    # Two quotes that disagree are both outliers from their median
+    ([('binance', 100, 0), ('chainlink', 110, 0)], {}, None),
+    # Not enough fresh sources, or not enough left once the outliers are gone
+    ([('binance', 100, 0), ('chainlink', 100, 3601)], {'min_sources': 2}, None),
+    ([('binance', 100, 0), ('chainlink', 100.5, 0), ('sepolia_oracle', 110, 0)], {'min_sources': 3}, None),
+])
+def test_aggregate(quotes, kwargs, expected):
+    assert aggregate(quotes, **kwargs) == pytest.approx(expected)
+
+
+def test_invalid_quotes_are_ignored():
+    assert aggregate([('binance', 0, 0), ('chainlink', -1, 0), ('sepolia_oracle', None, 0)]) is None
+
+
+class FakeFunctions:
+    def updateAssetPricesManual(self, assets, prices):
+        return ('updateAssetPricesManual', assets, prices)
+
+
+class FakeContract:
+    functions = FakeFunctions()
+
+
+class FakeSubmitter:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, call, **kwargs):
+        self.submitted.append(call)
+
+
+@pytest.fixture
+def publish():
+    aggregator = PriceAggregator(['BTC', 'ETH'], max_age=max_age, outlier_bps=200)
+    scheduler = DeviationPushScheduler(['BTC', 'ETH'], deviation_bps=25, heartbeat=60)
+    submitter = FakeSubmitter()
+
+    def publish(quotes, due_prices):
+        for source, asset, price, age in quotes:
+            aggregator.update(source, asset, price, now - age)
+        for asset, price in due_prices.items():
+            scheduler.on_price(asset, price)
+        assert scheduler.due_assets() == due_prices
+        published = publish_due_prices(FakeContract(), submitter, aggregator, scheduler, due_prices, now)
+        return published, submitter.submitted, scheduler.due_assets()
+
+    return publish
+
+
+def test_only_fresh_agreeing_prices_are_published(publish):
+    published, submitted, _ = publish(
+        [('binance', 'BTC', 100, 0), ('binance', 'ETH', 10, 31)],
+        {'BTC': 100, 'ETH': 10},
+    )
+    assert published == {'BTC': 100}
+    assert submitted == [('updateAssetPricesManual', ['BTC'], [10000000000])]
+
+
+@pytest.mark.parametrize('quotes', [
+    [('binance', 'BTC', 100, 31), ('chainlink', 'BTC', 100, 3601)],  # all stale
+    [('binance', 'BTC', 100, 0), ('chainlink', 'BTC', 110, 0)],  # all outliers
+])
+def test_nothing_is_published_without_a_consolidated_price(publish, quotes):
+    published, submitted, due = publish(quotes, {'BTC': 100})
+    assert published == {}
+    assert submitted == []
+    # Marked as pushed, so the heartbeat does not keep the asset due
+    assert 'BTC' not in due
@@ -0,0 +1,102 @@
+import math
+
+import pytest
+import requests
+
+import price_store
+from price_store import PriceStore, fetch_binance_snapshot, iter_ticks, subscribe_message
+
+
+@pytest.fixture
+def store():
+    return PriceStore(['btcusdt', 'ethusdt'])
+
+
+def test_ticks_are_stored_by_symbol_index(store):
+    assert store.update('ETHUSDT', 3000.0, 1000) == 1
+    assert store.get('ETHUSDT') == 3000.0
+    assert store.timestamp('ETHUSDT') == 1000
+    assert store.get('BTCUSDT') is None
+    assert store.update('DOGEUSDT', 0.1, 1000) == -1
+
+
+def test_older_tick_never_rolls_a_price_back(store):
+    store.update('BTCUSDT', 60000.0, 2000)
+    assert store.update('BTCUSDT', 59000.0, 1999) == -1
+    assert store.get('BTCUSDT') == 60000.0
+    assert store.timestamp('BTCUSDT') == 2000
+    # A tick with the same exchange time is as new as the stored one
+    assert store.update('BTCUSDT', 60100.0, 2000) == 0
+    assert store.get('BTCUSDT') == 60100.0
+    assert store.sequence.tolist() == [2, 0]
+
+
+def test_snapshot_and_staleness(store):
+    store.update('BTCUSDT', 60000.0, 100_000)
+    store.update('ETHUSDT', 3000.0, 50_000)
+    assert store.snapshot() == {'BTCUSDT': 60000.0, 'ETHUSDT': 3000.0}
+    assert store.snapshot(max_age=30, now=120) == {'BTCUSDT': 60000.0}
+    assert store.stale(30, now=120) == ['ETHUSDT']
+    assert store.fresh({'BTCUSDT': 60000.0, 'ETHUSDT': 3000.0, 'DOGEUSDT': 0.1}, 30, now=120) == {'BTCUSDT': 60000.0}
+    assert math.isclose(store.age('ETHUSDT', now=120), 70)
+
+
+def test_never_ticked_symbols_are_stale(store):
+    assert store.stale(30, now=0) == ['BTCUSDT', 'ETHUSDT']
+    assert store.age('BTCUSDT') is None
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def test_snapshot_ticks_carry_exchange_time(monkeypatch, store):
+    requests_made = []
+
+    def get(url, params, timeout):
+        requests_made.append((url, params))
+        return FakeResponse([
+            {'symbol': 'BTCUSDT', 'lastPrice': '60000.5', 'closeTime': 1700000000123},
+            {'symbol': 'ETHUSDT', 'lastPrice': '3000.25', 'closeTime': 1700000000456},
+        ])
+
+    monkeypatch.setattr(requests, 'get', get)
+    snapshot = fetch_binance_snapshot(['btcusdt', 'ethusdt'])
+    assert snapshot == [('BTCUSDT', 60000.5, 1700000000123), ('ETHUSDT', 3000.25, 1700000000456)]
+    assert requests_made == [(price_store.binance_ticker_url, {'symbols': '["BTCUSDT","ETHUSDT"]', 'type': 'MINI'})]
+
+    # A websocket tick newer on the exchange wins whatever the local clock says
+    store.update('BTCUSDT', 60010.0, 1700000000200)
+    for tick in snapshot:
+        store.update(*tick)
+    assert store.get('BTCUSDT') == 60010.0
+    assert store.get('ETHUSDT') == 3000.25
+
+
+@pytest.mark.parametrize('stream_type', ['bookTicker', 'miniTicker', 'ticker'])
+def test_subscribe_message(stream_type):
+    assert subscribe_message(['BTCUSDT', 'ethusdt'], stream_type, request_id=7) == {
+        'method': 'SUBSCRIBE',
+        'params': [f'btcusdt@{stream_type}', f'ethusdt@{stream_type}'],
+        'id': 7,
+    }
+
+
+@pytest.mark.parametrize('stream_type', ['trade', 'kline_1m', 'MINITICKER'])
+def test_subscribe_message_rejects_streams_without_prices(stream_type):
+    with pytest.raises(ValueError):
+        subscribe_message(['btcusdt'], stream_type)
+
+
+def test_iter_ticks_reads_combined_and_raw_payloads():
+    combined = {'stream': 'btcusdt@miniTicker', 'data': {'e': '24hrMiniTicker', 'E': 5, 's': 'BTCUSDT', 'c': '60000.0'}}
+    assert list(iter_ticks(combined)) == [('BTCUSDT', 60000.0, 5)]
+    book = [{'s': 'ETHUSDT', 'b': '2999.0', 'a': '3001.0', 'E': 6}, {'result': None}]
+    assert list(iter_ticks(book)) == [('ETHUSDT', 3000.0, 6)]
@@ -0,0 +1,154 @@
+import asyncio
+from types import SimpleNamespace
+
+from shard_scheduler import AsyncShardScheduler, ShardScheduler
+
+
+class FakeCall:
+    def __init__(self, start, end, estimate):
+        self.start, self.end, self.estimate = start, end, estimate
+
+    def estimate_gas(self, tx):
+        return self.estimate
+
+
+class FakeSubmitter:
+    """Records every submission; receipts are delivered by the test through on_receipt."""
+
+    def __init__(self):
+        self.account = SimpleNamespace(address='0xkeeper')
+        self.sent = []
+        self.on_error = []
+
+    def submit(self, call, gas=None, description=None, on_receipt=None, on_error=None):
+        self.sent.append((call.start, call.end, gas, on_receipt))
+        self.on_error.append(on_error)
+        return len(self.sent)
+
+
+def make_call(start, end):
+    return FakeCall(start, end, estimate=100000)
+
+
+def scheduler(gas_budget=1000000):
+    return ShardScheduler(FakeSubmitter(), gas_budget=gas_budget, margin=1.0)
+
+
+def test_shards_fit_the_budget():
+    shards = scheduler().shards('startAgentRuns', make_call, 25)
+    assert shards == [(0, 10), (10, 20), (20, 25)]
+
+
+def test_shards_of_a_range():
+    assert scheduler().shards('startAgentRuns', make_call, 25, first=18) == [(18, 25)]
+
+
+def test_shards_follow_measured_gas():
+    shards = scheduler()
+    shards.record('startAgentRuns', 250000, 1)
+    assert shards.shards('startAgentRuns', make_call, 10) == [(0, 4), (4, 8), (8, 10)]
+
+
+def test_success_records_gas_and_reports_range():
+    shards = scheduler()
+    landed = []
+    shards.submit('startAgentRuns', make_call, 5, on_success=lambda start, end: landed.append((start, end)))
+    (start, end, gas, on_receipt), = shards.submitter.sent
+    on_receipt({'status': 1, 'gasUsed': 300000})
+    assert landed == [(0, 5)]
+    assert shards.gas_per_agent('startAgentRuns', make_call) == 100000
+
+
+def test_revert_is_not_retried_or_recorded():
+    shards = scheduler()
+    shards.submit('updateAgentPrices', make_call, 8)
+    (_, _, gas, on_receipt), = shards.submitter.sent
+    on_receipt({'status': 0, 'gasUsed': gas // 3})
+    assert len(shards.submitter.sent) == 1
+    assert shards.gas_per_agent('updateAgentPrices', make_call) == 100000
+
+
+def test_revert_reports_abandoned_range():
+    shards = scheduler()
+    abandoned = []
+    shards.submit(
+        'startAgentRuns', make_call, 8, ranges=[(2, 5)], on_abandoned=lambda start, end: abandoned.append((start, end)),
+    )
+    (_, _, gas, on_receipt), = shards.submitter.sent
+    on_receipt({'status': 0, 'gasUsed': gas // 3})
+    assert abandoned == [(2, 5)]
+
+
+def test_dropped_shard_reports_abandoned_range():
+    shards = scheduler()
+    abandoned = []
+    shards.submit('startAgentRuns', make_call, 8, on_abandoned=lambda start, end: abandoned.append((start, end)))
+    shards.submitter.on_error[0]('dropped')
+    assert abandoned == [(0, 8)]
+
+
+def test_out_of_gas_splits_in_halves():
+    shards = scheduler()
+    shards.submit('updateAgentPrices', make_call, 8)
+    (_, _, gas, on_receipt), = shards.submitter.sent
+    on_receipt({'status': 0, 'gasUsed': gas})
+    assert [(start, end) for start, end, _, _ in shards.submitter.sent[1:]] == [(0, 4), (4, 8)]
+    assert shards.gas_per_agent('updateAgentPrices', make_call) == 200000
+
+
+def test_nested_out_of_gas_splits_in_halves():
+    # An out-of-gas in a nested call reverts the outer call with 1/64 of the gas unused
+    shards = scheduler()
+    shards.submit('startAgentRuns', make_call, 8)
+    (_, _, gas, on_receipt), = shards.submitter.sent
+    on_receipt({'status': 0, 'gasUsed': gas - gas // 64})
+    assert [(start, end) for start, end, _, _ in shards.submitter.sent[1:]] == [(0, 4), (4, 8)]
+
+
+def test_single_agent_out_of_gas_retries_with_more_gas():
+    shards = scheduler()
+    shards.submit('updateAgentPrices', make_call, 1)
+    (_, _, gas, on_receipt), = shards.submitter.sent
+    on_receipt({'status': 0, 'gasUsed': gas})
+    (start, end, retry_gas, _), = shards.submitter.sent[1:]
+    assert (start, end, retry_gas) == (0, 1, 2 * gas)
+
+
+def test_single_agent_over_budget_does_not_poison_history():
+    shards = scheduler(gas_budget=150000)
+    shards.submit('updateAgentPrices', make_call, 1)
+    (_, _, gas, on_receipt), = shards.submitter.sent
+    assert gas == 100000
+    on_receipt({'status': 0, 'gasUsed': gas})
+    (_, _, retry_gas, on_retry), = shards.submitter.sent[1:]
+    assert retry_gas == 150000
+    on_retry({'status': 0, 'gasUsed': retry_gas})
+    assert len(shards.submitter.sent) == 2
+    assert shards.gas_per_agent('updateAgentPrices', make_call) == 200000
+
+
+class FakeAsyncCall(FakeCall):
+    async def estimate_gas(self, tx):
+        return self.estimate
+
+
+class FakeAsyncSubmitter(FakeSubmitter):
+    async def submit(self, call, gas=None, description=None, on_receipt=None, on_error=None):
+        return super().submit(call, gas, description, on_receipt, on_error)
+
+
+def test_async_revert_is_not_retried():
+    async def run():
+        shards = AsyncShardScheduler(FakeAsyncSubmitter(), gas_budget=1000000, margin=1.0)
+        make_async_call = lambda start, end: FakeAsyncCall(start, end, 100000)
+        await shards.submit('updateAgentPrices', make_async_call, 8)
+        (_, _, gas, on_receipt), = shards.submitter.sent
+        on_receipt({'status': 0, 'gasUsed': gas // 3})
+        await asyncio.sleep(0)
+        assert len(shards.submitter.sent) == 1
+
+        on_receipt({'status': 0, 'gasUsed': gas})
+        await asyncio.sleep(0)
+        assert [(start, end) for start, end, _, _ in shards.submitter.sent[1:]] == [(0, 4), (4, 8)]
+
+    asyncio.run(run())
@@ -0,0 +1,186 @@
+import pytest
+import requests
+from eth_account import Account
+from eth_utils import keccak
+from hexbytes import HexBytes
+from web3.exceptions import TransactionNotFound
+
+from gas_strategy import GasStrategy
+from tx_submitter import NonceManager, TxSubmitter
+
+private_key = '0x' + '11' * 32
+
+
+class FakeEth:
+    """The parts of web3.eth the submitter uses, with a mempool and receipts set by the test."""
+
+    def __init__(self):
+        self.account = Account
+        self.pending_count = 0
+        self.send_errors = []
+        self.sent = []
+        self.mempool = set()
+        self.receipts = {}
+        self.gas_price = 10
+
+    def get_transaction_count(self, address, block_identifier):
+        return self.pending_count
+
+    def send_raw_transaction(self, raw_transaction):
+        if self.send_errors:
+            raise self.send_errors.pop(0)
+        tx_hash = HexBytes(keccak(raw_transaction))
+        self.sent.append(tx_hash)
+        self.mempool.add(tx_hash)
+        return tx_hash
+
+    def get_transaction_receipt(self, tx_hash):
+        if tx_hash not in self.receipts:
+            raise TransactionNotFound(tx_hash)
+        return self.receipts[tx_hash]
+
+    def get_transaction(self, tx_hash):
+        if tx_hash not in self.mempool:
+            raise TransactionNotFound(tx_hash)
+        return {'hash': tx_hash}
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+class FakePrices:
+    def __init__(self, gas_price):
+        self.price = gas_price
+
+    def gas_price(self):
+        return self.price
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCall:
+    address = '0x' + '22' * 20
+    fn_name = 'setAssetPrices'
+    args = ()
+
+    def build_transaction(self, tx_params):
+        return dict(tx_params, to=self.address, value=0, data='0x')
+
+
+@pytest.fixture
+def submitter():
+    web3 = FakeWeb3()
+    submitter = TxSubmitter(
+        web3, private_key, chain_id=1, receipt_timeout=0,
+        gas_strategy=GasStrategy(web3, prices=FakePrices(100)),
+    )
+    # Receipts are checked by the test, not by the confirm thread
+    submitter.close()
+    return submitter
+
+
+def receipt(status=1, gas_used=21000):
+    return {'status': status, 'gasUsed': gas_used}
+
+
+def test_nonces_are_sequential_from_the_pending_count():
+    web3 = FakeWeb3()
+    web3.eth.pending_count = 7
+    nonces = NonceManager(web3, '0xkeeper')
+    assert [nonces.next_nonce() for _ in range(3)] == [7, 8, 9]
+
+
+def test_release_only_takes_back_the_latest_nonce():
+    nonces = NonceManager(FakeWeb3(), '0xkeeper')
+    first = nonces.next_nonce()
+    nonces.next_nonce()
+    # Another tx already holds a later nonce, so giving the first one back would leave a gap
+    nonces.release(first)
+    assert nonces.next_nonce() == 2
+    nonces.release(2)
+    assert nonces.next_nonce() == 2
+
+
+def test_resync_restarts_from_the_pending_count():
+    web3 = FakeWeb3()
+    nonces = NonceManager(web3, '0xkeeper')
+    nonces.next_nonce()
+    nonces.next_nonce()
+    web3.eth.pending_count = 1
+    assert nonces.resync() == 1
+    assert nonces.next_nonce() == 1
+
+
+def test_rejected_send_gives_the_nonce_back(submitter):
+    submitter.web3.eth.send_errors = [ValueError({'code': -32000, 'message': 'insufficient funds'})]
+    with pytest.raises(ValueError):
+        submitter.submit(FakeCall(), gas=50000)
+    assert submitter.submit(FakeCall(), gas=50000).nonce == 0
+
+
+def test_send_that_may_have_reached_the_node_keeps_its_nonce(submitter):
+    submitter.web3.eth.send_errors = [requests.exceptions.ReadTimeout("read timed out")]
+    pending = submitter.submit(FakeCall(), gas=50000)
+    assert pending.nonce == 0
+    # Tracked by the hash of the signed tx, the node may hold it
+    signed = Account.sign_transaction(pending.txn, private_key)
+    assert pending.tx_hash == signed.hash
+    assert submitter.submit(FakeCall(), gas=50000).nonce == 1
+
+
+def test_nonce_too_low_resyncs_and_retries(submitter):
+    eth = submitter.web3.eth
+    eth.send_errors = [ValueError({'code': -32000, 'message': 'nonce too low'})]
+    eth.pending_count = 5
+    assert submitter.submit(FakeCall(), gas=50000).nonce == 5
+
+
+def test_stuck_tx_is_replaced_with_a_higher_gas_price(submitter):
+    pending = submitter.submit(FakeCall(), gas=50000)
+    first_hash = pending.tx_hash
+    assert submitter._check(pending) is False
+    assert pending.replacements == 1
+    assert pending.tx_hashes == [first_hash, pending.tx_hash]
+    assert pending.txn['gasPrice'] >= 125
+    assert pending.txn['nonce'] == pending.nonce
+
+
+def test_receipt_of_an_earlier_version_resolves_the_tx(submitter):
+    landed = []
+    pending = submitter.submit(FakeCall(), gas=50000, on_receipt=landed.append)
+    first_hash = pending.tx_hash
+    submitter._check(pending)
+    submitter.web3.eth.receipts[first_hash] = receipt()
+    assert submitter._check(pending) is True
+    assert landed == [receipt()]
+    assert pending.receipt == receipt()
+
+
+def test_stuck_tx_is_given_up_after_max_replacements(submitter):
+    errors = []
+    pending = submitter.submit(FakeCall(), gas=50000, on_error=errors.append)
+    for _ in range(submitter.max_replacements):
+        assert submitter._check(pending) is False
+    assert submitter._check(pending) is True
+    assert pending.error == 'timeout'
+    assert errors == ['timeout']
+    assert len(submitter.web3.eth.sent) == submitter.max_replacements + 1
+
+
+def test_dropped_tx_resyncs_the_nonce_and_reports_the_error(submitter):
+    errors = []
+    eth = submitter.web3.eth
+    pending = submitter.submit(FakeCall(), gas=50000, on_error=errors.append)
+    submitter.submit(FakeCall(), gas=50000)
+    eth.mempool.clear()
+    eth.pending_count = 0
+    assert submitter._check(pending) is True
+    assert pending.error == 'dropped'
+    assert errors == ['dropped']
+    assert submitter.submit(FakeCall(), gas=50000).nonce == 0
@@ -0,0 +1,613 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+import requests
+from urllib3.exceptions import NewConnectionError
+from web3.exceptions import TransactionNotFound
+from gas_strategy import AsyncGasStrategy, GasStrategy, call_size, method_key
+from metrics import counter, gas_buckets, histogram
+
+# Errors returned by nodes when the nonce we used no longer matches the account state
+NONCE_ERRORS = ('nonce too low', 'replacement transaction underpriced', 'invalid nonce')
+
+# Errors returned by nodes that already hold the exact same signed transaction
+KNOWN_TX_ERRORS = ('already known', 'known transaction', 'already imported')
+
+# Where a transaction spends its time: signing here, sending in rpc_latency_seconds, then mining
+tx_sent = counter('tx_sent_total', "Transactions signed and sent", ('method',))
+tx_sign_seconds = histogram('tx_sign_seconds', "Time to build and sign a transaction", ('method',))
+tx_confirm_seconds = histogram('tx_confirm_seconds', "Time from send until the receipt was seen", ('method',))
+tx_gas_used = histogram('tx_gas_used', "gasUsed per receipt", ('method',), buckets=gas_buckets)
+tx_receipts = counter('tx_receipts_total', "Receipts by status", ('method', 'status'))
+tx_dropped = counter('tx_dropped_total', "Transactions dropped from the mempool", ('method',))
+tx_replaced = counter('tx_replaced_total', "Transactions resent with a higher gas price", ('method',))
+tx_timed_out = counter('tx_timed_out_total', "Transactions given up on while still pending", ('method',))
+
+
+def is_nonce_error(error):
+    return any(err in str(error).lower() for err in NONCE_ERRORS)
+
+
+def is_known_tx_error(error):
+    return any(err in str(error).lower() for err in KNOWN_TX_ERRORS)
+
+
+def was_rejected(error):
+    """
+    Whether a failed send certainly never reached the mempool: the node answered with a
+    JSON-RPC error, or the connection was never opened. After anything else, e.g. a read
+    timeout or a 5xx from a proxy, the tx may have been accepted.
+    """
+    if isinstance(error, ValueError) and error.args and isinstance(error.args[0], dict):
+        return True  # web3 raises JSON-RPC error responses as ValueError(error)
+    if isinstance(error, (requests.exceptions.ConnectTimeout, aiohttp.ClientConnectorError)):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+    return False
+
+
+def replacement_gas_price(tx, gas_price, bump):
+    # Nodes only accept a replacement that raises the gas price by a margin, typically 10%
+    return max(int(tx.txn['gasPrice'] * bump) + 1, gas_price)
+
+
+def give_up(tx):
+    # The tx may still be mined later, but nobody waits on it or polls it any more
+    tx_timed_out.inc(method=tx.method[1])
+    print(f"{tx.description} ({tx.tx_hash.hex()}, nonce {tx.nonce}) still pending after "
+          f"{tx.replacements} replacements, giving up on it")
+    fail(tx, 'timeout')
+    return True
+
+
+def fail(tx, error):
+    """Resolve a tx that will not get a receipt, telling its on_error callback first."""
+    if tx.on_error is not None:
+        try:
+            tx.on_error(error)
+        except Exception as e:
+            print(f"Error callback failed for {tx.description}: {e}")
+    tx._resolve(error=error)
+
+
+def record_receipt(tx, receipt):
+    method = tx.method[1]
+    tx_receipts.inc(method=method, status=receipt['status'])
+    tx_confirm_seconds.observe(time.time() - tx.sent_at, method=method)
+    tx_gas_used.observe(receipt['gasUsed'], method=method)
+    if receipt['status'] != 1:
+        print(f"{tx.description} failed with Tx: {tx.tx_hash.hex()}, Gas used: {receipt['gasUsed']}")
+
+
+def send_error_action(error, nonce, description):
+    """
+    What a failed send means for its nonce: 'resync' when the node disagrees with it,
+    'release' when the tx never reached the node, 'keep' when the node may hold the tx and it
+    is tracked by the hash it was signed with. If it never arrived, drop detection resyncs.
+    """
+    if is_nonce_error(error):
+        return 'resync'
+    if was_rejected(error):
+        return 'release'
+    if not is_known_tx_error(error):
+        print(f"Send of {description} (nonce {nonce}) failed after it may have reached the node: {error}")
+    return 'keep'
+
+
+def settle(tx, receipt, gas):
+    """Resolve a tx with its receipt, feeding the gas strategy and running the callback first."""
+    record_receipt(tx, receipt)
+    gas.on_receipt(tx.method, tx.gas, receipt, tx.size)
+    # Run the callback first so anyone waiting on the tx sees its effects
+    if tx.on_receipt is not None:
+        try:
+            tx.on_receipt(receipt)
+        except Exception as e:
+            print(f"Receipt callback failed for {tx.description}: {e}")
+    tx._resolve(receipt=receipt)
+    return True
+
+
+def drop(tx, next_nonce):
+    tx_dropped.inc(method=tx.method[1])
+    print(f"{tx.description} ({tx.tx_hash.hex()}, nonce {tx.nonce}) was dropped, nonce resynced to {next_nonce}")
+    fail(tx, 'dropped')
+    return True
+
+
+def replacement_may_have_landed(tx, error):
+    """Whether a replacement that failed to send may still have reached the node."""
+    print(f"Failed to replace {tx.description} (nonce {tx.nonce}): {error}")
+    # "nonce too low" means an earlier version was mined, its receipt shows up next poll
+    return not (was_rejected(error) or is_nonce_error(error))
+
+
+class NonceManager:
+    """
+    Hands out sequential nonces for one account without a round trip per transaction.
+    resync() and release() assume no nonce is handed out but unsent, so callers hold their
+    send lock around them.
+    """
+
+    def __init__(self, web3, address):
+        self.web3 = web3
+        self.address = address
+        self._lock = threading.Lock()
+        self._next_nonce = None
+
+    def next_nonce(self):
+        with self._lock:
+            if self._next_nonce is None:
+                self._next_nonce = self.web3.eth.get_transaction_count(self.address, 'pending')
+            nonce = self._next_nonce
+            self._next_nonce += 1
+            return nonce
+
+    def resync(self):
+        # The pending count stops at the first gap, so the next nonce handed out refills it
+        with self._lock:
+            self._next_nonce = self.web3.eth.get_transaction_count(self.address, 'pending')
+            return self._next_nonce
+
+    def release(self, nonce):
+        # Take back the latest nonce when its transaction never reached the node
+        with self._lock:
+            if self._next_nonce == nonce + 1:
+                self._next_nonce = nonce
+
+
+class PendingTx:
+    """
+    A submitted transaction whose receipt is collected by the submitter's confirm thread.
+    tx_hash is the latest version sent; tx_hashes also holds the versions it replaced, any of
+    which may still be mined.
+    """
+
+    def __init__(self, tx_hash, nonce, description, on_receipt=None, method=None, gas=None, size=0, txn=None,
+                 on_error=None):
+        self.tx_hash = tx_hash
+        self.tx_hashes = [tx_hash]
+        self.nonce = nonce
+        self.description = description
+        self.on_receipt = on_receipt
+        self.on_error = on_error
+        self.method = method
+        self.gas = gas
+        self.size = size
+        self.txn = txn
+        self.replacements = 0
+        self.sent_at = time.time()
+        self.last_sent_at = self.sent_at
+        self.resolved_at = None
+        self.receipt = None
+        self.error = None
+        self._done = threading.Event()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """The receipt, or None if the tx failed or is still pending after timeout seconds."""
+        self._done.wait(timeout)
+        return self.receipt
+
+    def _replaced(self, tx_hash, txn):
+        self.tx_hash = tx_hash
+        self.tx_hashes.append(tx_hash)
+        self.txn = txn
+
+    def _resolve(self, receipt=None, error=None):
+        self.receipt = receipt
+        self.error = error
+        self.resolved_at = time.time()
+        self._done.set()
+
+
+class BaseTxSubmitter:
+    """
+    Settings and transaction bookkeeping shared by TxSubmitter and AsyncTxSubmitter, which
+    only add the RPCs and the way receipts are polled.
+    A tx without a receipt after receipt_timeout seconds is resent with the same nonce and a
+    gas price raised by replacement_bump, up to max_replacements times. After that it
+    resolves with error 'timeout', so no tx is polled forever.
+    """
+
+    def __init__(self, web3, private_key, chain_id, receipt_timeout, poll_interval, max_replacements,
+                 replacement_bump):
+        self.web3 = web3
+        self.private_key = private_key
+        self.account = web3.eth.account.from_key(private_key)
+        self.chain_id = chain_id
+        self.receipt_timeout = receipt_timeout
+        self.poll_interval = poll_interval
+        self.max_replacements = max_replacements
+        self.replacement_bump = replacement_bump
+
+    def _tx_params(self, gas, gas_price, nonce):
+        tx_params = {'gas': gas, 'gasPrice': gas_price, 'nonce': nonce}
+        if self.chain_id is not None:
+            tx_params['chainId'] = self.chain_id
+        return tx_params
+
+    def _sign(self, txn):
+        return self.web3.eth.account.sign_transaction(txn, private_key=self.private_key)
+
+    def _pending_tx(self, tx_hash, nonce, description, on_receipt, method, gas, contract_function, txn, on_error):
+        tx_sent.inc(method=method[1])
+        return PendingTx(
+            tx_hash, nonce, description, on_receipt, method, gas, call_size(contract_function), txn, on_error,
+        )
+
+    def _awaiting_receipt(self, tx):
+        return time.time() - tx.last_sent_at < self.receipt_timeout
+
+    def _replacement(self, tx, gas_price):
+        """The stuck tx re-priced for resending, or None once it has been replaced too often."""
+        if tx.replacements >= self.max_replacements:
+            return None
+        # Counted even when the send fails, so a tx is never retried past max_replacements
+        tx.replacements += 1
+        tx.last_sent_at = time.time()
+        return dict(tx.txn, gasPrice=replacement_gas_price(tx, gas_price, self.replacement_bump))
+
+    def _replaced(self, tx, tx_hash, txn):
+        tx._replaced(tx_hash, txn)
+        tx_replaced.inc(method=tx.method[1])
+        print(f"{tx.description} (nonce {tx.nonce}) had no receipt after {self.receipt_timeout}s, "
+              f"resent as {tx.tx_hash.hex()} at gas price {tx.txn['gasPrice']}")
+        return False
+
+
+class TxSubmitter(BaseTxSubmitter):
+    """
+    Signs and sends transactions back-to-back using locally tracked nonces, and confirms
+    receipts in a background thread so callers never block on a block being mined.
+    """
+
+    def __init__(self, web3, private_key, chain_id=None, receipt_timeout=120, poll_interval=0.5, confirm_workers=8,
+                 gas_strategy=None, max_replacements=2, replacement_bump=1.25):
+        super().__init__(web3, private_key, chain_id, receipt_timeout, poll_interval, max_replacements,
+                         replacement_bump)
+        self.nonces = NonceManager(web3, self.account.address)
+
+        # Held from taking a nonce until it is sent, so a resync never hands out a nonce that
+        # another thread is still about to use
+        self._send_lock = threading.Lock()
+
+        # Gas price from the client's shared feed and gas limits learned from this submitter's
+        # receipts. The feed refreshes in the background until close()
+        self.gas = gas_strategy or GasStrategy(web3)
+        self.gas.start()
+
+        # Receipt lookups for many in-flight txs are fanned out instead of polled one by one
+        self._confirm_pool = ThreadPoolExecutor(max_workers=confirm_workers)
+        self._pending = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._confirm_thread = threading.Thread(target=self._confirm_loop, daemon=True)
+        self._confirm_thread.start()
+
+    def submit(self, contract_function, gas=None, description=None, on_receipt=None, on_error=None):
+        """
+        Build, sign and send a contract call without waiting for it to be mined.
+        Returns a PendingTx that resolves once the receipt arrives or the tx is dropped.
+        Without an explicit gas limit, the gas strategy picks one from history or estimate_gas.
+        on_receipt(receipt) runs for the receipt, on_error('dropped' or 'timeout') instead when
+        the tx left the mempool or was given up on.
+        """
+        method = method_key(contract_function)
+        description = description or method[1]
+        if gas is None:
+            gas = self.gas.gas_limit(contract_function, self.account.address)
+
+        for attempt in range(2):
+            gas_price = self.gas.gas_price()
+            with self._send_lock:
+                nonce = self.nonces.next_nonce()
+                try:
+                    sign_start = time.perf_counter()
+                    txn = contract_function.build_transaction(self._tx_params(gas, gas_price, nonce))
+                    signed_txn = self._sign(txn)
+                    tx_sign_seconds.observe(time.perf_counter() - sign_start, method=method[1])
+                except Exception:
+                    # Never sent: give the nonce back so later transactions are not stuck behind a gap
+                    self.nonces.release(nonce)
+                    raise
+
+                try:
+                    tx_hash = self.web3.eth.send_raw_transaction(signed_txn.rawTransaction)
+                except Exception as e:
+                    action = send_error_action(e, nonce, description)
+                    if action == 'resync':
+                        self.nonces.resync()
+                        if attempt == 0:
+                            print(f"Nonce {nonce} rejected for {description}, resynced and retrying")
+                            continue
+                        raise
+                    if action == 'release':
+                        self.nonces.release(nonce)
+                        raise
+                    tx_hash = signed_txn.hash
+
+            pending = self._pending_tx(
+                tx_hash, nonce, description, on_receipt, method, gas, contract_function, txn, on_error,
+            )
+            with self._cond:
+                self._pending.append(pending)
+                self._cond.notify_all()
+            return pending
+
+    def wait_all(self, timeout=None):
+        """Block until every transaction submitted so far has been confirmed or dropped."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return not self._pending
+
+    def close(self):
+        """Stop confirming receipts and release the gas price feed. Safe to call more than once."""
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cond.notify_all()
+        self._confirm_thread.join()
+        self._confirm_pool.shutdown()
+        self.gas.close()
+
+    def _confirm_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                pending = list(self._pending)
+
+            checked = self._confirm_pool.map(self._check, pending)
+            resolved = [tx for tx, done in zip(pending, checked) if done]
+
+            with self._cond:
+                for tx in resolved:
+                    self._pending.remove(tx)
+                self._cond.notify_all()
+
+            if len(resolved) < len(pending):
+                time.sleep(self.poll_interval)
+
+    def _receipt(self, tx):
+        # Any version of a replaced tx can be the one that gets mined
+        for tx_hash in reversed(tx.tx_hashes):
+            try:
+                return self.web3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+        return None
+
+    def _check(self, tx):
+        try:
+            receipt = self._receipt(tx)
+        except Exception as e:
+            print(f"Failed to fetch receipt for {tx.description} ({tx.tx_hash.hex()}): {e}")
+            return False
+
+        if receipt is not None:
+            return settle(tx, receipt, self.gas)
+        if self._awaiting_receipt(tx):
+            return False
+
+        # No receipt after the timeout: if the node no longer knows the tx it was dropped,
+        # otherwise it is stuck, e.g. underpriced, and is resent with a higher gas price
+        try:
+            self.web3.eth.get_transaction(tx.tx_hash)
+            return self._replace(tx)
+        except TransactionNotFound:
+            with self._send_lock:
+                next_nonce = self.nonces.resync()
+            return drop(tx, next_nonce)
+        except Exception as e:
+            print(f"Failed to look up {tx.description} ({tx.tx_hash.hex()}): {e}")
+            return False
+
+    def _replace(self, tx):
+        """Resend a stuck tx with a higher gas price, or give up on it. Returns True once resolved."""
+        try:
+            txn = self._replacement(tx, self.gas.gas_price())
+            if txn is None:
+                return give_up(tx)
+            signed_txn = self._sign(txn)
+        except Exception as e:
+            print(f"Failed to replace {tx.description} (nonce {tx.nonce}): {e}")
+            return False
+        try:
+            tx_hash = self.web3.eth.send_raw_transaction(signed_txn.rawTransaction)
+        except Exception as e:
+            if not replacement_may_have_landed(tx, e):
+                return False
+            tx_hash = signed_txn.hash  # may have reached the node, so it is watched too
+        return self._replaced(tx, tx_hash, txn)
+
+
+class AsyncNonceManager:
+    """NonceManager for AsyncWeb3 clients."""
+
+    def __init__(self, web3, address):
+        self.web3 = web3
+        self.address = address
+        self._lock = asyncio.Lock()
+        self._next_nonce = None
+
+    async def next_nonce(self):
+        async with self._lock:
+            if self._next_nonce is None:
+                self._next_nonce = await self.web3.eth.get_transaction_count(self.address, 'pending')
+            nonce = self._next_nonce
+            self._next_nonce += 1
+            return nonce
+
+    async def resync(self):
+        async with self._lock:
+            self._next_nonce = await self.web3.eth.get_transaction_count(self.address, 'pending')
+            return self._next_nonce
+
+    async def release(self, nonce):
+        async with self._lock:
+            if self._next_nonce == nonce + 1:
+                self._next_nonce = nonce
+
+
+class AsyncTxSubmitter(BaseTxSubmitter):
+    """
+    TxSubmitter for AsyncWeb3 clients. Receipts are confirmed by a task on the running event
+    loop instead of a thread; call start() from inside the loop and close() on shutdown.
+    """
+
+    def __init__(self, web3, private_key, chain_id=None, receipt_timeout=120, poll_interval=0.5, gas_strategy=None,
+                 max_replacements=2, replacement_bump=1.25):
+        super().__init__(web3, private_key, chain_id, receipt_timeout, poll_interval, max_replacements,
+                         replacement_bump)
+        self.nonces = AsyncNonceManager(web3, self.account.address)
+        self.gas = gas_strategy or AsyncGasStrategy(web3)
+
+        self._send_lock = asyncio.Lock()
+        self._pending = []
+        self._changed = None
+        self._confirm_task = None
+
+    def start(self):
+        self._changed = asyncio.Condition()
+        self._confirm_task = asyncio.create_task(self._confirm_loop())
+        self.gas.start()
+
+    async def submit(self, contract_function, gas=None, description=None, on_receipt=None, on_error=None):
+        method = method_key(contract_function)
+        description = description or method[1]
+        if gas is None:
+            gas = await self.gas.gas_limit(contract_function, self.account.address)
+
+        for attempt in range(2):
+            gas_price = await self.gas.gas_price()
+            async with self._send_lock:
+                nonce = await self.nonces.next_nonce()
+                try:
+                    sign_start = time.perf_counter()
+                    txn = await contract_function.build_transaction(self._tx_params(gas, gas_price, nonce))
+                    signed_txn = self._sign(txn)
+                    tx_sign_seconds.observe(time.perf_counter() - sign_start, method=method[1])
+                except Exception:
+                    await self.nonces.release(nonce)
+                    raise
+
+                try:
+                    tx_hash = await self.web3.eth.send_raw_transaction(signed_txn.rawTransaction)
+                except Exception as e:
+                    action = send_error_action(e, nonce, description)
+                    if action == 'resync':
+                        await self.nonces.resync()
+                        if attempt == 0:
+                            print(f"Nonce {nonce} rejected for {description}, resynced and retrying")
+                            continue
+                        raise
+                    if action == 'release':
+                        await self.nonces.release(nonce)
+                        raise
+                    tx_hash = signed_txn.hash
+
+            pending = self._pending_tx(
+                tx_hash, nonce, description, on_receipt, method, gas, contract_function, txn, on_error,
+            )
+            async with self._changed:
+                self._pending.append(pending)
+                self._changed.notify_all()
+            return pending
+
+    async def wait_all(self, timeout=None):
+        async def drained():
+            async with self._changed:
+                await self._changed.wait_for(lambda: not self._pending)
+
+        try:
+            await asyncio.wait_for(drained(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return not self._pending
+
+    async def close(self):
+        if self._confirm_task is not None:
+            self._confirm_task.cancel()
+            try:
+                await self._confirm_task
+            except asyncio.CancelledError:
+                pass
+        await self.gas.close()
+
+    async def _confirm_loop(self):
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self._pending)
+                pending = list(self._pending)
+
+            resolved = [tx for tx in pending if await self._check(tx)]
+
+            async with self._changed:
+                for tx in resolved:
+                    self._pending.remove(tx)
+                self._changed.notify_all()
+
+            if len(resolved) < len(pending):
+                await asyncio.sleep(self.poll_interval)
+
+    async def _receipt(self, tx):
+        for tx_hash in reversed(tx.tx_hashes):
+            try:
+                return await self.web3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+        return None
+
+    async def _check(self, tx):
+        try:
+            receipt = await self._receipt(tx)
+        except Exception as e:
+            print(f"Failed to fetch receipt for {tx.description} ({tx.tx_hash.hex()}): {e}")
+            return False
+
+        if receipt is not None:
+            return settle(tx, receipt, self.gas)
+        if self._awaiting_receipt(tx):
+            return False
+
+        try:
+            await self.web3.eth.get_transaction(tx.tx_hash)
+            return await self._replace(tx)
+        except TransactionNotFound:
+            async with self._send_lock:
+                next_nonce = await self.nonces.resync()
+            return drop(tx, next_nonce)
+        except Exception as e:
+            print(f"Failed to look up {tx.description} ({tx.tx_hash.hex()}): {e}")
+            return False
+
+    async def _replace(self, tx):
+        try:
+            txn = self._replacement(tx, await self.gas.gas_price())
+            if txn is None:
+                return give_up(tx)
+            signed_txn = self._sign(txn)
+        except Exception as e:
+            print(f"Failed to replace {tx.description} (nonce {tx.nonce}): {e}")
+            return False
+        try:
+            tx_hash = await self.web3.eth.send_raw_transaction(signed_txn.rawTransaction)
+        except Exception as e:
+            if not replacement_may_have_landed(tx, e):
+                return False
+            tx_hash = signed_txn.hash
+        return self._replaced(tx, tx_hash, txn)
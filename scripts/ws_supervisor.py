@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+import websocket
+from metrics import ws_reconnects
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class WebSocketSupervisor:
+    """
+    Keeps one websocket-client connection alive. Dropped connections are reopened after a
+    jittered exponential backoff, so many processes do not reconnect in lockstep after an
+    exchange outage. Pings detect half-open connections, and a connection that delivers no
+    message for idle_timeout seconds is recycled. on_resync runs after every (re)connect, off
+    the socket thread, to fill the gap, e.g. from a REST snapshot.
+    """
+
+    def __init__(self, url, on_message, on_open=None, on_resync=None, source='binance', ping_interval=20,
+                 ping_timeout=10, idle_timeout=60, min_backoff=1.0, max_backoff=60.0, stable_after=60):
+        self.url = url
+        self.on_message = on_message
+        self.on_open = on_open
+        self.on_resync = on_resync
+        self.source = source
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.idle_timeout = idle_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after  # seconds connected before the backoff resets
+        self.connections = 0
+        self.ws = None
+        self._last_message_at = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        if self.idle_timeout:
+            threading.Thread(target=self._watch_idle, daemon=True).start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self.ws is not None:
+            self.ws.close()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        attempt = 0
+        while not self._stop.is_set():
+            self.ws = websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error,
+                on_close=self._on_close,
+            )
+            opened_at = time.time()
+            try:
+                self.ws.run_forever(ping_interval=self.ping_interval, ping_timeout=self.ping_timeout)
+            except Exception as e:
+                print(f"WebSocket for {self.source} failed: {e}")
+            if self._stop.is_set():
+                break
+
+            if time.time() - opened_at > self.stable_after:
+                attempt = 0
+            delay = backoff_delay(attempt, self.min_backoff, self.max_backoff)
+            attempt += 1
+            ws_reconnects.inc(source=self.source)
+            print(f"WebSocket for {self.source} disconnected, reconnecting in {delay:.1f}s")
+            self._stop.wait(delay)
+
+    def _on_open(self, ws):
+        self.connections += 1
+        self._last_message_at = time.monotonic()
+        if self.on_open is not None:
+            self.on_open(ws)
+        # Resync after subscribing, so no tick between the snapshot and the stream is lost
+        if self.on_resync is not None:
+            threading.Thread(target=self._resync, daemon=True).start()
+
+    def _on_message(self, ws, message):
+        self._last_message_at = time.monotonic()
+        self.on_message(ws, message)
+
+    def _watch_idle(self):
+        while not self._stop.wait(self.idle_timeout / 2):
+            ws = self.ws
+            if ws is not None and time.monotonic() - self._last_message_at > self.idle_timeout:
+                print(f"No messages from {self.source} for {self.idle_timeout}s, reconnecting")
+                self._last_message_at = time.monotonic()
+                ws.close()
+
+    def _resync(self):
+        try:
+            self.on_resync()
+        except Exception as e:
+            print(f"Resync for {self.source} failed: {e}")
+
+    def _on_error(self, ws, error):
+        print(f"Error in WebSocket for {self.source}: {error}")
+
+    def _on_close(self, ws, close_status_code, close_msg):
+        print(f"WebSocket for {self.source} closed ({close_status_code}: {close_msg})")